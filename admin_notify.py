@@ -0,0 +1,42 @@
+"""
+Одновременная рассылка администраторам.
+
+Сообщения всем администраторам отправляются параллельно с ограничением
+числа одновременных запросов. Ошибка у одного получателя (например, он
+заблокировал бота) записывается в лог и не мешает доставке остальным.
+"""
+import asyncio
+import logging
+
+from config import ADMINS
+
+logger = logging.getLogger(__name__)
+
+# Сколько запросов к Telegram выполняется одновременно при рассылке администраторам
+ADMIN_FANOUT_CONCURRENCY = 5
+
+
+async def notify_admins(send, admins: list = None, concurrency: int = ADMIN_FANOUT_CONCURRENCY) -> dict:
+    """
+    Вызывает send(admin_id) для каждого администратора параллельно.
+    :param send: Асинхронная функция, принимающая ID администратора
+    :param admins: Получатели (по умолчанию ADMINS)
+    :param concurrency: Максимум одновременных вызовов
+    :return: Словарь {ID администратора: результат send} только для успешных отправок
+    """
+    admins = ADMINS if admins is None else admins
+    slots = asyncio.Semaphore(concurrency)
+
+    async def deliver(admin_id):
+        async with slots:
+            return await send(admin_id)
+
+    results = await asyncio.gather(*(deliver(admin_id) for admin_id in admins), return_exceptions=True)
+
+    delivered = {}
+    for admin_id, result in zip(admins, results):
+        if isinstance(result, BaseException):
+            logger.warning("Не удалось отправить сообщение администратору %s: %s", admin_id, result)
+        else:
+            delivered[admin_id] = result
+    return delivered
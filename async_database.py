@@ -0,0 +1,99 @@
+"""
+Асинхронный доступ к базе данных.
+
+Запросы из database.py выполняются в отдельном пуле потоков, поэтому обращения
+к SQLite не блокируют цикл событий aiogram. Хендлеры импортируют функции
+отсюда и вызывают их через await.
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+import database
+
+# Каждый поток пула держит своё соединение из database.get_connection()
+DB_WORKERS = 4
+
+_executor = ThreadPoolExecutor(max_workers=DB_WORKERS, thread_name_prefix="db")
+
+
+async def run_db(func, *args, **kwargs):
+    """
+    Выполняет синхронную функцию в пуле потоков базы данных.
+    :param func: Функция для выполнения
+    :return: Результат функции
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+
+def _async(func):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run_db(func, *args, **kwargs)
+    return wrapper
+
+
+def _async_insert(func):
+    # Вставка ставится в очередь группового коммита без ожидания в потоке пула,
+    # а результат дожидается уже цикл событий
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        future = await run_db(func, *args, wait=False, **kwargs)
+        return await asyncio.wrap_future(future)
+    return wrapper
+
+
+def shutdown():
+    """
+    Дожидается завершения запросов, записывает очередь и закрывает соединения пула.
+    """
+    _executor.shutdown(wait=True)
+    database.disable_write_queue()
+    database.close_connections()
+
+
+add_user = _async(database.add_user)
+get_user = _async(database.get_user)
+update_user = _async(database.update_user)
+get_events = _async(database.get_events)
+add_event = _async(database.add_event)
+delete_event = _async(database.delete_event)
+purge_event_chunk = _async(database.purge_event_chunk)
+get_orphan_event_ids = _async(database.get_orphan_event_ids)
+get_orphan_summary = _async(database.get_orphan_summary)
+incremental_vacuum = _async(database.incremental_vacuum)
+update_event = _async(database.update_event)
+get_active_events = _async(database.get_active_events)
+get_active_event = _async(database.get_active_event)
+add_feedback = _async_insert(database.add_feedback)
+get_event_by_id = _async(database.get_event_by_id)
+add_admin_notification = _async_insert(database.add_admin_notification)
+add_admin_notifications = _async(database.add_admin_notifications)
+get_admin_notifications = _async(database.get_admin_notifications)
+delete_admin_notifications = _async(database.delete_admin_notifications)
+add_user_event = _async_insert(database.add_user_event)
+get_user_events = _async(database.get_user_events)
+add_ticket = _async_insert(database.add_ticket)
+get_user_tickets = _async(database.get_user_tickets)
+set_ticket_file_id = _async(database.set_ticket_file_id)
+add_payment_link = _async(database.add_payment_link)
+get_payment_link = _async(database.get_payment_link)
+update_payment_link = _async(database.update_payment_link)
+add_used_ticket = _async_insert(database.add_used_ticket)
+check_in_ticket = _async_insert(database.check_in_ticket)
+check_in_tickets = _async(database.check_in_tickets)
+get_event_check_in_data = _async(database.get_event_check_in_data)
+get_all_used_tickets = _async(database.get_all_used_tickets)
+get_ticket = _async(database.get_ticket)
+get_ticket_by_id = _async(database.get_ticket_by_id)
+get_ticket_details = _async(database.get_ticket_details)
+get_cache_stats = _async(database.get_cache_stats)
+get_event_attendees = _async(database.get_event_attendees)
+issue_tickets_bulk = _async(database.issue_tickets_bulk)
+create_broadcast = _async(database.create_broadcast)
+get_broadcast = _async(database.get_broadcast)
+get_running_broadcasts = _async(database.get_running_broadcasts)
+get_broadcast_recipients = _async(database.get_broadcast_recipients)
+save_broadcast_progress = _async(database.save_broadcast_progress)
+finish_broadcast = _async(database.finish_broadcast)
@@ -0,0 +1,207 @@
+"""
+Бенчмарк слоя базы данных на синтетических данных.
+
+Создаёт отдельную базу (по умолчанию 100k пользователей, 200 мероприятий,
+1M билетов и записей о входе), замеряет публичные функции database.py и
+сохраняет p50/p99 и пропускную способность в JSON для сравнения версий.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_database --output bench_db.json
+    python -m benchmarks.bench_database --scale 0.1 --compare bench_db.json
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+
+
+def generate_dataset(path: str, users: int, events: int, tickets: int, used_fraction: float, seed: int):
+    """
+    Заполняет новую базу синтетическими данными.
+    """
+    if os.path.exists(path):
+        os.remove(path)
+    database.set_db_name(path)
+    database.init_db()
+
+    rnd = random.Random(seed)
+    now = datetime.now()
+    conn = database.get_connection()
+    with conn:
+        conn.executemany(
+            "INSERT INTO users (id, full_name, university, phone_number) VALUES (?, ?, ?, ?)",
+            ((user_id, f"Гость {user_id}", "МГУ", f"+7900{user_id:07d}") for user_id in range(1, users + 1))
+        )
+
+        event_rows = []
+        for event_id in range(1, events + 1):
+            # Половина мероприятий в прошлом, половина в будущем
+            date = now + timedelta(days=rnd.randint(-365, 365))
+            date_str = date.strftime(database.EVENT_DATE_FORMAT)
+            event_rows.append((
+                event_id, f"Мероприятие {event_id}", "Описание", None, 1000.0, date_str,
+                rnd.random() < 0.8, "qr_templates/template_3.png", "Нет", database._date_to_timestamp(date_str)
+            ))
+        conn.executemany("""
+            INSERT INTO events (id, name, description, photo, price, date, is_sale_active,
+                                qr_template, photo_album_link, starts_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, event_rows)
+
+        ticket_rows = []
+        for ticket_id in range(1, tickets + 1):
+            user_id = rnd.randint(1, users)
+            event_id = rnd.randint(1, events)
+            ticket_rows.append((ticket_id, user_id, event_id, f"qr_code/ticket_{user_id}_{event_id}.png"))
+        conn.executemany("INSERT INTO tickets (id, user_id, event_id, qr_code) VALUES (?, ?, ?, ?)", ticket_rows)
+        conn.executemany(
+            "INSERT INTO user_events (user_id, event_id) VALUES (?, ?)",
+            ((user_id, event_id) for _, user_id, event_id, _ in ticket_rows)
+        )
+        conn.executemany(
+            "INSERT INTO used_tickets (ticket_id) VALUES (?)",
+            ((ticket_id,) for ticket_id in range(1, tickets + 1) if rnd.random() < used_fraction)
+        )
+        conn.execute("INSERT INTO payment_link (link) VALUES ('https://example.com')")
+    conn.execute("ANALYZE")
+
+
+def measure(func, args_factory, iterations: int, setup=None) -> dict:
+    """
+    Замеряет функцию и возвращает статистику задержек в миллисекундах.
+    """
+    samples = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        args = args_factory()
+        if setup:
+            setup()
+        t0 = time.perf_counter()
+        func(*args)
+        samples.append((time.perf_counter() - t0) * 1000)
+    elapsed = time.perf_counter() - started
+    samples.sort()
+    return {
+        "iterations": iterations,
+        "p50_ms": round(statistics.median(samples), 4),
+        "p99_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.99))], 4),
+        "mean_ms": round(statistics.fmean(samples), 4),
+        "ops_per_sec": round(iterations / elapsed, 1)
+    }
+
+
+def run_benchmarks(users: int, events: int, tickets: int, iterations: int, seed: int) -> dict:
+    rnd = random.Random(seed + 1)
+    user_id = lambda: (rnd.randint(1, users),)
+    event_id = lambda: (rnd.randint(1, events),)
+    ticket_id = lambda: (rnd.randint(1, tickets),)
+    # Полная выгрузка таблиц дорогая, поэтому для неё меньше повторов
+    heavy = max(3, iterations // 100)
+
+    cases = {
+        "get_user": (database.get_user, user_id, iterations, None),
+        "get_user_uncached": (database.get_user, user_id, iterations, database._users_cache.clear),
+        "get_event_by_id": (database.get_event_by_id, event_id, iterations, None),
+        "get_events": (database.get_events, tuple, heavy, None),
+        "get_active_events": (database.get_active_events, tuple, iterations, None),
+        "get_active_events_uncached": (database.get_active_events, tuple, heavy,
+                                       database.invalidate_active_events),
+        "get_user_events": (database.get_user_events, user_id, iterations, None),
+        "get_user_tickets": (database.get_user_tickets, user_id, iterations, None),
+        "get_ticket": (database.get_ticket, lambda: (rnd.randint(1, users), rnd.randint(1, events)), iterations, None),
+        "get_ticket_by_id": (database.get_ticket_by_id, ticket_id, iterations, None),
+        "get_ticket_details": (database.get_ticket_details, ticket_id, iterations, None),
+        "get_all_used_tickets": (database.get_all_used_tickets, tuple, heavy, None),
+        "get_event_attendees": (database.get_event_attendees, event_id, heavy, None),
+        "get_admin_notifications": (database.get_admin_notifications, user_id, iterations, None),
+        "get_payment_link": (database.get_payment_link, tuple, iterations, None),
+        "check_in_ticket": (database.check_in_ticket, ticket_id, iterations, None),
+        "add_feedback": (database.add_feedback, lambda: (rnd.randint(1, users), rnd.randint(1, events), "Отзыв"),
+                         iterations, None),
+    }
+
+    results = {}
+    for name, (func, args_factory, count, setup) in cases.items():
+        results[name] = measure(func, args_factory, count, setup)
+        print(f"{name:28} p50 {results[name]['p50_ms']:9.3f} мс  p99 {results[name]['p99_ms']:9.3f} мс  "
+              f"{results[name]['ops_per_sec']:10.1f} оп/с")
+    return results
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(results: dict, baseline_path: str):
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)["results"]
+    print(f"\nСравнение p50 с {baseline_path}:")
+    for name, stats in results.items():
+        if name in baseline and baseline[name]["p50_ms"]:
+            ratio = stats["p50_ms"] / baseline[name]["p50_ms"]
+            print(f"{name:28} x{ratio:6.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--events", type=int, default=200)
+    parser.add_argument("--tickets", type=int, default=1_000_000)
+    parser.add_argument("--used-fraction", type=float, default=0.5)
+    parser.add_argument("--scale", type=float, default=1.0, help="Множитель размера данных")
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--db", help="Путь к базе (по умолчанию во временном каталоге)")
+    parser.add_argument("--reuse", action="store_true", help="Не пересоздавать существующую базу")
+    parser.add_argument("--output", default="bench_db.json")
+    parser.add_argument("--compare", help="JSON предыдущего запуска для сравнения")
+    args = parser.parse_args()
+
+    users = max(1, int(args.users * args.scale))
+    events = max(1, int(args.events * args.scale)) if args.scale < 1 else args.events
+    tickets = max(1, int(args.tickets * args.scale))
+    path = args.db or os.path.join(tempfile.gettempdir(), f"bench_rout_{users}_{events}_{tickets}.db")
+
+    if args.reuse and os.path.exists(path):
+        database.set_db_name(path)
+        database.init_db()
+    else:
+        t0 = time.perf_counter()
+        generate_dataset(path, users, events, tickets, args.used_fraction, args.seed)
+        print(f"Синтетическая база {path} создана за {time.perf_counter() - t0:.1f} с")
+
+    results = run_benchmarks(users, events, tickets, args.iterations, args.seed)
+    report = {
+        "revision": git_revision(),
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "sqlite_version": sqlite3.sqlite_version,
+        "python_version": sys.version.split()[0],
+        "dataset": {"users": users, "events": events, "tickets": tickets, "used_fraction": args.used_fraction},
+        "cache_stats": database.get_cache_stats(),
+        "results": results
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Результаты сохранены в {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
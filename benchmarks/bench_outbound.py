@@ -0,0 +1,139 @@
+"""
+Проверка очереди исходящих сообщений на поддельной сессии Telegram.
+
+Бот с RateLimitMiddleware отправляет смесь сообщений разных приоритетов
+(билеты, обычные ответы, рассылку) в поддельную сессию без сети. Сессия
+фиксирует фактическую частоту запросов по чатам и может отвечать flood
+control (RetryAfter) на заданные запросы. В конце выводятся нарушения
+лимитов, порядок выдачи по приоритетам и метрики ожидания.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_outbound --messages 300 --chats 50
+    python -m benchmarks.bench_outbound --retry-after-every 100
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from collections import defaultdict
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram import Bot  # noqa: E402
+from aiogram.client.session.base import BaseSession  # noqa: E402
+from aiogram.exceptions import TelegramRetryAfter  # noqa: E402
+
+from rate_limiter import (  # noqa: E402
+    OutboundLimiter, RateLimitMiddleware, send_priority, PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW
+)
+
+
+class FakeSession(BaseSession):
+    """
+    Сессия без сети: запоминает время каждого запроса и отвечает RetryAfter на каждый N-й.
+    """
+
+    def __init__(self, latency: float = 0.005, retry_after_every: int = 0, retry_after: int = 1):
+        super().__init__()
+        self.latency = latency
+        self.retry_after_every = retry_after_every
+        self.retry_after = retry_after
+        self.calls = []
+        self.flood_errors = 0
+
+    async def make_request(self, bot, method, timeout=None):
+        await asyncio.sleep(self.latency)
+        self.calls.append((time.monotonic(), getattr(method, "chat_id", None), getattr(method, "text", "")))
+        if self.retry_after_every and len(self.calls) % self.retry_after_every == 0:
+            self.flood_errors += 1
+            raise TelegramRetryAfter(method=method, message="Too Many Requests", retry_after=self.retry_after)
+        return SimpleNamespace(message_id=len(self.calls))
+
+    async def stream_content(self, url, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b""
+
+    async def close(self):
+        pass
+
+
+def max_rate(timestamps: list, window: float) -> int:
+    # Наибольшее число запросов в любом окне длиной window секунд
+    best = 0
+    start = 0
+    for end, ts in enumerate(timestamps):
+        while ts - timestamps[start] > window:
+            start += 1
+        best = max(best, end - start + 1)
+    return best
+
+
+async def run(args) -> dict:
+    session = FakeSession(args.latency, args.retry_after_every, args.retry_after)
+    limiter = OutboundLimiter(global_rate=args.global_rate, chat_rate=args.chat_rate)
+    session.middleware(RateLimitMiddleware(limiter))
+    bot = Bot(token="42:TEST", session=session)
+
+    async def send(index, chat_id, priority):
+        with send_priority(priority):
+            await bot.send_message(chat_id, f"{priority}:{index}")
+
+    # Рассылка ставится в очередь первой, билеты и ответы — сразу за ней
+    tasks = []
+    for index in range(args.messages):
+        tasks.append(send(index, 1000 + index % args.chats, PRIORITY_LOW))
+    for index in range(args.messages // 10):
+        tasks.append(send(index, 5000 + index, PRIORITY_HIGH))
+        tasks.append(send(index, 6000 + index, PRIORITY_NORMAL))
+
+    started = time.monotonic()
+    await asyncio.gather(*tasks)
+    elapsed = time.monotonic() - started
+    await limiter.close()
+
+    per_chat = defaultdict(list)
+    for ts, chat_id, _ in session.calls:
+        per_chat[chat_id].append(ts)
+    all_ts = [ts for ts, _, _ in session.calls]
+
+    # Средняя позиция запросов каждого приоритета в фактическом порядке отправки
+    positions = defaultdict(list)
+    for position, (_, _, text) in enumerate(session.calls):
+        positions[int(text.split(":")[0])].append(position)
+
+    return {
+        "elapsed_s": round(elapsed, 2),
+        "requests": len(session.calls),
+        "flood_errors": session.flood_errors,
+        "max_global_per_sec": max_rate(all_ts, 1.0),
+        "max_chat_per_sec": max(max_rate(ts, 1.0) for ts in per_chat.values()),
+        "avg_position": {priority: round(sum(p) / len(p)) for priority, p in sorted(positions.items())},
+        "limiter": limiter.stats()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=300, help="Сообщений рассылки")
+    parser.add_argument("--chats", type=int, default=50, help="Разных чатов в рассылке")
+    parser.add_argument("--global-rate", type=float, default=25)
+    parser.add_argument("--chat-rate", type=float, default=1)
+    parser.add_argument("--latency", type=float, default=0.005, help="Задержка поддельной сессии, с")
+    parser.add_argument("--retry-after-every", type=int, default=0, help="RetryAfter на каждый N-й запрос")
+    parser.add_argument("--retry-after", type=int, default=1)
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    limiter = result.pop("limiter")
+    for key, value in result.items():
+        print(f"{key:20} {value}")
+    print(f"{'retries':20} {limiter['retries']}")
+    for name in limiter["granted"]:
+        print(f"  {name:8} отправлено {limiter['granted'][name]:5}  "
+              f"ожидание в среднем {limiter['avg_wait_ms'][name]:8.1f} мс, "
+              f"максимум {limiter['max_wait_ms'][name]:8.1f} мс")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+"""
+Бенчмарк отрисовки билетов.
+
+Рисует N билетов по шаблону qr_templates/template_3.png без обращения к сети
+и замеряет:
+  * время этапов отрисовки (шаблон, кодирование QR, растр QR, вставка, PNG);
+  * билеты в секунду и пиковую память при отрисовке в основном процессе
+    (serial) и в пуле процессов (pooled). tracemalloc видит только память
+    Python, буферы изображений PIL учитываются в максимальном RSS процессов;
+  * полный путь generate_and_send_ticket с заглушкой вместо бота;
+  * время кодирования и размер PNG для разных уровней сжатия.
+
+Результаты сохраняются в JSON для сравнения версий.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_render --tickets 200 --output bench_render.json
+    python -m benchmarks.bench_render --workers 2 --compare bench_render.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Хендлеры читают настройки при импорте: бенчмарку не нужны токен и администраторы,
+# а копии билетов на диске по умолчанию не сохраняются
+os.environ.setdefault("ADMIN_ID", "0")
+os.environ.setdefault("TICKET_PERSIST_TO_DISK", "0")
+os.environ.setdefault("TICKET_SECRET", "bench")
+
+import database  # noqa: E402
+import ticket_renderer  # noqa: E402
+from benchmarks.bench_database import git_revision  # noqa: E402
+from ticket_delivery import get_ticket_link  # noqa: E402
+
+TEMPLATE = "qr_templates/template_3.png"
+
+
+def ticket_data(ticket_id: int) -> str:
+    # Та же ссылка с подписанным токеном, что и у настоящих билетов
+    return get_ticket_link(ticket_id, 1)
+
+
+def summarize(samples: list) -> dict:
+    """
+    Статистика задержек в миллисекундах.
+    """
+    samples = sorted(sample * 1000 for sample in samples)
+    return {
+        "iterations": len(samples),
+        "p50_ms": round(statistics.median(samples), 3),
+        "p99_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.99))], 3),
+        "mean_ms": round(statistics.fmean(samples), 3)
+    }
+
+
+def bench_stages(tickets: int, template: str) -> dict:
+    """
+    Замеряет каждый этап отрисовки по отдельности в основном процессе.
+    """
+    samples = {"template_load": [], "qr_encode": [], "qr_rasterize": [], "compose": [], "png_encode": []}
+
+    # Холодная загрузка шаблона: декодирование PNG и чтение метаданных
+    for version in range(min(tickets, 20)):
+        t0 = time.perf_counter()
+        ticket_renderer._get_template(template, -1 - version)
+        samples["template_load"].append(time.perf_counter() - t0)
+
+    base, cutout_box = ticket_renderer._get_template(template, 0)
+    for ticket_id in range(1, tickets + 1):
+        t0 = time.perf_counter()
+        qrcode = ticket_renderer.encode_qr(ticket_data(ticket_id))
+        t1 = time.perf_counter()
+        qr_image = ticket_renderer.rasterize_qr(qrcode)
+        t2 = time.perf_counter()
+        ticket = ticket_renderer.compose_ticket(base, cutout_box, qr_image)
+        t3 = time.perf_counter()
+        ticket_renderer.encode_png(ticket)
+        t4 = time.perf_counter()
+        samples["qr_encode"].append(t1 - t0)
+        samples["qr_rasterize"].append(t2 - t1)
+        samples["compose"].append(t3 - t2)
+        samples["png_encode"].append(t4 - t3)
+
+    results = {stage: summarize(values) for stage, values in samples.items()}
+    total = sum(stats["mean_ms"] for stage, stats in results.items() if stage != "template_load")
+    for stage, stats in results.items():
+        share = f"{stats['mean_ms'] / total * 100:5.1f}%" if stage != "template_load" else "  хол."
+        print(f"  {stage:14} p50 {stats['p50_ms']:8.2f} мс  p99 {stats['p99_ms']:8.2f} мс  {share}")
+    return results
+
+
+def bench_serial(tickets: int, template: str) -> dict:
+    """
+    Отрисовка в основном процессе по одному билету, как до появления пула.
+    """
+    ticket_renderer._templates.clear()
+    samples = []
+    sizes = []
+    tracemalloc.start()
+    started = time.perf_counter()
+    for ticket_id in range(1, tickets + 1):
+        t0 = time.perf_counter()
+        image, _ = ticket_renderer.render_ticket(ticket_data(ticket_id), template)
+        samples.append(time.perf_counter() - t0)
+        sizes.append(len(image))
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        **summarize(samples),
+        "tickets_per_sec": round(tickets / elapsed, 1),
+        "peak_memory_mb": round(peak / 2 ** 20, 1),
+        "process_max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "avg_png_kb": round(statistics.fmean(sizes) / 1024, 1)
+    }
+
+
+async def _render_concurrently(tickets: int, template: str) -> list:
+    async def render(ticket_id):
+        t0 = time.perf_counter()
+        await ticket_renderer.render_ticket_image(ticket_data(ticket_id), template)
+        return time.perf_counter() - t0
+
+    return await asyncio.gather(*(render(ticket_id) for ticket_id in range(1, tickets + 1)))
+
+
+def bench_pooled(tickets: int, template: str, workers: int, max_queue: int) -> dict:
+    """
+    Одновременная отрисовка всех билетов в пуле процессов. Задержка включает ожидание очереди.
+    """
+    pool = ticket_renderer.start_render_pool(workers, max_queue)
+    pool.warm_up()
+    # Первый проход прогревает кэш шаблонов в процессах пула
+    asyncio.run(_render_concurrently(pool.workers, template))
+    pool.rendered = 0
+    pool.total_render_time = pool.total_wait_time = 0.0
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    samples = asyncio.run(_render_concurrently(tickets, template))
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    stats = pool.stats()
+    ticket_renderer.shutdown_render_pool()
+    # Пиковая память процессов пула известна только после их завершения
+    children_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+
+    return {
+        **summarize(samples),
+        "workers": stats["workers"],
+        "tickets_per_sec": round(tickets / elapsed, 1),
+        "avg_render_ms": round(stats["avg_render_ms"], 3),
+        "avg_wait_ms": round(stats["avg_wait_ms"], 3),
+        "peak_memory_mb": round(peak / 2 ** 20, 1),
+        "worker_max_rss_mb": round(children_rss / 1024, 1)
+    }
+
+
+class StubBot:
+    """
+    Заглушка бота: принимает фото и возвращает сообщение с file_id, не обращаясь к сети.
+    """
+
+    def __init__(self):
+        self.sent = 0
+        self.bytes_sent = 0
+
+    async def send_photo(self, chat_id, photo, caption=None, **kwargs):
+        self.sent += 1
+        self.bytes_sent += len(getattr(photo, "data", b""))
+        return SimpleNamespace(photo=[SimpleNamespace(file_id=f"stub_{self.sent}")])
+
+
+def bench_end_to_end(tickets: int, template: str, workers: int, max_queue: int, concurrent: bool) -> dict:
+    """
+    Полный путь generate_and_send_ticket: запись билета в базу, отрисовка в пуле,
+    отправка заглушке бота и сохранение file_id.
+    """
+    from handlers.buy_ticket import generate_and_send_ticket
+
+    path = os.path.join(tempfile.gettempdir(), "bench_render_rout.db")
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    database.set_db_name(path)
+    database.init_db()
+    # Дата в формате администраторов, чтобы у мероприятия был starts_at и оно попало в активный каталог
+    date = datetime(2099, 1, 1, 19).strftime(database.EVENT_DATE_FORMAT)
+    event_id = database.add_event("Бенчмарк", "Описание", None, 1000.0, date, True, template)
+    assert database.get_active_event(event_id) is not None
+
+    bot = StubBot()
+    errors = []
+
+    async def answer(text, **kwargs):
+        errors.append(text)
+
+    callback = SimpleNamespace(bot=bot, message=SimpleNamespace(answer=answer))
+
+    async def issue(user_id):
+        t0 = time.perf_counter()
+        await generate_and_send_ticket(user_id, event_id, callback)
+        return time.perf_counter() - t0
+
+    async def run():
+        if concurrent:
+            return await asyncio.gather(*(issue(user_id) for user_id in range(1, tickets + 1)))
+        return [await issue(user_id) for user_id in range(1, tickets + 1)]
+
+    ticket_renderer.start_render_pool(workers, max_queue).warm_up()
+    started = time.perf_counter()
+    samples = asyncio.run(run())
+    elapsed = time.perf_counter() - started
+    ticket_renderer.shutdown_render_pool()
+    database.close_connections()
+
+    if errors:
+        print(f"  Ошибки при выдаче билетов: {errors[:3]}")
+    return {
+        **summarize(samples),
+        "tickets_per_sec": round(tickets / elapsed, 1),
+        "sent": bot.sent,
+        "errors": len(errors),
+        "avg_upload_kb": round(bot.bytes_sent / max(1, bot.sent) / 1024, 1)
+    }
+
+
+def bench_compression(levels: list, iterations: int, template: str) -> dict:
+    """
+    Время кодирования и размер PNG одного и того же билета при разных уровнях сжатия.
+    """
+    base, cutout_box = ticket_renderer._get_template(template, 0)
+    ticket = ticket_renderer.compose_ticket(
+        base, cutout_box, ticket_renderer.rasterize_qr(ticket_renderer.encode_qr(ticket_data(1)))
+    )
+
+    results = {}
+    for level in levels:
+        samples = []
+        for _ in range(iterations):
+            t0 = time.perf_counter()
+            image = ticket_renderer.encode_png(ticket, level)
+            samples.append(time.perf_counter() - t0)
+        results[str(level)] = {**summarize(samples), "size_kb": round(len(image) / 1024, 1)}
+        print(f"  уровень {level}: p50 {results[str(level)]['p50_ms']:8.2f} мс  "
+              f"{results[str(level)]['size_kb']:8.1f} КБ")
+    return results
+
+
+def compare(report: dict, baseline_path: str):
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)["results"]
+    print(f"\nСравнение билетов в секунду с {baseline_path}:")
+    for mode in ("serial", "pooled", "end_to_end_serial", "end_to_end_concurrent"):
+        if mode in report and baseline.get(mode, {}).get("tickets_per_sec"):
+            ratio = report[mode]["tickets_per_sec"] / baseline[mode]["tickets_per_sec"]
+            print(f"{mode:24} x{ratio:6.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tickets", type=int, default=200, help="Сколько билетов рисовать в каждом режиме")
+    parser.add_argument("--workers", type=int, default=None, help="Процессов в пуле (по умолчанию — число ядер)")
+    parser.add_argument("--queue", type=int, default=32, help="Длина очереди пула")
+    parser.add_argument("--template", default=TEMPLATE)
+    parser.add_argument("--levels", default="0,1,3,6,9", help="Уровни сжатия PNG через запятую")
+    parser.add_argument("--skip-end-to-end", action="store_true", help="Не замерять generate_and_send_ticket")
+    parser.add_argument("--output", default="bench_render.json")
+    parser.add_argument("--compare", help="JSON предыдущего запуска для сравнения")
+    args = parser.parse_args()
+
+    results = {}
+    print(f"Этапы отрисовки ({args.tickets} билетов):")
+    results["stages"] = bench_stages(args.tickets, args.template)
+
+    results["serial"] = bench_serial(args.tickets, args.template)
+    print(f"В основном процессе: {results['serial']['tickets_per_sec']} билетов/с, "
+          f"пик памяти {results['serial']['peak_memory_mb']} МБ "
+          f"(процесс до {results['serial']['process_max_rss_mb']} МБ RSS)")
+
+    results["pooled"] = bench_pooled(args.tickets, args.template, args.workers, args.queue)
+    print(f"В пуле из {results['pooled']['workers']} процессов: {results['pooled']['tickets_per_sec']} билетов/с, "
+          f"пик памяти {results['pooled']['peak_memory_mb']} МБ "
+          f"(процесс пула до {results['pooled']['worker_max_rss_mb']} МБ RSS)")
+
+    if not args.skip_end_to_end:
+        for mode, concurrent in (("end_to_end_serial", False), ("end_to_end_concurrent", True)):
+            results[mode] = bench_end_to_end(args.tickets, args.template, args.workers, args.queue, concurrent)
+            print(f"generate_and_send_ticket ({'одновременно' if concurrent else 'по одному'}): "
+                  f"{results[mode]['tickets_per_sec']} билетов/с, p50 {results[mode]['p50_ms']} мс")
+
+    print("Сжатие PNG:")
+    levels = [int(level) for level in args.levels.split(",")]
+    results["png_compression"] = bench_compression(levels, max(3, args.tickets // 10), args.template)
+
+    report = {
+        "revision": git_revision(),
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "python_version": sys.version.split()[0],
+        "cpu_count": os.cpu_count(),
+        "template": args.template,
+        "results": results
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Результаты сохранены в {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
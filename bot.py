@@ -1,20 +1,101 @@
+import time
+
+# Отсчёт времени запуска ведётся с самого начала импорта модулей
+_started_at = time.perf_counter()
+
 from aiogram import Bot, Dispatcher
 from aiogram.enums import ParseMode
 from aiogram.fsm.storage.memory import MemoryStorage
 import logging
-from config import TOKEN
+import database
+import async_database
+import broadcast
+import check_in
+import event_cleanup
+from admin_notify import notify_admins
+import scanner_api
+from rate_limiter import OutboundLimiter, RateLimitMiddleware
+import ticket_renderer
+from config import (
+    TOKEN, DB_WRITE_BATCHING, DB_WRITE_SYNCHRONOUS, TICKET_RENDER_WORKERS, TICKET_RENDER_QUEUE, SCANNER_API_ENABLED,
+    OUTBOUND_GLOBAL_RATE, OUTBOUND_CHAT_RATE, OUTBOUND_MAX_RETRIES, EVENT_ORPHAN_SWEEP
+)
 from handlers import router  # Импортируем роутеры
 
+_imported_at = time.perf_counter()
+# Обновляется при подготовке базы в __main__; при другом способе запуска этап считается нулевым
+_db_ready_at = _imported_at
+
 logging.basicConfig(level=logging.INFO)
 
 # Инициализация бота и диспетчера
 bot = Bot(token=TOKEN, parse_mode=ParseMode.HTML)
+
+# Все сообщения в чаты проходят через общую очередь с лимитами Telegram и повтором после flood control
+outbound_limiter = OutboundLimiter(global_rate=OUTBOUND_GLOBAL_RATE, chat_rate=OUTBOUND_CHAT_RATE)
+bot.session.middleware(RateLimitMiddleware(outbound_limiter, max_retries=OUTBOUND_MAX_RETRIES))
 storage = MemoryStorage()
 dp = Dispatcher(storage=storage)
 
 # Подключаем роутеры
 dp.include_router(router)
 
+
+async def on_startup():
+    # Отчёт о времени запуска: импорт модулей, подготовка базы и общее время до начала опроса
+    now = time.perf_counter()
+    logging.info(
+        "Запуск бота: импорт %.0f мс, пул отрисовки и база данных %.0f мс, всего %.0f мс",
+        (_imported_at - _started_at) * 1000,
+        (_db_ready_at - _imported_at) * 1000,
+        (now - _started_at) * 1000
+    )
+
+    # Данные мероприятий, удалённых до появления фоновой очистки или во время прошлой остановки,
+    # удаляются только с подтверждения администратора, если очистка при запуске не включена явно
+    if EVENT_ORPHAN_SWEEP:
+        event_cleanup.schedule_orphan_sweep()
+    else:
+        orphans = await event_cleanup.report_orphans()
+        if orphans:
+            report = event_cleanup.format_orphan_report(orphans)
+            await notify_admins(lambda admin_id: bot.send_message(
+                admin_id, report, reply_markup=event_cleanup.get_orphan_sweep_keyboard()
+            ))
+
+    # Рассылки, прерванные прошлой остановкой, продолжаются с сохранённого курсора
+    await broadcast.resume_broadcasts(bot)
+
+    # HTTP-сервис для сканеров на входе работает в том же цикле событий, что и опрос
+    if SCANNER_API_ENABLED:
+        await scanner_api.start()
+
+
+async def on_shutdown():
+    # Прерываем рассылки и очистку, останавливаем сервис сканеров, сбрасываем отметки режима входа,
+    # дописываем очередь записи, закрываем соединения с базой и останавливаем пул отрисовки
+    await broadcast.cancel_all()
+    await event_cleanup.cancel_all()
+    await scanner_api.stop()
+    await check_in.close_all()
+    async_database.shutdown()
+    ticket_renderer.shutdown_render_pool()
+    logging.info("Очередь исходящих сообщений: %s", outbound_limiter.stats())
+    await outbound_limiter.close()
+
+dp.startup.register(on_startup)
+dp.shutdown.register(on_shutdown)
+
 if __name__ == "__main__":
     import asyncio
-    asyncio.run(dp.start_polling(bot))
\ No newline at end of file
+
+    # Процессы отрисовки билетов запускаются первыми, пока в основном процессе нет других потоков
+    ticket_renderer.start_render_pool(TICKET_RENDER_WORKERS, TICKET_RENDER_QUEUE).warm_up()
+
+    # Схема базы создаётся и обновляется явно при запуске, а не при импорте database
+    database.init_db()
+    if DB_WRITE_BATCHING:
+        database.enable_write_queue(synchronous=DB_WRITE_SYNCHRONOUS)
+    _db_ready_at = time.perf_counter()
+
+    asyncio.run(dp.start_polling(bot))
@@ -0,0 +1,253 @@
+"""
+Рассылка анонсов мероприятий всем пользователям.
+
+Получатели читаются из users порциями по первичному ключу (keyset-пагинация),
+сообщения уходят с низким приоритетом через общую очередь исходящих запросов,
+поэтому рассылка идёт с максимальной безопасной скоростью и не задерживает
+билеты и ответы пользователям. После каждой порции курсор и счётчики
+сохраняются в таблице broadcasts: после перезапуска бота рассылка продолжается
+с места остановки. В конце администратор получает отчёт: доставлено,
+заблокировали бота, ошибки.
+"""
+import asyncio
+import logging
+import time
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramForbiddenError
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+
+from async_database import (
+    create_broadcast, get_running_broadcasts, get_broadcast_recipients, save_broadcast_progress,
+    finish_broadcast, get_event_by_id
+)
+from database import BROADCAST_DONE, BROADCAST_CANCELLED
+from event_cards import get_event_card
+from rate_limiter import send_priority, PRIORITY_LOW, PRIORITY_NORMAL
+
+logger = logging.getLogger(__name__)
+
+# Получателей в одной порции: курсор сохраняется после каждой порции
+CHUNK_SIZE = 200
+# Одновременных отправок; фактическую скорость задаёт очередь исходящих запросов
+SEND_CONCURRENCY = 30
+# Как часто обновлять сообщение о прогрессе, с
+PROGRESS_INTERVAL = 10
+
+DELIVERED = "delivered"
+BLOCKED = "blocked"
+FAILED = "failed"
+
+# Запущенные рассылки: {ID рассылки: задача}
+_tasks = {}
+
+
+def get_announcement(event) -> tuple:
+    """
+    Текст и клавиатура анонса мероприятия: та же карточка, что и в каталоге.
+    :return: (текст, клавиатура)
+    """
+    builder = InlineKeyboardBuilder()
+    builder.button(text="Купить", callback_data=f"order_{event['id']}")
+    return get_event_card(event).caption, builder.as_markup()
+
+
+def get_stop_keyboard(broadcast_id: int):
+    builder = InlineKeyboardBuilder()
+    builder.button(text="⏹ Остановить рассылку", callback_data=f"broadcast_stop_{broadcast_id}")
+    return builder.as_markup()
+
+
+async def _send_announcement(bot: Bot, user_id: int, event, text: str, markup) -> str:
+    # Ошибка одного получателя не прерывает рассылку
+    try:
+        if event["photo"]:
+            await bot.send_photo(user_id, photo=event["photo"], caption=text, reply_markup=markup)
+        else:
+            await bot.send_message(user_id, text, reply_markup=markup)
+        return DELIVERED
+    except TelegramForbiddenError:
+        # Пользователь заблокировал бота или удалил аккаунт
+        return BLOCKED
+    except Exception as e:
+        logger.warning("Анонс не доставлен пользователю %s: %s", user_id, e)
+        return FAILED
+
+
+async def _save_progress(broadcast_id: int, last_user_id: int, results: list, sent_ahead: list = None):
+    await save_broadcast_progress(
+        broadcast_id, last_user_id, results.count(DELIVERED), results.count(BLOCKED), results.count(FAILED),
+        sent_ahead
+    )
+
+
+def format_report(broadcast, event_name: str) -> str:
+    return (
+        f"Рассылка анонса «{event_name}»\n"
+        f"Доставлено: {broadcast.delivered}\n"
+        f"Заблокировали бота: {broadcast.blocked}\n"
+        f"Ошибки: {broadcast.failed}\n"
+        f"Всего получателей: {broadcast.total}"
+    )
+
+
+async def _update_progress(progress, broadcast_id: int, event_name: str, sent: int, total: int, rate: float):
+    remaining = max(total - sent, 0)
+    text = f"📣 Рассылка анонса «{event_name}»: отправлено {sent} из {total}"
+    if rate > 0 and remaining:
+        text += f", осталось около {remaining / rate / 60:.0f} мин"
+    try:
+        with send_priority(PRIORITY_NORMAL):
+            await progress.edit_text(text, reply_markup=get_stop_keyboard(broadcast_id))
+    except Exception as e:
+        logger.warning("Не удалось обновить прогресс рассылки %s: %s", broadcast_id, e)
+
+
+async def run_broadcast(bot: Bot, broadcast, progress=None):
+    """
+    Отправляет анонс всем пользователям, начиная с сохранённого курсора.
+    :param bot: Бот
+    :param broadcast: Рассылка из базы
+    :param progress: Сообщение администратору, в котором показывается прогресс
+    """
+    event = await get_event_by_id(broadcast.event_id)
+    if event is None:
+        # Мероприятие удалили, пока рассылка ждала продолжения
+        await finish_broadcast(broadcast.id, BROADCAST_CANCELLED)
+        logger.info("Рассылка %s отменена: мероприятие %s удалено", broadcast.id, broadcast.event_id)
+        return
+
+    text, markup = get_announcement(event)
+    cursor = broadcast.last_user_id
+    # Получатели за курсором, которым анонс ушёл до прерывания; они уже учтены в счётчиках
+    sent_ahead = {int(user_id) for user_id in (broadcast.sent_ahead or "").split()}
+    sent = broadcast.delivered + broadcast.blocked + broadcast.failed
+    started, sent_at_start = time.monotonic(), sent
+    last_update = started
+    slots = asyncio.Semaphore(SEND_CONCURRENCY)
+
+    async def deliver(user_id):
+        async with slots:
+            done[user_id] = await _send_announcement(bot, user_id, event, text, markup)
+
+    with send_priority(PRIORITY_LOW):
+        while True:
+            user_ids = await get_broadcast_recipients(cursor, CHUNK_SIZE)
+            if not user_ids:
+                break
+
+            done = {}
+            pending = [user_id for user_id in user_ids if user_id not in sent_ahead]
+            try:
+                await asyncio.gather(*(deliver(user_id) for user_id in pending))
+            except asyncio.CancelledError:
+                # Курсор сдвигается до первого неотправленного получателя, а отправленные
+                # после него запоминаются отдельно: после перезапуска никто не получит анонс дважды
+                if done:
+                    unsent = [user_id for user_id in pending if user_id not in done]
+                    last = cursor
+                    for user_id in user_ids:
+                        if unsent and user_id >= unsent[0]:
+                            break
+                        last = user_id
+                    ahead = sorted(user_id for user_id in set(done) | sent_ahead if user_id > last)
+                    await _save_progress(broadcast.id, last, list(done.values()), ahead)
+                raise
+
+            cursor = user_ids[-1]
+            # Отправленные до прерывания могут оказаться и за этой порцией (например, если
+            # с тех пор появились новые пользователи): они остаются в списке до своей порции
+            sent_ahead = {user_id for user_id in sent_ahead if user_id > cursor}
+            await _save_progress(broadcast.id, cursor, list(done.values()), sorted(sent_ahead))
+            sent += len(pending)
+
+            now = time.monotonic()
+            if progress is not None and now - last_update >= PROGRESS_INTERVAL:
+                last_update = now
+                rate = (sent - sent_at_start) / (now - started)
+                await _update_progress(progress, broadcast.id, event["name"], sent, broadcast.total, rate)
+
+    result = await finish_broadcast(broadcast.id, BROADCAST_DONE)
+    logger.info("Рассылка %s завершена за %.0f с: %s", broadcast.id, time.monotonic() - started, result)
+    with send_priority(PRIORITY_NORMAL):
+        if progress is not None:
+            try:
+                await progress.edit_text(f"📣 Рассылка анонса «{event['name']}» завершена.")
+            except Exception as e:
+                logger.warning("Не удалось обновить прогресс рассылки %s: %s", broadcast.id, e)
+        try:
+            await bot.send_message(broadcast.created_by, format_report(result, event["name"]))
+        except Exception as e:
+            logger.warning("Не удалось отправить отчёт о рассылке %s: %s", broadcast.id, e)
+
+
+def _on_done(task: asyncio.Task):
+    for broadcast_id, running in list(_tasks.items()):
+        if running is task:
+            del _tasks[broadcast_id]
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Ошибка рассылки: %s", task.exception())
+
+
+def _schedule(bot: Bot, broadcast, progress=None) -> asyncio.Task:
+    task = asyncio.create_task(run_broadcast(bot, broadcast, progress))
+    _tasks[broadcast.id] = task
+    task.add_done_callback(_on_done)
+    return task
+
+
+async def start_broadcast(bot: Bot, event_id: int, admin_id: int, progress=None):
+    """
+    Создаёт рассылку анонса мероприятия и запускает её в фоне.
+    :param progress: Сообщение администратору для показа прогресса
+    :return: Созданная рассылка или None, если рассылка этого мероприятия уже идёт
+    """
+    broadcast = await create_broadcast(event_id, admin_id)
+    if broadcast is None:
+        return None
+    _schedule(bot, broadcast, progress)
+    logger.info("Запущена рассылка %s анонса мероприятия %s на %s получателей",
+                broadcast.id, event_id, broadcast.total)
+    return broadcast
+
+
+async def resume_broadcasts(bot: Bot):
+    """
+    Продолжает рассылки, прерванные остановкой бота, с сохранённого курсора.
+    """
+    for broadcast in await get_running_broadcasts():
+        if broadcast.id in _tasks:
+            continue
+        progress = None
+        try:
+            with send_priority(PRIORITY_NORMAL):
+                progress = await bot.send_message(
+                    broadcast.created_by, "📣 Рассылка анонса продолжена после перезапуска бота.",
+                    reply_markup=get_stop_keyboard(broadcast.id)
+                )
+        except Exception as e:
+            logger.warning("Не удалось сообщить о продолжении рассылки %s: %s", broadcast.id, e)
+        _schedule(bot, broadcast, progress)
+        logger.info("Продолжена рассылка %s с пользователя %s", broadcast.id, broadcast.last_user_id)
+
+
+async def stop_broadcast(broadcast_id: int):
+    """
+    Останавливает рассылку по просьбе администратора; она не будет продолжена после перезапуска.
+    :return: Рассылка с итоговыми счётчиками
+    """
+    task = _tasks.get(broadcast_id)
+    if task is not None:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+    return await finish_broadcast(broadcast_id, BROADCAST_CANCELLED)
+
+
+async def cancel_all():
+    """
+    Прерывает рассылки при завершении бота; они остаются незавершёнными и продолжатся при запуске.
+    """
+    tasks = list(_tasks.values())
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
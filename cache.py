@@ -0,0 +1,66 @@
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Ограниченный кэш со сквозным чтением: при промахе значение загружается функцией
+    и сохраняется, при переполнении вытесняется давно не использованная запись.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        # Увеличивается при каждой инвалидации, чтобы не сохранить значение,
+        # загруженное до изменения данных
+        self._version = 0
+
+    def get_or_load(self, key, loader):
+        """
+        Возвращает значение из кэша или загружает его.
+        :param key: Ключ записи
+        :param loader: Функция, получающая значение по ключу при промахе
+        :return: Значение (None тоже кэшируется)
+        """
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            version = self._version
+
+        value = loader(key)
+
+        with self._lock:
+            if version != self._version:
+                return value
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return value
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+            self._version += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._version += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0
+            }
@@ -0,0 +1,312 @@
+"""
+Режим входа: проверка билетов на входе без лишних обращений к базе.
+
+При открытии сессии для мероприятия его билеты, имена владельцев и отметки
+об использовании загружаются в память одним запросом. Скан проверяется по
+памяти и сразу отмечает билет, а записи в used_tickets сбрасываются в базу
+пачками в фоне. Одна сессия мероприятия общая для всех администраторов на входе.
+Пока сессия открыта, кнопка «Использован» и карточка билета в /start тоже
+проверяют билет по ней: отметки, ещё не записанные в базу, видны везде.
+"""
+import asyncio
+import logging
+import time
+
+from async_database import (
+    get_event_by_id, get_event_check_in_data, get_ticket_details, check_in_ticket, check_in_tickets
+)
+
+logger = logging.getLogger(__name__)
+
+# Как часто и при каком размере пачки отметки о входе записываются в базу
+FLUSH_INTERVAL = 1.0
+FLUSH_BATCH = 50
+# Сколько раз при остановке бота повторяется запись отметок, которые не удалось записать
+CLOSE_ATTEMPTS = 3
+
+# Результаты проверки билета
+VALID = "valid"
+CHECKED_IN = "checked_in"
+ALREADY_USED = "already_used"
+WRONG_EVENT = "wrong_event"
+NOT_FOUND = "not_found"
+
+
+class CheckInSession:
+    """
+    Билеты одного мероприятия в памяти и очередь отметок о входе.
+    """
+
+    def __init__(self, event_id: int, event_name: str, tickets: list):
+        """
+        :param tickets: Список кортежей (ID билета, ФИО владельца, использован ли билет)
+        """
+        self.event_id = event_id
+        self.event_name = event_name
+        self.holders = {ticket_id: full_name for ticket_id, full_name, _ in tickets}
+        self.used = {ticket_id for ticket_id, _, is_used in tickets if is_used}
+        # Время входа по билетам, отмеченным в этой сессии
+        self.checked_in_at = {}
+        # Билеты других мероприятий, уже проверенные по базе
+        self._foreign = set()
+        self._pending = []
+        self._batch_ready = asyncio.Event()
+        self._flusher = None
+
+    @property
+    def sold(self) -> int:
+        return len(self.holders)
+
+    @property
+    def checked_in(self) -> int:
+        return len(self.used)
+
+    def start(self):
+        self._flusher = asyncio.create_task(self._run_flusher())
+
+    async def stop(self):
+        """
+        Останавливает фоновую запись, не сбрасывая отметки.
+        """
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+
+    async def close(self):
+        """
+        Останавливает фоновую запись и сбрасывает оставшиеся отметки в базу.
+        """
+        await self.stop()
+        await self.flush()
+
+    async def verify(self, ticket_id: int) -> tuple:
+        """
+        Проверяет билет, не отмечая вход.
+        :return: (результат проверки, ФИО владельца или None)
+        """
+        if ticket_id not in self.holders:
+            status = await self._load_ticket(ticket_id)
+            if status is not None:
+                return status, None
+        return (ALREADY_USED if ticket_id in self.used else VALID), self.holders[ticket_id]
+
+    async def check_in(self, ticket_id: int) -> tuple:
+        """
+        Проверяет билет и отмечает вход при первом скане.
+        :param ticket_id: ID билета
+        :return: (результат проверки, ФИО владельца или None)
+        """
+        if ticket_id not in self.holders:
+            status = await self._load_ticket(ticket_id)
+            if status is not None:
+                return status, None
+
+        holder = self.holders[ticket_id]
+        if ticket_id in self.used:
+            return ALREADY_USED, holder
+
+        self.used.add(ticket_id)
+        self.checked_in_at[ticket_id] = time.time()
+        self._pending.append(ticket_id)
+        if len(self._pending) >= FLUSH_BATCH:
+            self._batch_ready.set()
+        return CHECKED_IN, holder
+
+    async def _load_ticket(self, ticket_id: int):
+        # Билет мог быть выдан после открытия сессии: промах проверяется по базе один раз
+        if ticket_id in self._foreign:
+            return WRONG_EVENT
+        details = await get_ticket_details(ticket_id)
+        if details is None:
+            return NOT_FOUND
+        if details["event_id"] != self.event_id:
+            self._foreign.add(ticket_id)
+            return WRONG_EVENT
+        self.holders[ticket_id] = details["full_name"]
+        if details["is_used"]:
+            self.used.add(ticket_id)
+        return None
+
+    async def flush(self):
+        """
+        Записывает накопленные отметки о входе одной транзакцией.
+        """
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        try:
+            await check_in_tickets(batch)
+        except Exception:
+            # Отметки остаются в очереди до следующей попытки
+            logger.exception("Не удалось записать %s отметок о входе", len(batch))
+            self._pending = batch + self._pending
+            raise
+
+    async def _run_flusher(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._batch_ready.wait(), FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._batch_ready.clear()
+            try:
+                await self.flush()
+            except Exception:
+                pass
+
+
+# Открытые сессии по мероприятиям и мероприятие, на входе которого стоит администратор
+_sessions = {}
+_admin_sessions = {}
+# Сессии, которые не закрываются при выходе администраторов (нужны HTTP-сервису сканеров)
+_kept_open = set()
+_sessions_lock = asyncio.Lock()
+
+
+async def open_session(event_id: int, keep_open: bool = False) -> CheckInSession:
+    """
+    Возвращает сессию мероприятия, загружая его билеты при первом обращении.
+    :param keep_open: Не закрывать сессию, когда на входе не остаётся администраторов
+    :return: Сессия или None, если мероприятие не найдено
+    """
+    async with _sessions_lock:
+        session = _sessions.get(event_id)
+        if session is None:
+            event = await get_event_by_id(event_id)
+            if not event:
+                return None
+            session = CheckInSession(event_id, event["name"], await get_event_check_in_data(event_id))
+            session.start()
+            _sessions[event_id] = session
+            logger.info("Открыт режим входа на «%s»: %s билетов, прошли %s",
+                        session.event_name, session.sold, session.checked_in)
+        if keep_open:
+            _kept_open.add(event_id)
+        return session
+
+
+def get_session(event_id: int) -> CheckInSession:
+    """
+    Уже открытая сессия мероприятия или None; новую сессию не открывает.
+    """
+    return _sessions.get(event_id)
+
+
+async def close_session(event_id: int) -> bool:
+    """
+    Закрывает сессию мероприятия, записав её отметки в базу. Если запись не удалась,
+    сессия остаётся открытой с этими отметками, и фоновая запись повторяет попытку.
+    :return: True, если сессия закрыта или не была открыта
+    """
+    async with _sessions_lock:
+        session = _sessions.pop(event_id, None)
+        _kept_open.discard(event_id)
+    if session is None:
+        return True
+
+    try:
+        await session.close()
+        return True
+    except Exception:
+        logger.error("Режим входа на «%s» не закрыт: не записаны отметки билетов %s",
+                     session.event_name, session._pending)
+
+    async with _sessions_lock:
+        current = _sessions.setdefault(event_id, session)
+    if current is session:
+        session.start()
+    else:
+        # Пока сессия закрывалась, мероприятие открыли заново: отметки переходят в новую сессию
+        current.used.update(session._pending)
+        current._pending.extend(session._pending)
+    return False
+
+
+async def start_admin_session(admin_id: int, event_id: int) -> CheckInSession:
+    """
+    Включает режим входа для администратора.
+    """
+    if _admin_sessions.get(admin_id) not in (None, event_id):
+        await stop_admin_session(admin_id)
+    session = await open_session(event_id)
+    if session is not None:
+        _admin_sessions[admin_id] = event_id
+    return session
+
+
+def get_admin_session(admin_id: int) -> CheckInSession:
+    """
+    Сессия, в которой администратор сейчас проверяет билеты, или None.
+    """
+    event_id = _admin_sessions.get(admin_id)
+    return _sessions.get(event_id) if event_id is not None else None
+
+
+async def stop_admin_session(admin_id: int) -> CheckInSession:
+    """
+    Выключает режим входа для администратора. Сессия закрывается, когда на входе не остаётся никого.
+    :return: Сессия, из которой вышел администратор, или None
+    """
+    event_id = _admin_sessions.pop(admin_id, None)
+    session = _sessions.get(event_id)
+    if session is None:
+        return None
+    if event_id in _admin_sessions.values() or event_id in _kept_open:
+        await session.flush()
+    else:
+        await close_session(event_id)
+    return session
+
+
+async def get_ticket_status(ticket_id: int) -> dict:
+    """
+    Данные билета из базы (get_ticket_details) с учётом отметок открытой сессии его
+    мероприятия, которые ещё не записаны в базу.
+    :return: Словарь с данными о билете или None, если билет не найден
+    """
+    details = await get_ticket_details(ticket_id)
+    if details is not None:
+        session = _sessions.get(details["event_id"])
+        if session is not None and ticket_id in session.used:
+            details["is_used"] = True
+    return details
+
+
+async def mark_used(ticket_id: int) -> bool:
+    """
+    Отмечает билет использованным в обход сканера (кнопкой «Использован»). Если режим
+    входа на мероприятие билета открыт, отметка ставится через его сессию, иначе — в базе.
+    :return: True, если билет отмечен этим вызовом, False, если он уже был использован
+    """
+    details = await get_ticket_details(ticket_id)
+    session = _sessions.get(details["event_id"]) if details is not None else None
+    if session is not None:
+        status, _ = await session.check_in(ticket_id)
+        return status == CHECKED_IN
+    return await check_in_ticket(ticket_id)
+
+
+async def close_all():
+    """
+    Записывает отметки всех сессий в базу (при остановке бота). Ошибка записи одной
+    сессии не прерывает остановку: запись повторяется, а не записанные отметки попадают в лог.
+    """
+    _admin_sessions.clear()
+    for attempt in range(CLOSE_ATTEMPTS):
+        if attempt:
+            await asyncio.sleep(FLUSH_INTERVAL)
+        for event_id in list(_sessions):
+            await close_session(event_id)
+        if not _sessions:
+            return
+
+    for session in list(_sessions.values()):
+        logger.error("Отметки о входе на «%s» не записаны в базу при остановке: билеты %s",
+                     session.event_name, session._pending)
+        await session.stop()
+    _sessions.clear()
+    _kept_open.clear()
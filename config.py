@@ -4,4 +4,42 @@ import os
 load_dotenv()
 
 TOKEN = os.getenv("BOT_TOKEN")
-ADMINS = list(map(int, os.getenv("ADMIN_ID").split()))
\ No newline at end of file
+ADMINS = list(map(int, os.getenv("ADMIN_ID").split()))
+
+# Групповой коммит частых вставок (1 — включить) и режим fsync для него: FULL, NORMAL или OFF
+DB_WRITE_BATCHING = os.getenv("DB_WRITE_BATCHING", "0") == "1"
+DB_WRITE_SYNCHRONOUS = os.getenv("DB_WRITE_SYNCHRONOUS", "NORMAL")
+
+# Пул отрисовки билетов: число процессов (по умолчанию — число ядер) и длина очереди
+TICKET_RENDER_WORKERS = int(os.getenv("TICKET_RENDER_WORKERS", "0")) or None
+TICKET_RENDER_QUEUE = int(os.getenv("TICKET_RENDER_QUEUE", "32"))
+
+# Сохранять копию отправленного билета в qr_code/. Повторно билеты отправляются по file_id,
+# копия нужна, только если Telegram его отклонит (иначе билет будет нарисован заново)
+TICKET_PERSIST_TO_DISK = os.getenv("TICKET_PERSIST_TO_DISK", "1") == "1"
+
+# Ключ подписи токенов в QR-кодах билетов (по умолчанию — токен бота). После смены ключа
+# ранее выданные билеты перестают проходить проверку
+TICKET_SECRET = os.getenv("TICKET_SECRET") or TOKEN
+# Принимать ссылки старого формата ?start=ticket_<id> (0 — нет). Принимаются только билеты,
+# выданные до перехода на подписанные токены: по ним уже проданы QR-коды. ID в таких ссылках
+# последовательные и угадываются, поэтому выключите приём, когда старые билеты перевыпущены
+TICKET_ACCEPT_LEGACY_LINKS = os.getenv("TICKET_ACCEPT_LEGACY_LINKS", "1") == "1"
+
+# Удалять при запуске бота данные мероприятий, удалённых раньше (1 — да). По умолчанию
+# такие данные только перечисляются в логе, а очистку подтверждает администратор
+EVENT_ORPHAN_SWEEP = os.getenv("EVENT_ORPHAN_SWEEP", "0") == "1"
+
+# Локальный HTTP-сервис проверки билетов для сканеров на входе (1 — включить).
+# Если сервис слушает не только localhost, обязательно задайте SCANNER_API_TOKEN
+SCANNER_API_ENABLED = os.getenv("SCANNER_API_ENABLED", "0") == "1"
+SCANNER_API_HOST = os.getenv("SCANNER_API_HOST", "127.0.0.1")
+SCANNER_API_PORT = int(os.getenv("SCANNER_API_PORT", "8081"))
+SCANNER_API_TOKEN = os.getenv("SCANNER_API_TOKEN", "")
+
+# Ограничение исходящих запросов к Telegram: сообщений в секунду на бота и в один чат,
+# число повторов после flood control (RetryAfter). Альбом засчитывается по числу фото:
+# при 1 сообщении в секунду альбомы по 10 билетов в один чат уходят с интервалом ~10 с
+OUTBOUND_GLOBAL_RATE = float(os.getenv("OUTBOUND_GLOBAL_RATE", "25"))
+OUTBOUND_CHAT_RATE = float(os.getenv("OUTBOUND_CHAT_RATE", "1"))
+OUTBOUND_MAX_RETRIES = int(os.getenv("OUTBOUND_MAX_RETRIES", "3"))
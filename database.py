@@ -1,160 +1,508 @@
+import logging
 import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
 from datetime import datetime
 
+from cache import LRUCache
+from models import Event, User, Ticket, Broadcast
+from write_queue import WriteQueue
 
 DB_NAME = "rout_bot.db"
 
-def init_db():
-    conn = sqlite3.connect(DB_NAME)
+# Формат даты мероприятия, который вводят администраторы
+EVENT_DATE_FORMAT = "%Y-%m-%d %H:%M"
+
+logger = logging.getLogger(__name__)
+
+# Параметры соединения: WAL позволяет читать параллельно с записью,
+# synchronous=NORMAL в режиме WAL делает fsync только на чекпоинтах
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA mmap_size = 134217728",
+    "PRAGMA busy_timeout = 5000",
+)
+
+# Размеры кэшей пользователей и мероприятий (число записей)
+USERS_CACHE_SIZE = 1024
+EVENTS_CACHE_SIZE = 64
+
+def _columns(record_type, table: str) -> str:
+    # Список колонок в порядке полей записи, чтобы строку можно было передать в from_row
+    return ", ".join(f"{table}.{field}" for field in record_type.__slots__)
+
+
+EVENT_COLUMNS = _columns(Event, "events")
+USER_COLUMNS = _columns(User, "users")
+BROADCAST_COLUMNS = _columns(Broadcast, "broadcasts")
+
+# Пул долгоживущих соединений: по одному на поток
+_local = threading.local()
+_connections = []
+_connections_lock = threading.Lock()
+_generation = 0
+
+
+def get_connection() -> sqlite3.Connection:
+    """
+    Возвращает долгоживущее соединение текущего потока, открывая его при первом обращении.
+    :return: Соединение с базой данных
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.generation != _generation:
+        conn = sqlite3.connect(DB_NAME, timeout=5, check_same_thread=False)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        with _connections_lock:
+            _connections.append(conn)
+            _local.conn = conn
+            _local.generation = _generation
+    return conn
+
+
+@contextmanager
+def get_cursor(commit: bool = False):
+    """
+    Выдаёт курсор на соединении из пула.
+    :param commit: Зафиксировать транзакцию после успешного выполнения блока
+    """
+    conn = get_connection()
     cursor = conn.cursor()
+    try:
+        yield cursor
+        if commit:
+            conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def close_connections():
+    """
+    Закрывает все соединения пула (при остановке бота или смене файла базы).
+    """
+    global _generation
+    with _connections_lock:
+        for conn in _connections:
+            conn.close()
+        _connections.clear()
+        _generation += 1
 
-    # Таблица мероприятий
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS events (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            description TEXT,
-            photo TEXT,
-            price REAL,
-            date TEXT,
-            is_sale_active BOOLEAN,
-            qr_template TEXT,
-            photo_album_link TEXT
-        )
-    """)
 
-    # Таблица пользователей
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            full_name TEXT NOT NULL,
-            university TEXT,
-            phone_number TEXT
-        )
-    """)
+def set_db_name(db_name: str):
+    """
+    Переключает модуль на другой файл базы данных.
+    :param db_name: Путь к файлу базы данных
+    """
+    global DB_NAME
+    close_connections()
+    DB_NAME = db_name
+    _users_cache.clear()
+    _events_cache.clear()
+    invalidate_active_events()
 
-    # Таблица билетов
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS tickets (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            event_id INTEGER,
-            qr_code TEXT,
-            FOREIGN KEY (user_id) REFERENCES users (id),
-            FOREIGN KEY (event_id) REFERENCES events (id)
-        )
-    """)
 
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS used_tickets (
-            ticket_id INTEGER PRIMARY KEY,
-            FOREIGN KEY (ticket_id) REFERENCES tickets (id)
-        )
-    """)
+# Очередь группового коммита для частых вставок; None — запись сразу в вызывающем потоке
+_write_queue = None
 
-    # Таблица отзывов
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS feedback (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            event_id INTEGER,
-            text TEXT,
-            FOREIGN KEY (user_id) REFERENCES users (id),
-            FOREIGN KEY (event_id) REFERENCES events (id)
-        )
-    """)
-
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS admin_notifications (
-            admin_id INTEGER,
-            message_id INTEGER,
-            user_id INTEGER,
-            PRIMARY KEY (admin_id, message_id)
-        )
-    """)
 
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS user_events (
+def enable_write_queue(flush_interval: float = 0.01, max_batch: int = 200, synchronous: str = "NORMAL"):
+    """
+    Включает групповой коммит для add_ticket, add_user_event, add_feedback,
+    add_admin_notification, add_used_ticket и check_in_ticket.
+    :param flush_interval: Максимальное ожидание пачки в секундах
+    :param max_batch: Максимальное число записей в одной транзакции
+    :param synchronous: Режим fsync при коммите пачки (FULL, NORMAL или OFF)
+    """
+    global _write_queue
+    disable_write_queue()
+    _write_queue = WriteQueue(get_connection, flush_interval, max_batch, synchronous)
+
+
+def disable_write_queue():
+    """
+    Записывает всё, что накопилось в очереди, и останавливает её.
+    """
+    global _write_queue
+    if _write_queue is not None:
+        _write_queue.stop()
+        _write_queue = None
+
+
+def _insert(query: str, params: tuple, wait: bool = True):
+    """
+    Выполняет вставку через очередь группового коммита, если она включена.
+    :param wait: Дождаться коммита; при False возвращается Future с ID строки
+    :return: ID вставленной строки (None, если строка не вставлена) или Future
+    """
+    if _write_queue is not None:
+        future = _write_queue.submit(query, params)
+        return future.result() if wait else future
+
+    with get_cursor(commit=True) as cursor:
+        cursor.execute(query, params)
+        row_id = cursor.lastrowid if cursor.rowcount > 0 else None
+    if wait:
+        return row_id
+    future = Future()
+    future.set_result(row_id)
+    return future
+
+
+def _then(future: Future, convert) -> Future:
+    # Future с результатом convert(результат future); ошибка передаётся без изменений
+    converted = Future()
+
+    def done(source: Future):
+        if source.exception() is not None:
+            converted.set_exception(source.exception())
+        else:
+            converted.set_result(convert(source.result()))
+
+    future.add_done_callback(done)
+    return converted
+
+
+def init_db():
+    with get_cursor(commit=True) as cursor:
+        # Таблица мероприятий
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                description TEXT,
+                photo TEXT,
+                price REAL,
+                date TEXT,
+                is_sale_active BOOLEAN,
+                qr_template TEXT,
+                photo_album_link TEXT
+            )
+        """)
+
+        # Таблица пользователей
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                full_name TEXT NOT NULL,
+                university TEXT,
+                phone_number TEXT
+            )
+        """)
+
+        # Таблица билетов
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS tickets (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER,
+                event_id INTEGER,
+                qr_code TEXT,
+                FOREIGN KEY (user_id) REFERENCES users (id),
+                FOREIGN KEY (event_id) REFERENCES events (id)
+            )
+        """)
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS used_tickets (
+                ticket_id INTEGER PRIMARY KEY,
+                FOREIGN KEY (ticket_id) REFERENCES tickets (id)
+            )
+        """)
+
+        # Таблица отзывов
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS feedback (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER,
+                event_id INTEGER,
+                text TEXT,
+                FOREIGN KEY (user_id) REFERENCES users (id),
+                FOREIGN KEY (event_id) REFERENCES events (id)
+            )
+        """)
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS admin_notifications (
+                admin_id INTEGER,
+                message_id INTEGER,
+                user_id INTEGER,
+                PRIMARY KEY (admin_id, message_id)
+            )
+        """)
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS user_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER,
+                event_id INTEGER,
+                FOREIGN KEY (user_id) REFERENCES users (id),
+                FOREIGN KEY (event_id) REFERENCES events (id)
+            )
+        """)
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS payment_link (
+                link TEXT NOT NULL
+            )
+        ''')
+
+    migrate()
+
+
+# Миграции схемы. Номер версии хранится в PRAGMA user_version и равен числу
+# применённых миграций. Новые миграции добавляются только в конец списка;
+# шаг миграции — SQL-строка или функция, принимающая курсор.
+MIGRATIONS = [
+    # 1: индексы для частых выборок по билетам, покупкам, уведомлениям и отзывам
+    (
+        "CREATE INDEX IF NOT EXISTS idx_tickets_user_event ON tickets (user_id, event_id)",
+        "CREATE INDEX IF NOT EXISTS idx_tickets_event ON tickets (event_id)",
+        "CREATE INDEX IF NOT EXISTS idx_user_events_user ON user_events (user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_admin_notifications_admin_user ON admin_notifications (admin_id, user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_feedback_event ON feedback (event_id)",
+    ),
+    # 2: сортируемое время начала мероприятия для фильтрации активных мероприятий в SQL
+    (
+        "ALTER TABLE events ADD COLUMN starts_at INTEGER",
+        lambda cursor: _backfill_events_starts_at(cursor),
+        "CREATE INDEX IF NOT EXISTS idx_events_sale_starts ON events (is_sale_active, starts_at)",
+    ),
+    # 3: file_id изображения билета, выданный Telegram при первой отправке
+    (
+        "ALTER TABLE tickets ADD COLUMN file_id TEXT",
+    ),
+    # 4: поиск покупок по мероприятию для очистки после удаления и постепенное
+    # освобождение места в файле базы (вступает в силу после VACUUM в migrate)
+    (
+        "CREATE INDEX IF NOT EXISTS idx_user_events_event ON user_events (event_id)",
+        "PRAGMA auto_vacuum = INCREMENTAL",
+    ),
+    # 5: рассылки с курсором по users.id, чтобы прерванная рассылка продолжалась с места остановки
+    (
+        """
+        CREATE TABLE IF NOT EXISTS broadcasts (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
             event_id INTEGER,
-            FOREIGN KEY (user_id) REFERENCES users (id),
+            status TEXT NOT NULL DEFAULT 'running',
+            last_user_id INTEGER NOT NULL DEFAULT 0,
+            total INTEGER NOT NULL DEFAULT 0,
+            delivered INTEGER NOT NULL DEFAULT 0,
+            blocked INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            created_by INTEGER,
+            created_at INTEGER,
+            finished_at INTEGER,
             FOREIGN KEY (event_id) REFERENCES events (id)
         )
-    """)
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_broadcasts_status ON broadcasts (status)",
+    ),
+    # 6: настройки в виде ключ-значение и граница старых ссылок ticket_<id>: такие ссылки
+    # есть только у билетов, выданных до перехода на подписанные токены
+    (
+        "CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT)",
+        "INSERT OR IGNORE INTO settings (key, value) "
+        "SELECT 'legacy_ticket_max_id', COALESCE(MAX(id), 0) FROM tickets",
+    ),
+    # 7: не больше одной незавершённой рассылки на мероприятие и получатели, которым анонс
+    # уже отправлен за курсором (порция отправляется параллельно и завершается не по порядку)
+    (
+        "ALTER TABLE broadcasts ADD COLUMN sent_ahead TEXT",
+        "UPDATE broadcasts SET status = 'cancelled' WHERE status = 'running' AND id NOT IN "
+        "(SELECT MIN(id) FROM broadcasts WHERE status = 'running' GROUP BY event_id)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_broadcasts_running_event ON broadcasts (event_id) "
+        "WHERE status = 'running'",
+    ),
+]
+
+# Статусы рассылки
+BROADCAST_RUNNING = "running"
+BROADCAST_DONE = "done"
+BROADCAST_CANCELLED = "cancelled"
+
+# Значение PRAGMA auto_vacuum для режима INCREMENTAL
+AUTO_VACUUM_INCREMENTAL = 2
+
+# Частые запросы, план которых сравнивается до и после миграций
+HOT_QUERIES = {
+    "get_ticket": ("SELECT id, qr_code FROM tickets WHERE user_id = ? AND event_id = ?", (0, 0)),
+    "get_user_tickets": (
+        "SELECT tickets.*, events.name FROM tickets JOIN events ON tickets.event_id = events.id "
+        "WHERE tickets.user_id = ?", (0,)
+    ),
+    "get_user_upcoming_tickets": (
+        "SELECT tickets.*, events.name FROM tickets JOIN events ON tickets.event_id = events.id "
+        "WHERE tickets.user_id = ? AND events.starts_at > ? ORDER BY events.starts_at", (0, 0)
+    ),
+    "get_user_events": (
+        "SELECT events.* FROM events JOIN user_events ON events.id = user_events.event_id "
+        "WHERE user_events.user_id = ?", (0,)
+    ),
+    "get_event_attendees": (
+        "SELECT u.id, u.full_name, u.university, u.phone_number FROM users u "
+        "JOIN tickets t ON u.id = t.user_id WHERE t.event_id = ?", (0,)
+    ),
+    "delete_admin_notifications": (
+        "DELETE FROM admin_notifications WHERE admin_id = ? AND user_id = ?", (0, 0)
+    ),
+    "feedback_by_event": ("SELECT * FROM feedback WHERE event_id = ?", (0,)),
+    "get_ticket_details": (
+        "SELECT t.id, u.full_name, e.name, ut.ticket_id IS NOT NULL FROM tickets t "
+        "LEFT JOIN users u ON u.id = t.user_id LEFT JOIN events e ON e.id = t.event_id "
+        "LEFT JOIN used_tickets ut ON ut.ticket_id = t.id WHERE t.id = ?", (0,)
+    ),
+    "get_active_events": (
+        "SELECT * FROM events WHERE is_sale_active = 1 AND starts_at > ? ORDER BY starts_at", (0,)
+    ),
+    "get_broadcast_recipients": ("SELECT id FROM users WHERE id > ? ORDER BY id LIMIT ?", (0, 500)),
+    "get_event_check_in_data": (
+        "SELECT t.id, u.full_name, ut.ticket_id IS NOT NULL FROM tickets t "
+        "LEFT JOIN users u ON u.id = t.user_id LEFT JOIN used_tickets ut ON ut.ticket_id = t.id "
+        "WHERE t.event_id = ?", (0,)
+    ),
+}
+
+
+def _date_to_timestamp(date: str):
+    """
+    Переводит дату мероприятия в Unix-время для хранения в starts_at.
+    :param date: Дата в формате ГГГГ-ММ-ДД ЧЧ:ММ
+    :return: Unix-время или None, если дата не распознана
+    """
+    try:
+        return int(datetime.strptime(date, EVENT_DATE_FORMAT).timestamp())
+    except (TypeError, ValueError):
+        return None
 
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS payment_link (
-            link TEXT NOT NULL
-        )
-    ''')
 
-    conn.commit()
-    conn.close()
+def _backfill_events_starts_at(cursor):
+    cursor.execute("SELECT id, date FROM events")
+    rows = [(_date_to_timestamp(date), event_id) for event_id, date in cursor.fetchall()]
+    cursor.executemany("UPDATE events SET starts_at = ? WHERE id = ?", rows)
 
-# Инициализация базы данных при старте
-init_db()
+
+def get_schema_version() -> int:
+    with get_cursor() as cursor:
+        cursor.execute("PRAGMA user_version")
+        return cursor.fetchone()[0]
+
+
+def explain_hot_queries() -> dict:
+    """
+    Получает планы выполнения частых запросов.
+    :return: Словарь {название запроса: список шагов плана}
+    """
+    plans = {}
+    with get_cursor() as cursor:
+        for name, (query, params) in HOT_QUERIES.items():
+            try:
+                cursor.execute(f"EXPLAIN QUERY PLAN {query}", params)
+            except sqlite3.OperationalError:
+                # Запрос использует колонки, которые добавит одна из следующих миграций
+                plans[name] = ["недоступен в текущей схеме"]
+                continue
+            plans[name] = [row[3] for row in cursor.fetchall()]
+    return plans
+
+
+def migrate() -> dict:
+    """
+    Применяет недостающие миграции к существующей базе, не затрагивая данные.
+    :return: Словарь {название запроса: (план до, план после)}; пустой, если миграций не было
+    """
+    version = get_schema_version()
+    if version >= len(MIGRATIONS):
+        return {}
+
+    plans_before = explain_hot_queries()
+    for number, steps in enumerate(MIGRATIONS[version:], start=version + 1):
+        # Каждая миграция вместе с новым номером версии применяется в одной транзакции
+        with get_cursor(commit=True) as cursor:
+            cursor.execute("BEGIN")
+            for step in steps:
+                if callable(step):
+                    step(cursor)
+                else:
+                    cursor.execute(step)
+            cursor.execute(f"PRAGMA user_version = {number}")
+        logger.info("Применена миграция базы данных %s", number)
+    _apply_auto_vacuum()
+    plans_after = explain_hot_queries()
+
+    report = {name: (plans_before[name], plans_after[name]) for name in HOT_QUERIES}
+    for name, (before, after) in report.items():
+        logger.info("План %s: %s -> %s", name, "; ".join(before), "; ".join(after))
+    return report
+
+def _apply_auto_vacuum():
+    # Режим auto_vacuum существующей базы меняется только полным VACUUM вне транзакции.
+    # Выполняется один раз: дальше место освобождается через incremental_vacuum
+    conn = get_connection()
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != AUTO_VACUUM_INCREMENTAL:
+        started = time.perf_counter()
+        conn.commit()
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+        logger.info("База переведена в режим incremental auto_vacuum за %.1f с", time.perf_counter() - started)
 
 def add_user(user_id: int, full_name: str, university: str, phone_number: str) -> int:
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("""
-        INSERT INTO users (id, full_name, university, phone_number)
-        VALUES (?, ?, ?, ?)
-    """, (user_id, full_name, university, phone_number))
-    user_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
+    with get_cursor(commit=True) as cursor:
+        cursor.execute("""
+            INSERT INTO users (id, full_name, university, phone_number)
+            VALUES (?, ?, ?, ?)
+        """, (user_id, full_name, university, phone_number))
+        user_id = cursor.lastrowid
+    _users_cache.invalidate(user_id)
     return user_id
 
+# Кэш пользователей и мероприятий по ID; сбрасывается при изменении записей
+_users_cache = LRUCache(USERS_CACHE_SIZE)
+_events_cache = LRUCache(EVENTS_CACHE_SIZE)
+
+
+def get_cache_stats() -> dict:
+    """
+    Получает счётчики попаданий и промахов кэшей для подбора их размера.
+    :return: Словарь {название кэша: статистика}
+    """
+    return {"users": _users_cache.stats(), "events": _events_cache.stats()}
+
+
+def _load_user(user_id: int) -> User:
+    with get_cursor() as cursor:
+        cursor.row_factory = User.from_row
+        cursor.execute(f"SELECT {USER_COLUMNS} FROM users WHERE id = ?", (user_id,))
+        return cursor.fetchone()
+
 # Функция для получения пользователя по ID
-def get_user(user_id: int) -> dict:
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM users WHERE id = ?", (user_id,))
-    user = cursor.fetchone()
-    conn.close()
-    if user:
-        return {
-            "id": user[0],
-            "full_name": user[1],
-            "university": user[2],
-            "phone_number": user[3]
-        }
-    return None
+def get_user(user_id: int) -> User:
+    return _users_cache.get_or_load(user_id, _load_user)
 
 def update_user(user_id: int, full_name: str, university: str) -> bool:
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("""
-        UPDATE users
-        SET full_name = ?, university = ?
-        WHERE id = ?
-    """, (full_name, university, user_id))
-    conn.commit()
-    rows_affected = cursor.rowcount
-    conn.close()
+    with get_cursor(commit=True) as cursor:
+        cursor.execute("""
+            UPDATE users
+            SET full_name = ?, university = ?
+            WHERE id = ?
+        """, (full_name, university, user_id))
+        rows_affected = cursor.rowcount
+    _users_cache.invalidate(user_id)
     return rows_affected > 0
 
 
 # Функция для получения всех мероприятий
 def get_events() -> list:
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM events")
-    events = cursor.fetchall()
-    conn.close()
-    return [{
-        "id": event[0],
-        "name": event[1],
-        "description": event[2],
-        "photo": event[3],
-        "price": event[4],
-        "date": event[5],
-        "is_sale_active": bool(event[6]),
-        "qr_template": event[7],
-        "photo_album_link": event[8]
-    } for event in events]
+    with get_cursor() as cursor:
+        cursor.row_factory = Event.from_row
+        cursor.execute(f"SELECT {EVENT_COLUMNS} FROM events")
+        return cursor.fetchall()
 
 # Функция для добавления мероприятия
 def add_event(
@@ -167,31 +515,112 @@ def add_event(
     qr_template: str,
     photo_album_link: str = None
 ) -> int:
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("""
-        INSERT INTO events (name, description, photo, price, date, is_sale_active, qr_template, photo_album_link)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-    """, (name, description, photo, price, date, is_sale_active, qr_template, photo_album_link))
-    event_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
+    with get_cursor(commit=True) as cursor:
+        cursor.execute("""
+            INSERT INTO events (name, description, photo, price, date, is_sale_active, qr_template, photo_album_link, starts_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (name, description, photo, price, date, is_sale_active, qr_template, photo_album_link,
+              _date_to_timestamp(date)))
+        event_id = cursor.lastrowid
+    _events_cache.invalidate(event_id)
+    invalidate_active_events()
     return event_id
 
 # Функция для удаления мероприятия
 def delete_event(event_id: int) -> bool:
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM events WHERE id = ?", (event_id,))
-    conn.commit()
-    rows_affected = cursor.rowcount
-    conn.close()
+    """
+    Удаляет мероприятие. Билеты, покупки и отзывы удаляются позже фоновой очисткой (event_cleanup.py).
+    :return: True, если мероприятие было удалено
+    """
+    with get_cursor(commit=True) as cursor:
+        cursor.execute("DELETE FROM events WHERE id = ?", (event_id,))
+        rows_affected = cursor.rowcount
+    _events_cache.invalidate(event_id)
+    invalidate_active_events()
     return rows_affected > 0
 
+def purge_event_chunk(event_id: int, chunk_size: int = 500) -> tuple:
+    """
+    Удаляет очередную порцию данных удалённого мероприятия: билеты вместе с отметками
+    о входе, затем покупки и отзывы. Каждая порция — отдельная короткая транзакция,
+    чтобы очистка не задерживала остальные запросы.
+    :param event_id: ID мероприятия
+    :param chunk_size: Максимальное число строк каждой таблицы в порции
+    :return: (словарь {таблица: удалено строк}, пути к файлам удалённых билетов);
+             пустой словарь, когда удалять больше нечего
+    """
+    deleted = {}
+    files = []
+    with get_cursor(commit=True) as cursor:
+        cursor.execute("SELECT id, qr_code FROM tickets WHERE event_id = ? LIMIT ?", (event_id, chunk_size))
+        tickets = cursor.fetchall()
+        if tickets:
+            ids = [(ticket_id,) for ticket_id, _ in tickets]
+            cursor.executemany("DELETE FROM used_tickets WHERE ticket_id = ?", ids)
+            deleted["used_tickets"] = cursor.rowcount
+            cursor.executemany("DELETE FROM tickets WHERE id = ?", ids)
+            deleted["tickets"] = cursor.rowcount
+            files = [qr_code for _, qr_code in tickets if qr_code]
+
+        for table in ("user_events", "feedback"):
+            cursor.execute(f"""
+                DELETE FROM {table} WHERE id IN (
+                    SELECT id FROM {table} WHERE event_id = ? LIMIT ?
+                )
+            """, (event_id, chunk_size))
+            if cursor.rowcount > 0:
+                deleted[table] = cursor.rowcount
+    return deleted, files
+
+def get_orphan_event_ids() -> list:
+    """
+    Находит мероприятия, которых уже нет в events, но на которые ссылаются билеты, покупки или отзывы.
+    :return: Список ID мероприятий
+    """
+    with get_cursor() as cursor:
+        cursor.execute("""
+            SELECT event_id FROM tickets WHERE event_id NOT IN (SELECT id FROM events)
+            UNION
+            SELECT event_id FROM user_events WHERE event_id NOT IN (SELECT id FROM events)
+            UNION
+            SELECT event_id FROM feedback WHERE event_id NOT IN (SELECT id FROM events)
+        """)
+        return [row[0] for row in cursor.fetchall() if row[0] is not None]
+
+def get_orphan_summary() -> dict:
+    """
+    Считает данные мероприятий, которых уже нет в events: что удалит очистка.
+    :return: Словарь {ID мероприятия: {таблица: строк}}
+    """
+    summary = {}
+    with get_cursor() as cursor:
+        for table in ("tickets", "user_events", "feedback"):
+            cursor.execute(f"""
+                SELECT event_id, COUNT(*) FROM {table}
+                WHERE event_id IS NOT NULL AND event_id NOT IN (SELECT id FROM events)
+                GROUP BY event_id
+            """)
+            for event_id, count in cursor.fetchall():
+                summary.setdefault(event_id, {})[table] = count
+    return summary
+
+def incremental_vacuum(max_pages: int = 0) -> int:
+    """
+    Возвращает свободные страницы файла базы операционной системе.
+    :param max_pages: Сколько страниц освободить за вызов (0 — все)
+    :return: Число освобождённых страниц
+    """
+    conn = get_connection()
+    before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    # Через execute прагма освобождает только одну страницу за шаг, executescript выполняет её целиком
+    conn.executescript(f"PRAGMA incremental_vacuum({int(max_pages)});")
+    return before - conn.execute("PRAGMA freelist_count").fetchone()[0]
+
 # Функция для редактирования мероприятия
 def update_event(event_id: int, **kwargs):
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
+    # Время начала хранится рядом с датой, чтобы фильтровать мероприятия в SQL
+    if "date" in kwargs:
+        kwargs["starts_at"] = _date_to_timestamp(kwargs["date"])
 
     # Формируем запрос для обновления только переданных полей
     updates = []
@@ -202,136 +631,134 @@ def update_event(event_id: int, **kwargs):
     params.append(event_id)
 
     query = f"UPDATE events SET {', '.join(updates)} WHERE id = ?"
-    cursor.execute(query, tuple(params))
-    conn.commit()
-    conn.close()
+    with get_cursor(commit=True) as cursor:
+        cursor.execute(query, tuple(params))
+    _events_cache.invalidate(event_id)
+    invalidate_active_events()
+
+
+# Каталог активных мероприятий в памяти процесса: {ID мероприятия: мероприятие}.
+# Сбрасывается при изменении мероприятий и истекает, когда начинается ближайшее из них.
+_active_events_cache = None
+_active_events_expires_at = 0
+_active_events_lock = threading.Lock()
+
+
+def invalidate_active_events():
+    global _active_events_cache
+    with _active_events_lock:
+        _active_events_cache = None
+
+
+def _get_active_events_catalog() -> dict:
+    global _active_events_cache, _active_events_expires_at
+    now = int(time.time())
+    with _active_events_lock:
+        if _active_events_cache is not None and now < _active_events_expires_at:
+            return _active_events_cache
+
+        with get_cursor() as cursor:
+            cursor.row_factory = Event.from_row
+            cursor.execute(f"""
+                SELECT {EVENT_COLUMNS} FROM events
+                WHERE is_sale_active = 1 AND starts_at > ?
+                ORDER BY starts_at
+            """, (now,))
+            events = cursor.fetchall()
+
+        _active_events_cache = {event.id: event for event in events}
+        # Ближайшее мероприятие перестаёт быть активным в момент начала
+        _active_events_expires_at = events[0].starts_at if events else float("inf")
+        return _active_events_cache
 
 
 def get_active_events() -> list:
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM events")
-    events = cursor.fetchall()
-    conn.close()
-
-    current_date = datetime.now()  # Получаем текущую дату и время
-
-    active_events = []
-    for event in events:
-        # Используем формат "YYYY-MM-DD HH:MM" для даты
-        event_date = datetime.strptime(event[5], "%Y-%m-%d %H:%M")  # Измененный формат
-        if event_date > current_date and bool(event[6]):  # Проверяем, что событие еще не прошло
-            active_events.append({
-                "id": event[0],
-                "name": event[1],
-                "description": event[2],
-                "photo": event[3],
-                "price": event[4],
-                "date": event[5],
-                "is_sale_active": bool(event[6]),
-                "qr_template": event[7],
-                "photo_album_link": event[8]
-            })
-
-    return active_events
-
-def add_feedback(user_id: int, event_id: int, text: str) -> int:
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("""
-        INSERT INTO feedback (user_id, event_id, text)
-        VALUES (?, ?, ?)
-    """, (user_id, event_id, text))
-    feedback_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
-    return feedback_id
+    """
+    Получает мероприятия, продажа билетов на которые открыта и которые еще не прошли.
+    :return: Список мероприятий в порядке даты проведения
+    """
+    return list(_get_active_events_catalog().values())
+
 
-def get_event_by_id(event_id: int) -> dict:
+def get_active_event(event_id: int) -> Event:
     """
-    Получает данные о мероприятии по его ID.
+    Получает активное мероприятие из каталога по его ID.
     :param event_id: ID мероприятия
-    :return: Словарь с данными о мероприятии или None, если мероприятие не найдено
+    :return: Мероприятие или None, если оно не активно
     """
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
+    return _get_active_events_catalog().get(event_id)
 
-    # Выполняем запрос к базе данных
-    cursor.execute("SELECT * FROM events WHERE id = ?", (event_id,))
-    event = cursor.fetchone()  # Получаем первую строку результата
+def add_feedback(user_id: int, event_id: int, text: str, wait: bool = True) -> int:
+    return _insert("""
+        INSERT INTO feedback (user_id, event_id, text)
+        VALUES (?, ?, ?)
+    """, (user_id, event_id, text), wait)
 
-    conn.close()
+def _load_event(event_id: int) -> Event:
+    with get_cursor() as cursor:
+        cursor.row_factory = Event.from_row
+        cursor.execute(f"SELECT {EVENT_COLUMNS} FROM events WHERE id = ?", (event_id,))
+        return cursor.fetchone()  # None, если мероприятие не найдено
 
-    if event:
-        # Преобразуем результат в словарь
-        return {
-            "id": event[0],
-            "name": event[1],
-            "description": event[2],
-            "photo": event[3],
-            "price": event[4],
-            "date": event[5],
-            "is_sale_active": bool(event[6]),
-            "qr_template": event[7],
-            "photo_album_link": event[8]
-        }
-    return None  # Если мероприятие не
+def get_event_by_id(event_id: int) -> Event:
+    """
+    Получает данные о мероприятии по его ID.
+    :param event_id: ID мероприятия
+    :return: Мероприятие или None, если мероприятие не найдено
+    """
+    return _events_cache.get_or_load(event_id, _load_event)
 
 
-def add_admin_notification(admin_id, message_id, user_id):
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("""
+def add_admin_notification(admin_id, message_id, user_id, wait: bool = True):
+    return _insert("""
         INSERT OR IGNORE INTO admin_notifications (admin_id, message_id, user_id)
         VALUES (?, ?, ?)
-    """, (admin_id, message_id, user_id))
-    conn.commit()
-    conn.close()
+    """, (admin_id, message_id, user_id), wait)
 
-def get_admin_notifications(admin_id):
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT message_id, user_id FROM admin_notifications
-        WHERE admin_id = ?
-    """, (admin_id,))
-    result = [{"message_id": row[0], "user_id": row[1]} for row in cursor.fetchall()]
-    conn.close()
-    return result
+def add_admin_notifications(notifications: list):
+    """
+    Сохраняет уведомления нескольких администраторов одной транзакцией.
+    :param notifications: Список кортежей (ID администратора, ID сообщения, ID пользователя)
+    """
+    with get_cursor(commit=True) as cursor:
+        cursor.executemany("""
+            INSERT OR IGNORE INTO admin_notifications (admin_id, message_id, user_id)
+            VALUES (?, ?, ?)
+        """, notifications)
 
-def delete_admin_notifications(admin_id, user_id=None):
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    if user_id:
-        cursor.execute("""
-            DELETE FROM admin_notifications
-            WHERE admin_id = ? AND user_id = ?
-        """, (admin_id, user_id))
-    else:
+def get_admin_notifications(admin_id):
+    with get_cursor() as cursor:
         cursor.execute("""
-            DELETE FROM admin_notifications
+            SELECT message_id, user_id FROM admin_notifications
             WHERE admin_id = ?
         """, (admin_id,))
-    conn.commit()
-    conn.close()
+        return [{"message_id": row[0], "user_id": row[1]} for row in cursor.fetchall()]
 
-def add_user_event(user_id: int, event_id: int) -> int:
+def delete_admin_notifications(admin_id, user_id=None):
+    with get_cursor(commit=True) as cursor:
+        if user_id:
+            cursor.execute("""
+                DELETE FROM admin_notifications
+                WHERE admin_id = ? AND user_id = ?
+            """, (admin_id, user_id))
+        else:
+            cursor.execute("""
+                DELETE FROM admin_notifications
+                WHERE admin_id = ?
+            """, (admin_id,))
+
+def add_user_event(user_id: int, event_id: int, wait: bool = True) -> int:
     """
     Добавляет купленное мероприятие пользователю.
     :param user_id: ID пользователя
     :param event_id: ID мероприятия
+    :param wait: Дождаться записи; при False возвращается Future с ID записи
     :return: ID записи
     """
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("""
+    return _insert("""
         INSERT INTO user_events (user_id, event_id)
         VALUES (?, ?)
-    """, (user_id, event_id))
-    record_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
-    return record_id
+    """, (user_id, event_id), wait)
 
 def get_user_events(user_id: int) -> list:
     """
@@ -339,149 +766,166 @@ def get_user_events(user_id: int) -> list:
     :param user_id: ID пользователя
     :return: Список мероприятий
     """
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT events.* FROM events
-        JOIN user_events ON events.id = user_events.event_id
-        WHERE user_events.user_id = ?
-    """, (user_id,))
-    events = cursor.fetchall()
-    conn.close()
-
-    return [{
-        "id": event[0],
-        "name": event[1],
-        "description": event[2],
-        "photo": event[3],
-        "price": event[4],
-        "date": event[5],
-        "is_sale_active": bool(event[6]),
-        "qr_template": event[7],
-        "photo_album_link": event[8]
-    } for event in events]
-
-def add_ticket(user_id: int, event_id: int, qr_code: str) -> int:
+    with get_cursor() as cursor:
+        cursor.row_factory = Event.from_row
+        cursor.execute(f"""
+            SELECT {EVENT_COLUMNS} FROM events
+            JOIN user_events ON events.id = user_events.event_id
+            WHERE user_events.user_id = ?
+        """, (user_id,))
+        return cursor.fetchall()
+
+def add_ticket(user_id: int, event_id: int, qr_code: str = None, wait: bool = True) -> int:
     """
     Добавляет билет пользователю.
     :param user_id: ID пользователя
     :param event_id: ID мероприятия
-    :param qr_code: Путь к файлу QR-кода
+    :param qr_code: Путь к файлу QR-кода (у новых билетов не хранится: путь строится по ID билета)
+    :param wait: Дождаться записи; при False возвращается Future с ID билета
     :return: ID билета
     """
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("""
+    return _insert("""
         INSERT INTO tickets (user_id, event_id, qr_code)
         VALUES (?, ?, ?)
-    """, (user_id, event_id, qr_code))
-    ticket_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
-    return ticket_id
+    """, (user_id, event_id, qr_code), wait)
 
-def get_user_tickets(user_id: int) -> list:
+def get_user_tickets(user_id: int, upcoming_only: bool = False) -> list:
     """
-    Получает список билетов пользователя.
+    Получает список билетов пользователя в порядке даты мероприятия.
     :param user_id: ID пользователя
+    :param upcoming_only: Только билеты на мероприятия, которые ещё не начались
     :return: Список билетов
     """
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT tickets.*, events.name FROM tickets
+    query = f"""
+        SELECT tickets.id, tickets.user_id, tickets.event_id, tickets.qr_code, events.name, tickets.file_id
+        FROM tickets
         JOIN events ON tickets.event_id = events.id
-        WHERE tickets.user_id = ?
-    """, (user_id,))
-    tickets = cursor.fetchall()
-    conn.close()
-
-    return [{
-        "id": ticket[0],
-        "user_id": ticket[1],
-        "event_id": ticket[2],
-        "qr_code": ticket[3],
-        "event_name": ticket[4]
-    } for ticket in tickets]
+        WHERE tickets.user_id = ?{" AND events.starts_at > ?" if upcoming_only else ""}
+        ORDER BY events.starts_at, tickets.id
+    """
+    params = (user_id, int(time.time())) if upcoming_only else (user_id,)
+    with get_cursor() as cursor:
+        cursor.row_factory = Ticket.from_row
+        cursor.execute(query, params)
+        return cursor.fetchall()
 
 
-def add_payment_link(link: str):
-    conn = sqlite3.connect('rout_bot.db')
-    cursor = conn.cursor()
+def set_ticket_file_id(ticket_id: int, file_id: str):
+    """
+    Сохраняет file_id изображения билета для повторной отправки без загрузки.
+    :param ticket_id: ID билета
+    :param file_id: file_id фото, выданный Telegram (None — сбросить)
+    """
+    with get_cursor(commit=True) as cursor:
+        cursor.execute("UPDATE tickets SET file_id = ? WHERE id = ?", (file_id, ticket_id))
 
-    cursor.execute('''
-    INSERT INTO payment_link (link)
-    VALUES (?)
-    ''', (link,))
 
-    conn.commit()
-    conn.close()
+def add_payment_link(link: str):
+    with get_cursor(commit=True) as cursor:
+        cursor.execute('''
+        INSERT INTO payment_link (link)
+        VALUES (?)
+        ''', (link,))
 
 
 def get_payment_link():
-    conn = sqlite3.connect('rout_bot.db')
-    cursor = conn.cursor()
-
-    cursor.execute('''
-    SELECT link FROM payment_link
-    ''', )
-
-    result = cursor.fetchone()
-    conn.close()
+    with get_cursor() as cursor:
+        cursor.execute('''
+        SELECT link FROM payment_link
+        ''', )
+        result = cursor.fetchone()
 
     return result[0] if result else None
 
 
 def update_payment_link(new_link: str):
-    conn = sqlite3.connect('rout_bot.db')
-    cursor = conn.cursor()
-
-    cursor.execute('''
-    UPDATE payment_link
-    SET link = ?
-    ''', (new_link, ))
-
-    conn.commit()
-    conn.close()
-
-def add_used_ticket(ticket_id: int):
-    conn = sqlite3.connect('rout_bot.db')
-    cursor = conn.cursor()
+    with get_cursor(commit=True) as cursor:
+        cursor.execute('''
+        UPDATE payment_link
+        SET link = ?
+        ''', (new_link, ))
+
+def get_setting(key: str, default: str = None) -> str:
+    with get_cursor() as cursor:
+        cursor.execute("SELECT value FROM settings WHERE key = ?", (key,))
+        result = cursor.fetchone()
+    return result[0] if result else default
+
+def get_legacy_ticket_max_id() -> int:
+    """
+    Наибольший ID билета, выданного со ссылкой старого формата ticket_<id>.
+    """
+    return int(get_setting("legacy_ticket_max_id", "0"))
 
-    cursor.execute("""
+def add_used_ticket(ticket_id: int, wait: bool = True):
+    return _insert("""
         INSERT INTO used_tickets (ticket_id)
         VALUES (?)
-    """, (ticket_id,))
+    """, (ticket_id,), wait)
 
-    conn.commit()
-    conn.close()
-
-def get_all_used_tickets():
-    conn = sqlite3.connect('rout_bot.db')
-    cursor = conn.cursor()
+def check_in_ticket(ticket_id: int, wait: bool = True):
+    """
+    Атомарно отмечает билет использованным.
+    :param ticket_id: ID билета
+    :param wait: Дождаться коммита; при False возвращается Future с тем же результатом
+    :return: True, если билет отмечен этим вызовом, False, если он уже был использован
+    """
+    row_id = _insert("""
+        INSERT OR IGNORE INTO used_tickets (ticket_id)
+        VALUES (?)
+    """, (ticket_id,), wait)
+    if wait:
+        return row_id is not None
+    return _then(row_id, lambda value: value is not None)
 
-    cursor.execute("""
-        SELECT ticket_id FROM used_tickets
-    """)
+def check_in_tickets(ticket_ids: list) -> int:
+    """
+    Отмечает пачку билетов использованными одной транзакцией (режим входа).
+    :param ticket_ids: ID билетов
+    :return: Сколько билетов отмечено впервые
+    """
+    with get_cursor(commit=True) as cursor:
+        before = cursor.connection.total_changes
+        cursor.executemany("""
+            INSERT OR IGNORE INTO used_tickets (ticket_id)
+            VALUES (?)
+        """, [(ticket_id,) for ticket_id in ticket_ids])
+        return cursor.connection.total_changes - before
+
+def get_event_check_in_data(event_id: int) -> list:
+    """
+    Получает билеты мероприятия с владельцами и отметками об использовании для режима входа.
+    :param event_id: ID мероприятия
+    :return: Список кортежей (ID билета, ФИО владельца, использован ли билет)
+    """
+    with get_cursor() as cursor:
+        cursor.execute("""
+            SELECT t.id, u.full_name, ut.ticket_id IS NOT NULL
+            FROM tickets t
+            LEFT JOIN users u ON u.id = t.user_id
+            LEFT JOIN used_tickets ut ON ut.ticket_id = t.id
+            WHERE t.event_id = ?
+        """, (event_id,))
+        return [(row[0], row[1], bool(row[2])) for row in cursor.fetchall()]
 
-    used_tickets = cursor.fetchall()
-    conn.close()
+def get_all_used_tickets():
+    with get_cursor() as cursor:
+        cursor.execute("""
+            SELECT ticket_id FROM used_tickets
+        """)
+        used_tickets = cursor.fetchall()
 
     return list(used_tickets)
 
 
 def get_ticket(user_id, event_id):
-    conn = sqlite3.connect("rout_bot.db")
-    cursor = conn.cursor()
-
-    # Ищем билет по user_id и event_id
-    cursor.execute("""
-        SELECT id, qr_code FROM tickets
-        WHERE user_id = ? AND event_id = ?
-    """, (user_id, event_id))
-
-    row = cursor.fetchone()
-    conn.close()
+    with get_cursor() as cursor:
+        # Ищем билет по user_id и event_id
+        cursor.execute("""
+            SELECT id, qr_code FROM tickets
+            WHERE user_id = ? AND event_id = ?
+        """, (user_id, event_id))
+        row = cursor.fetchone()
 
     # Проверяем, найден ли билет
     if row:
@@ -490,24 +934,184 @@ def get_ticket(user_id, event_id):
 
 
 def get_ticket_by_id(ticket_id):
-    conn = sqlite3.connect("rout_bot.db")
-    cursor = conn.cursor()
+    with get_cursor() as cursor:
+        cursor.row_factory = Ticket.from_row
+        # Ищем билет по ticket_id; None, если билет не найден
+        cursor.execute("""
+            SELECT id, user_id, event_id, qr_code, NULL, file_id FROM tickets
+            WHERE id = ?
+        """, (ticket_id,))
+        return cursor.fetchone()
 
-    # Ищем билет по ticket_id
-    cursor.execute("""
-        SELECT id, user_id, event_id, qr_code FROM tickets
-        WHERE id = ?
-    """, (ticket_id,))
 
-    row = cursor.fetchone()
-    conn.close()
+def get_ticket_details(ticket_id: int) -> dict:
+    """
+    Получает билет вместе с владельцем, мероприятием и отметкой об использовании одним запросом.
+    :param ticket_id: ID билета
+    :return: Словарь с данными о билете или None, если билет не найден
+    """
+    with get_cursor() as cursor:
+        cursor.execute("""
+            SELECT t.id, t.user_id, t.event_id, t.qr_code, u.full_name, e.name, e.date,
+                   ut.ticket_id IS NOT NULL
+            FROM tickets t
+            LEFT JOIN users u ON u.id = t.user_id
+            LEFT JOIN events e ON e.id = t.event_id
+            LEFT JOIN used_tickets ut ON ut.ticket_id = t.id
+            WHERE t.id = ?
+        """, (ticket_id,))
+        row = cursor.fetchone()
 
-    # Проверяем, найден ли билет
     if row:
         return {
             "ticket_id": row[0],
             "user_id": row[1],
             "event_id": row[2],
-            "qr_code": row[3]
+            "qr_code": row[3],
+            "full_name": row[4],
+            "event_name": row[5],
+            "event_date": row[6],
+            "is_used": bool(row[7])
         }
-    return None
\ No newline at end of file
+    return None
+
+
+def issue_tickets_bulk(event_id: int, guests: list) -> tuple:
+    """
+    Выдаёт билеты списку гостей одной транзакцией: регистрирует недостающих
+    пользователей, создаёт билеты и записи о покупке мероприятия. Гостям, у которых
+    уже есть билет на мероприятие, новый не выдаётся.
+    :param event_id: ID мероприятия
+    :param guests: Список словарей с ключами id, full_name, university, phone_number
+    :return: (список выданных билетов, список ID гостей, у которых билет уже был)
+    """
+    tickets = []
+    already_issued = []
+    with get_cursor(commit=True) as cursor:
+        cursor.execute("BEGIN")
+        # Уже зарегистрированные пользователи сохраняют свои данные
+        cursor.executemany("""
+            INSERT OR IGNORE INTO users (id, full_name, university, phone_number)
+            VALUES (?, ?, ?, ?)
+        """, [(g["id"], g["full_name"], g["university"], g["phone_number"]) for g in guests])
+        for guest in guests:
+            # Проверка и вставка в одной транзакции: повторная загрузка того же файла билетов не выдаёт
+            cursor.execute("""
+                INSERT INTO tickets (user_id, event_id)
+                SELECT ?, ?
+                WHERE NOT EXISTS (SELECT 1 FROM tickets WHERE user_id = ? AND event_id = ?)
+            """, (guest["id"], event_id, guest["id"], event_id))
+            if cursor.rowcount:
+                tickets.append(Ticket(cursor.lastrowid, guest["id"], event_id))
+            else:
+                already_issued.append(guest["id"])
+        cursor.executemany("""
+            INSERT INTO user_events (user_id, event_id)
+            VALUES (?, ?)
+        """, [(ticket.user_id, event_id) for ticket in tickets])
+
+    for guest in guests:
+        _users_cache.invalidate(guest["id"])
+    return tickets, already_issued
+
+
+def get_event_attendees(event_id: int) -> list:
+    """
+    Получает список гостей мероприятия для выгрузки.
+    :param event_id: ID мероприятия
+    :return: Список кортежей (ID, ФИО, вуз, телефон)
+    """
+    with get_cursor() as cursor:
+        cursor.execute("""
+            SELECT u.id, u.full_name, u.university, u.phone_number
+            FROM users u
+            JOIN tickets t ON u.id = t.user_id
+            WHERE t.event_id = ?
+        """, (event_id,))
+        return cursor.fetchall()
+
+
+def create_broadcast(event_id: int, created_by: int) -> Broadcast:
+    """
+    Создаёт рассылку анонса мероприятия всем пользователям.
+    :param event_id: ID мероприятия
+    :param created_by: ID администратора, которому придёт отчёт
+    :return: Созданная рассылка или None, если рассылка этого мероприятия уже идёт
+    """
+    try:
+        with get_cursor(commit=True) as cursor:
+            cursor.execute("SELECT COUNT(*) FROM users")
+            total = cursor.fetchone()[0]
+            cursor.execute("""
+                INSERT INTO broadcasts (event_id, status, total, created_by, created_at)
+                VALUES (?, ?, ?, ?, ?)
+            """, (event_id, BROADCAST_RUNNING, total, created_by, int(time.time())))
+            broadcast_id = cursor.lastrowid
+    except sqlite3.IntegrityError:
+        # Уникальный индекс idx_broadcasts_running_event: повторное нажатие не запускает вторую рассылку
+        return None
+    return get_broadcast(broadcast_id)
+
+def get_broadcast(broadcast_id: int) -> Broadcast:
+    with get_cursor() as cursor:
+        cursor.row_factory = Broadcast.from_row
+        cursor.execute(f"SELECT {BROADCAST_COLUMNS} FROM broadcasts WHERE id = ?", (broadcast_id,))
+        return cursor.fetchone()
+
+def get_running_broadcasts() -> list:
+    """
+    Получает рассылки, которые не завершились (в том числе прерванные остановкой бота).
+    """
+    with get_cursor() as cursor:
+        cursor.row_factory = Broadcast.from_row
+        cursor.execute(f"SELECT {BROADCAST_COLUMNS} FROM broadcasts WHERE status = ? ORDER BY id",
+                       (BROADCAST_RUNNING,))
+        return cursor.fetchall()
+
+def get_broadcast_recipients(after_user_id: int, limit: int = 500) -> list:
+    """
+    Получает следующую порцию получателей рассылки по первичному ключу (keyset-пагинация):
+    каждая порция читается по индексу без OFFSET, и новые пользователи попадают в конец.
+    :param after_user_id: ID последнего обработанного пользователя
+    :param limit: Размер порции
+    :return: Список ID пользователей по возрастанию
+    """
+    with get_cursor() as cursor:
+        cursor.execute("SELECT id FROM users WHERE id > ? ORDER BY id LIMIT ?", (after_user_id, limit))
+        return [row[0] for row in cursor.fetchall()]
+
+def save_broadcast_progress(broadcast_id: int, last_user_id: int, delivered: int, blocked: int, failed: int,
+                            sent_ahead: list = None):
+    """
+    Сдвигает курсор рассылки и прибавляет результаты порции одной транзакцией.
+    :param sent_ahead: ID пользователей после курсора, которые уже получили анонс
+    """
+    with get_cursor(commit=True) as cursor:
+        cursor.execute("""
+            UPDATE broadcasts
+            SET last_user_id = ?, delivered = delivered + ?, blocked = blocked + ?, failed = failed + ?,
+                sent_ahead = ?
+            WHERE id = ?
+        """, (last_user_id, delivered, blocked, failed,
+              " ".join(map(str, sent_ahead)) if sent_ahead else None, broadcast_id))
+
+def finish_broadcast(broadcast_id: int, status: str = BROADCAST_DONE) -> Broadcast:
+    """
+    Завершает рассылку. Уже завершённая рассылка не меняется.
+    :return: Рассылка с итоговыми счётчиками
+    """
+    with get_cursor(commit=True) as cursor:
+        cursor.execute("""
+            UPDATE broadcasts SET status = ?, finished_at = ?
+            WHERE id = ? AND status = ?
+        """, (status, int(time.time()), broadcast_id, BROADCAST_RUNNING))
+    return get_broadcast(broadcast_id)
+
+
+if __name__ == "__main__":
+    # Ручной запуск: применить миграции и вывести планы частых запросов
+    logging.basicConfig(level=logging.INFO)
+    init_db()
+    print(f"Версия схемы: {get_schema_version()}")
+    for name, plan in explain_hot_queries().items():
+        print(f"{name}: {'; '.join(plan)}")
@@ -0,0 +1,67 @@
+"""
+Карточки мероприятий для каталога и анонсов.
+
+Карточка (фото и подпись) собирается один раз на версию мероприятия: записи
+активных мероприятий приходят из каталога в database.py и заменяются новыми
+объектами при его обновлении, поэтому карточка пересобирается только после
+изменения мероприятия. Фото передаётся по file_id и не загружается заново.
+"""
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+
+# Кнопка-счётчик страниц ничего не делает при нажатии
+CATALOG_NOOP = "catalog_noop"
+
+
+class EventCard:
+    __slots__ = ("event", "photo", "caption")
+
+    def __init__(self, event, photo, caption):
+        self.event = event
+        self.photo = photo
+        self.caption = caption
+
+
+# {ID мероприятия: карточка}
+_cards = {}
+
+
+def get_event_card(event) -> EventCard:
+    """
+    Получает карточку мероприятия из кэша или собирает её.
+    :param event: Мероприятие
+    :return: Карточка с file_id фото (или None) и подписью
+    """
+    card = _cards.get(event["id"])
+    if card is None or card.event is not event:
+        card = EventCard(
+            event,
+            event["photo"] or None,
+            f"{event['name']}\n\n{event['description']}\n\nЦена: {event['price']} руб."
+        )
+        _cards[event["id"]] = card
+    return card
+
+
+def forget_missing(event_ids):
+    """
+    Удаляет из кэша карточки мероприятий, которых нет среди event_ids.
+    """
+    for event_id in set(_cards) - set(event_ids):
+        del _cards[event_id]
+
+
+def get_catalog_keyboard(event_id: int, page: int, pages: int):
+    """
+    Клавиатура страницы каталога: покупка билета и листание.
+    :param event_id: ID мероприятия на странице
+    :param page: Номер страницы с нуля
+    :param pages: Число страниц
+    """
+    builder = InlineKeyboardBuilder()
+    builder.button(text="Купить", callback_data=f"order_{event_id}")
+    if pages > 1:
+        builder.button(text="◀️", callback_data=f"catalog_{(page - 1) % pages}")
+        builder.button(text=f"{page + 1} / {pages}", callback_data=CATALOG_NOOP)
+        builder.button(text="▶️", callback_data=f"catalog_{(page + 1) % pages}")
+        builder.adjust(1, 3)
+    return builder.as_markup()
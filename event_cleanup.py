@@ -0,0 +1,156 @@
+"""
+Фоновая очистка данных удалённых мероприятий.
+
+delete_event удаляет только строку мероприятия, а билеты, отметки о входе,
+покупки, отзывы и файлы билетов в qr_code/ удаляются здесь: порциями в
+пуле потоков базы, с передачей управления циклу событий между порциями.
+После очистки свободные страницы возвращаются через incremental_vacuum,
+и файл базы уменьшается. Данные мероприятий, удалённых раньше (в том числе
+до появления очистки), при запуске бота только перечисляются в логе и
+администраторам: их удаление необратимо, поэтому его подтверждает
+администратор (или включает EVENT_ORPHAN_SWEEP).
+"""
+import asyncio
+import glob
+import logging
+import os
+
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+
+import check_in
+from async_database import purge_event_chunk, get_orphan_event_ids, get_orphan_summary, incremental_vacuum
+
+logger = logging.getLogger(__name__)
+
+# Строк каждой таблицы в одной транзакции и пауза между порциями
+CHUNK_SIZE = 500
+CHUNK_PAUSE = 0.05
+
+# Кнопка подтверждения очистки данных ранее удалённых мероприятий
+ORPHAN_SWEEP_CONFIRM = "orphan_sweep_confirm"
+# Сколько мероприятий перечислять в сообщении администраторам
+REPORT_MAX_EVENTS = 30
+
+# Ссылки на фоновые задачи очистки, чтобы их не собрал сборщик мусора
+_tasks = set()
+# Идущая очистка ранее удалённых мероприятий
+_sweep = None
+
+
+def _remove_files(paths: list) -> int:
+    removed = 0
+    for path in paths:
+        try:
+            os.remove(path)
+            removed += 1
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning("Не удалось удалить файл билета %s: %s", path, e)
+    return removed
+
+
+async def cleanup_event(event_id: int) -> dict:
+    """
+    Удаляет все данные мероприятия, строку которого уже удалили.
+    :param event_id: ID мероприятия
+    :return: Словарь {таблица или files: удалено}
+    """
+    await check_in.close_session(event_id)
+
+    totals = {}
+    files = set()
+    while True:
+        deleted, chunk_files = await purge_event_chunk(event_id, CHUNK_SIZE)
+        if not deleted:
+            break
+        for table, count in deleted.items():
+            totals[table] = totals.get(table, 0) + count
+        files.update(chunk_files)
+        await asyncio.sleep(CHUNK_PAUSE)
+
+    # Копии новых билетов названы по ID билета и в базе не хранятся, а прежние копии
+    # (по пользователю и мероприятию) могли остаться без ссылки: все они находятся по шаблону
+    files.update(glob.glob(os.path.join("qr_code", f"ticket_*_{event_id}.png")))
+    totals["files"] = await asyncio.to_thread(_remove_files, sorted(files))
+
+    pages = await incremental_vacuum()
+    logger.info("Очищены данные мероприятия %s: %s, освобождено страниц базы: %s", event_id, totals, pages)
+    return totals
+
+
+def _run_in_background(coro):
+    task = asyncio.create_task(coro)
+    _tasks.add(task)
+    task.add_done_callback(_on_done)
+    return task
+
+
+def _on_done(task: asyncio.Task):
+    _tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Ошибка фоновой очистки мероприятия: %s", task.exception())
+
+
+def schedule_event_cleanup(event_id: int) -> asyncio.Task:
+    """
+    Запускает очистку данных удалённого мероприятия в фоне.
+    """
+    return _run_in_background(cleanup_event(event_id))
+
+
+async def report_orphans() -> dict:
+    """
+    Записывает в лог, какие данные ранее удалённых мероприятий удалит очистка.
+    :return: Словарь {ID мероприятия: {таблица: строк}}
+    """
+    summary = await get_orphan_summary()
+    for event_id, counts in summary.items():
+        logger.warning("Данные удалённого мероприятия %s ожидают очистки: %s", event_id, counts)
+    return summary
+
+
+def format_orphan_report(summary: dict) -> str:
+    # Сообщение Telegram ограничено по длине: перечисляются первые мероприятия
+    lines = [f"Мероприятие {event_id}: " + ", ".join(f"{table} {count}" for table, count in counts.items())
+             for event_id, counts in list(summary.items())[:REPORT_MAX_EVENTS]]
+    if len(summary) > REPORT_MAX_EVENTS:
+        lines.append(f"…и ещё {len(summary) - REPORT_MAX_EVENTS}")
+    return (
+        "🗑 В базе остались данные удалённых мероприятий:\n" + "\n".join(lines) +
+        "\n\nОчистка удалит эти билеты, покупки и отзывы без возможности восстановления."
+    )
+
+
+def get_orphan_sweep_keyboard():
+    builder = InlineKeyboardBuilder()
+    builder.button(text="🗑 Очистить", callback_data=ORPHAN_SWEEP_CONFIRM)
+    return builder.as_markup()
+
+
+async def sweep_orphans():
+    """
+    Очищает данные всех мероприятий, которых уже нет в базе.
+    """
+    for event_id in await get_orphan_event_ids():
+        await cleanup_event(event_id)
+
+
+def schedule_orphan_sweep() -> asyncio.Task:
+    """
+    Запускает очистку данных ранее удалённых мероприятий, если она ещё не идёт.
+    """
+    global _sweep
+    if _sweep is None or _sweep.done():
+        _sweep = _run_in_background(sweep_orphans())
+    return _sweep
+
+
+async def cancel_all():
+    """
+    Останавливает очистку при завершении бота; уже удалённые порции остаются удалёнными,
+    остаток будет очищен при следующем запуске.
+    """
+    for task in list(_tasks):
+        task.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
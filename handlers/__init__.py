@@ -4,6 +4,8 @@ from .buy_ticket import router as dealers_router
 from .feedback import router as promo_router
 from .personal_account import router as dice_router
 from .event_management import router as event_management_router
+from .bulk_tickets import router as bulk_tickets_router
+from .check_in_mode import router as check_in_mode_router
 from .unknown_commands import router as unknown_commands_router
 
 router = Router()
@@ -14,4 +16,6 @@ router.include_router(dealers_router)
 router.include_router(promo_router)
 router.include_router(dice_router)
 router.include_router(event_management_router)
+router.include_router(bulk_tickets_router)
+router.include_router(check_in_mode_router)
 router.include_router(unknown_commands_router)
\ No newline at end of file
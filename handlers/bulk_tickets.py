@@ -0,0 +1,218 @@
+from aiogram import Router, types, F
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+from async_database import get_events, get_event_by_id, issue_tickets_bulk
+from config import ADMINS, TICKET_PERSIST_TO_DISK
+from keyboards.main_menu import get_main_menu
+from ticket_renderer import render_ticket_image, save_ticket_in_background
+from ticket_delivery import get_ticket_link, get_ticket_path, send_ticket
+from io import BytesIO
+import asyncio
+import logging
+import time
+
+router = Router()
+
+logger = logging.getLogger(__name__)
+
+# Колонки файла в формате выгрузки «Список гостей.xlsx»
+GUEST_COLUMNS = {
+    "ID": "id",
+    "ФИО": "full_name",
+    "Университет": "university",
+    "Номер телефона": "phone_number"
+}
+
+# Сколько билетов отправляется одновременно и как часто обновляется сообщение о прогрессе
+SEND_CONCURRENCY = 10
+PROGRESS_INTERVAL = 2.0
+
+
+class BulkTicketStates(StatesGroup):
+    waiting_for_file = State()
+
+
+def parse_guest_file(data: bytes, filename: str) -> tuple:
+    """
+    Читает список гостей из xlsx или CSV.
+    :param data: Содержимое файла
+    :param filename: Имя файла (по расширению выбирается формат)
+    :return: (список гостей, номера строк без ID, номера строк с повтором ID)
+    """
+    # pandas нужен только для разбора файла, поэтому импортируется при первом вызове
+    import pandas as pd
+
+    if filename.lower().endswith(".csv"):
+        df = pd.read_csv(BytesIO(data), dtype=str, sep=None, engine="python")
+    else:
+        df = pd.read_excel(BytesIO(data), dtype=str)
+
+    df.columns = [str(column).strip() for column in df.columns]
+    missing = [column for column in ("ID", "ФИО") if column not in df.columns]
+    if missing:
+        raise ValueError(f"В файле нет колонок: {', '.join(missing)}")
+
+    guests = []
+    skipped = []
+    duplicates = []
+    seen = set()
+    # Нумерация строк как в Excel: первая строка — заголовок
+    for row_number, row in enumerate(df.fillna("").to_dict("records"), start=2):
+        raw_id = str(row["ID"]).strip().removesuffix(".0")
+        if not raw_id.isdigit():
+            skipped.append(row_number)
+            continue
+        # Гость, указанный в файле несколько раз, получает один билет
+        if int(raw_id) in seen:
+            duplicates.append(row_number)
+            continue
+        seen.add(int(raw_id))
+        guest = {field: str(row.get(column, "")).strip() for column, field in GUEST_COLUMNS.items()}
+        guest["id"] = int(raw_id)
+        guest["phone_number"] = guest["phone_number"].removesuffix(".0")
+        guests.append(guest)
+    return guests, skipped, duplicates
+
+
+@router.message(F.text == "🎟 Выдать билеты по списку")
+async def bulk_tickets(message: types.Message, state: FSMContext):
+    if message.from_user.id not in ADMINS:
+        return
+
+    events = await get_events()
+    if not events:
+        await message.answer("Нет доступных мероприятий.")
+        return
+
+    builder = InlineKeyboardBuilder()
+    for event in events:
+        builder.button(text=event["name"], callback_data=f"bulk_event_{event['id']}")
+    builder.adjust(1)  # По одной кнопке в строке
+
+    await message.answer("Выберите мероприятие, на которое нужно выдать билеты:", reply_markup=builder.as_markup())
+
+
+@router.callback_query(F.data.startswith("bulk_event_"))
+async def bulk_tickets_event(callback: types.CallbackQuery, state: FSMContext):
+    if callback.from_user.id not in ADMINS:
+        await callback.answer()
+        return
+
+    event_id = int(callback.data.split("_")[-1])
+    await state.update_data(event_id=event_id)
+    await callback.message.delete()
+
+    await callback.message.answer(
+        "Отправьте список гостей файлом xlsx или CSV с колонками "
+        "«ID», «ФИО», «Университет», «Номер телефона» (как в выгрузке списка гостей)."
+    )
+    await state.set_state(BulkTicketStates.waiting_for_file)
+    await callback.answer()
+
+
+@router.message(BulkTicketStates.waiting_for_file, F.document)
+async def process_guest_file(message: types.Message, state: FSMContext):
+    if message.from_user.id not in ADMINS:
+        await state.clear()
+        return
+
+    user_data = await state.get_data()
+    await state.clear()
+
+    event = await get_event_by_id(user_data.get("event_id"))
+    if not event:
+        await message.answer("Мероприятие не найдено.")
+        return
+    if not event.get("qr_template"):
+        await message.answer("Ошибка: шаблон QR-кода не найден.")
+        return
+
+    # Загружаем файл в память и разбираем его вне цикла событий
+    file = await message.bot.get_file(message.document.file_id)
+    file_bytes = await message.bot.download_file(file.file_path)
+    try:
+        guests, skipped, duplicates = await asyncio.to_thread(
+            parse_guest_file, file_bytes.getvalue(), message.document.file_name or ""
+        )
+    except Exception as e:
+        await message.answer(f"Не удалось прочитать файл: {e}")
+        return
+
+    if not guests:
+        await message.answer("В файле нет гостей с заполненным ID.")
+        return
+
+    # Пользователи, билеты и записи о покупке создаются одной транзакцией;
+    # гости, у которых уже есть билет (например, при повторной загрузке файла), пропускаются
+    tickets, already_issued = await issue_tickets_bulk(event["id"], guests)
+    if not tickets:
+        await message.answer(
+            f"У всех гостей из файла уже есть билеты на «{event['name']}».",
+            reply_markup=get_main_menu(message.from_user.id)
+        )
+        return
+
+    progress = await message.answer(f"Выдано билетов: {len(tickets)}. Отправлено: 0 из {len(tickets)}")
+    delivered, failed = await deliver_tickets(message.bot, event, tickets, progress)
+
+    report = (
+        f"Готово! Билеты на «{event['name']}»\n\n"
+        f"Выдано: {len(tickets)}\n"
+        f"Доставлено: {delivered}\n"
+        f"Не доставлено: {len(failed)}"
+    )
+    if failed:
+        report += f"\nID без доставки: {', '.join(map(str, failed[:50]))}"
+    if already_issued:
+        report += f"\nУже были билеты у ID: {', '.join(map(str, already_issued[:50]))}"
+    if duplicates:
+        report += f"\nПропущены повторы ID в строках: {', '.join(map(str, duplicates[:50]))}"
+    if skipped:
+        report += f"\nПропущены строки без ID: {', '.join(map(str, skipped[:50]))}"
+    await message.answer(report, reply_markup=get_main_menu(message.from_user.id))
+
+
+async def deliver_tickets(bot, event, tickets: list, progress: types.Message) -> tuple:
+    """
+    Рисует билеты параллельно в пуле процессов и рассылает их, обновляя сообщение о прогрессе.
+    :return: (число доставленных билетов, список ID пользователей, которым билет не доставлен)
+    """
+    sending = asyncio.Semaphore(SEND_CONCURRENCY)
+    caption = f"Ваш билет на мероприятие: {event['name']}"
+
+    async def issue(ticket) -> bool:
+        # Ошибка одного гостя (например, он не запускал бота) не прерывает выдачу остальным
+        try:
+            link = get_ticket_link(ticket["id"], ticket["event_id"])
+            image = await render_ticket_image(link, event["qr_template"])
+            if TICKET_PERSIST_TO_DISK:
+                save_ticket_in_background(get_ticket_path(ticket["id"], ticket["event_id"]), image)
+            async with sending:
+                await send_ticket(bot, ticket["user_id"], ticket, caption=caption, image=image)
+            return True
+        except Exception as e:
+            logger.warning("Билет %s не доставлен пользователю %s: %s", ticket["id"], ticket["user_id"], e)
+            failed.append(ticket["user_id"])
+            return False
+
+    delivered = 0
+    failed = []
+    last_update = time.monotonic()
+
+    for done in asyncio.as_completed([issue(ticket) for ticket in tickets]):
+        if await done:
+            delivered += 1
+
+        now = time.monotonic()
+        if now - last_update >= PROGRESS_INTERVAL:
+            last_update = now
+            try:
+                await progress.edit_text(
+                    f"Выдано билетов: {len(tickets)}. "
+                    f"Отправлено: {delivered + len(failed)} из {len(tickets)}"
+                )
+            except Exception as e:
+                logger.warning("Не удалось обновить прогресс выдачи билетов: %s", e)
+
+    return delivered, failed
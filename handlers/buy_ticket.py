@@ -3,21 +3,22 @@ from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from keyboards.main_menu import get_main_menu
-from database import get_ticket, add_ticket, get_payment_link, add_user_event, get_user, get_active_events, get_event_by_id, add_admin_notification, get_admin_notifications, delete_admin_notifications
-from config import ADMINS
+from async_database import add_ticket, get_payment_link, add_user_event, get_user, get_active_events, get_active_event, get_event_by_id, add_admin_notifications, get_admin_notifications, delete_admin_notifications
+from config import TICKET_PERSIST_TO_DISK
+from ticket_renderer import render_ticket_image, save_ticket_in_background
+from ticket_delivery import get_ticket_link, get_ticket_path, send_ticket
+from models import Ticket
+from admin_notify import notify_admins
+from event_cards import get_event_card, get_catalog_keyboard, forget_missing, CATALOG_NOOP
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import InputMediaPhoto
 from aiogram.types import ContentType
-import qrcode
-from io import BytesIO
 from aiogram import types
-from aiogram.types import InputFile
-import time
-import segno
-from PIL import Image
-import os
+import asyncio
 from aiogram.types import FSInputFile
 
 async def generate_and_send_ticket(user_id: int, event_id: int, callback: types.CallbackQuery):
-    event = get_event_by_id(event_id)
+    event = await get_event_by_id(event_id)
     if not event:
         await callback.message.answer("Ошибка: мероприятие не найдено.")
         return
@@ -27,63 +28,34 @@ async def generate_and_send_ticket(user_id: int, event_id: int, callback: types.
         await callback.message.answer("Ошибка: шаблон QR-кода не найден.")
         return
 
-    ticket_filename = f"qr_code/ticket_{user_id}_{event_id}.png"
-    # Сохраняем билет в базу данных
-    add_ticket(user_id, event_id, ticket_filename)
-    ticket_id = get_ticket(user_id, event_id)
-    bot_username = 'test_bigd_club_bot'
-    # Генерация QR-кода
-    qrcode = segno.make_qr(f"https://t.me/{bot_username}?start=ticket_{ticket_id}", error='L')
-    qrcode.save(
-        "qrcode.png",
-        scale=5,
-        dark="#FFFFFF",  # Белый цвет для QR-кода
-        light="#0007BA",  # Фон QR-кода
-        border=0  # Уменьшаем размер рамки
-    )
-
-    # Открываем QR-код
-    qr_image = Image.open("qrcode.png").convert("RGBA")
+    # Сохраняем билет в базу данных; копия на диске называется по ID билета
+    ticket_id = await add_ticket(user_id, event_id, None)
+    ticket_filename = get_ticket_path(ticket_id, event_id)
+    ticket = Ticket(ticket_id, user_id, event_id, ticket_filename, event['name'])
 
-    # Открываем шаблон QR-кода с диска
+    # QR-код и билет рисуются в памяти в пуле процессов, не блокируя остальных пользователей
     try:
-        background = Image.open(event['qr_template']).convert("RGBA")
+        ticket_image = await render_ticket_image(get_ticket_link(ticket_id, event_id), event['qr_template'])
     except Exception as e:
-        await callback.message.answer(f"Ошибка при загрузке шаблона QR-кода: {e}")
+        await callback.message.answer(f"Ошибка при генерации билета: {e}")
         return
 
-    # Координаты выреза для QR-кода
-    cutout_box = (259, 559, 479, 779)
-    cutout = background.crop(cutout_box)
-
-    # Изменяем размер QR-кода и вставляем его в вырез
-    qr_resized = qr_image.resize(cutout.size)
-    qr_mask = qr_resized.convert("L").point(lambda x: 255 if x > 0 else 0)
-    background.paste(qr_resized, cutout_box, qr_mask)
-
-    # Сохраняем итоговое изображение
-
-    background.save(ticket_filename, format="PNG")
+    # Копия на диске пишется в фоне и нужна, только если Telegram отклонит сохранённый file_id
+    if TICKET_PERSIST_TO_DISK:
+        save_ticket_in_background(ticket_filename, ticket_image)
 
-    # Отправляем билет пользователю
+    # Отправляем билет пользователю и запоминаем file_id для повторных показов
     try:
-        # Используем путь к файлу для создания InputFile
-        photo = FSInputFile(ticket_filename)
-        await callback.bot.send_photo(
-            chat_id=user_id,
-            photo=photo,
-            caption=f"Ваш билет на мероприятие: {event['name']}"
+        await send_ticket(
+            callback.bot, user_id, ticket,
+            caption=f"Ваш билет на мероприятие: {event['name']}",
+            image=ticket_image
         )
     except Exception as e:
         await callback.message.answer(f"Ошибка при отправке билета: {e}")
         return
 
 
-
-    # Удаляем временные файлы
-    os.remove("qrcode.png")
-
-
 router = Router()
 
 class RegistrationStates(StatesGroup):
@@ -98,13 +70,13 @@ class PaymentStates(StatesGroup):
 @router.message(F.text == "Купить билет")
 async def buy_ticket(message: types.Message, state: FSMContext):
     # Проверяем, есть ли активные мероприятия
-    active_events = get_active_events()  # Функция для получения активных мероприятий
+    active_events = await get_active_events()  # Функция для получения активных мероприятий
     if not active_events:
         await message.answer(f"Следите за обновлениями в нашем [Telegram-канале](https://t.me/routevents).", reply_markup=get_main_menu(message.chat.id), parse_mode="Markdown")
         return
 
     # Проверяем, зарегистрирован ли пользователь
-    user = get_user(message.from_user.id)  # Функция для получения данных пользователя
+    user = await get_user(message.from_user.id)  # Функция для получения данных пользователя
     if not user:
         await message.answer("Для покупки билета необходимо зарегистрироваться.")
         await message.answer("Укажите ваше имя и фамилию:")
@@ -113,32 +85,68 @@ async def buy_ticket(message: types.Message, state: FSMContext):
         await show_events(message)
 
 async def show_events(message: types.Message):
-    # Показываем список активных мероприятий
-    active_events = get_active_events()
-    for event in active_events:
-        # Создаем inline-кнопку "Купить"
-        builder = InlineKeyboardBuilder()
-        builder.button(text="Купить", callback_data=f"order_{event['id']}")
-
-        # Проверяем, есть ли фото у мероприятия
-        if event.get("photo"):
-            # Если фото есть, отправляем его с кнопкой
-            await message.answer_photo(
-                photo=event["photo"],  # Используем file_id или URL
-                caption=f"{event['name']}\n\n{event['description']}\n\nЦена: {event['price']} руб.",
-                reply_markup=builder.as_markup()
-            )
+    # Каталог активных мероприятий показывается одним сообщением с листанием
+    await show_catalog_page(message, 0)
+
+async def show_catalog_page(message: types.Message, page: int, edit: bool = False) -> bool:
+    """
+    Показывает страницу каталога активных мероприятий.
+    :param message: Сообщение, на которое отвечаем, или сообщение каталога при edit=True
+    :param page: Номер страницы с нуля
+    :param edit: Изменить сообщение каталога на месте вместо отправки нового
+    :return: False, если активных мероприятий нет
+    """
+    active_events = await get_active_events()
+    if not active_events:
+        return False
+    forget_missing(event.id for event in active_events)
+
+    # Каталог мог измениться, пока сообщение было открыто
+    page = min(page, len(active_events) - 1)
+    card = get_event_card(active_events[page])
+    markup = get_catalog_keyboard(card.event.id, page, len(active_events))
+
+    if edit and bool(card.photo) == bool(message.photo):
+        # Один запрос на перелистывание: фото меняется по file_id без повторной загрузки
+        if card.photo:
+            await message.edit_media(InputMediaPhoto(media=card.photo, caption=card.caption), reply_markup=markup)
         else:
-            # Если фото нет, отправляем только текст с кнопкой
-            await message.answer(
-                f"{event['name']}\n\n{event['description']}\n\nЦена: {event['price']} руб.",
-                reply_markup=builder.as_markup()
-            )
+            await message.edit_text(card.caption, reply_markup=markup)
+        return True
+
+    if edit:
+        # Сообщение с фото нельзя превратить в текстовое и наоборот
+        await message.delete()
+    if card.photo:
+        await message.answer_photo(photo=card.photo, caption=card.caption, reply_markup=markup)
+    else:
+        await message.answer(card.caption, reply_markup=markup)
+    return True
+
+@router.callback_query(F.data.startswith("catalog_"))
+async def turn_catalog_page(callback: types.CallbackQuery):
+    if callback.data == CATALOG_NOOP:
+        await callback.answer()
+        return
+
+    page = int(callback.data.split("_")[1])
+    try:
+        shown = await show_catalog_page(callback.message, page, edit=True)
+    except TelegramBadRequest as e:
+        # Повторное нажатие на ту же страницу
+        if "message is not modified" not in str(e):
+            raise
+        shown = True
+
+    if not shown:
+        await callback.answer("Сейчас нет мероприятий в продаже.", show_alert=True)
+        return
+    await callback.answer()
 
 @router.callback_query(F.data.startswith("order_"))
 async def process_buy_ticket(callback: types.CallbackQuery, state: FSMContext):
     event_id = int(callback.data.split("_")[1])  # Извлекаем ID мероприятия
-    event = next((e for e in get_active_events() if e["id"] == event_id), None)
+    event = await get_active_event(event_id)
 
     if not event:
         await callback.message.answer("Мероприятие не найдено.")
@@ -162,7 +170,7 @@ async def process_buy_ticket(callback: types.CallbackQuery, state: FSMContext):
 @router.callback_query(F.data.startswith("buy_"))
 async def process_buy_ticket(callback: types.CallbackQuery, state: FSMContext):
     event_id = int(callback.data.split("_")[1])  # Извлекаем ID мероприятия
-    event = next((e for e in get_active_events() if e["id"] == event_id), None)
+    event = await get_active_event(event_id)
 
     if not event:
         await callback.message.answer("Мероприятие не найдено.")
@@ -181,7 +189,7 @@ async def process_buy_ticket(callback: types.CallbackQuery, state: FSMContext):
     # Отправляем сообщение с инструкцией по оплате
     await callback.message.answer(
         f"Оплата билета происходит переводом через Т-банк пожертвования.\n\n"
-        f"Необходимо перейти по [ссылке]({get_payment_link()}), и пожертвовать {event['price']} руб.",
+        f"Необходимо перейти по [ссылке]({await get_payment_link()}), и пожертвовать {event['price']} руб.",
         reply_markup=builder.as_markup(),
         parse_mode="Markdown"
     )
@@ -215,7 +223,7 @@ async def payment_confirmed(callback: types.CallbackQuery, state: FSMContext):
 async def process_receipt(message: types.Message, state: FSMContext):
     user_data = await state.get_data()
     event_id = user_data.get("event_id")
-    user = get_user(message.from_user.id)
+    user = await get_user(message.from_user.id)
 
     if not event_id or not user:
         await message.answer("Ошибка: данные не найдены. Попробуйте снова.")
@@ -223,7 +231,7 @@ async def process_receipt(message: types.Message, state: FSMContext):
         return
 
     # Получаем данные о мероприятии
-    event = get_event_by_id(event_id)
+    event = await get_event_by_id(event_id)
     if not event:
         await message.answer("Мероприятие не найдено.")
         await state.clear()
@@ -252,34 +260,49 @@ async def process_receipt(message: types.Message, state: FSMContext):
     receipt_type = data.get('receipt_type')
     receipt_file_id = data.get('receipt_file_id')
 
-    for admin_id in ADMINS:
+    caption = (
+        f"Новый платеж!\n\n"
+        f"Мероприятие: {event['name']}\n"
+        f"Покупатель: {user['full_name']} (@{message.from_user.username})\n"
+        f"Сумма: {event['price']} руб."
+    )
+
+    async def send_receipt(admin_id):
         if receipt_type == 'photo':
             # Отправка фото
-            sent_message = await message.bot.send_photo(
-                chat_id=admin_id,
-                photo=receipt_file_id,
-                caption=f"Новый платеж!\n\n"
-                        f"Мероприятие: {event['name']}\n"
-                        f"Покупатель: {user['full_name']} (@{message.from_user.username})\n"
-                        f"Сумма: {event['price']} руб.",
-                reply_markup=builder.as_markup()
-            )
-        elif receipt_type == 'document':
-            # Отправка файла
-            sent_message = await message.bot.send_document(
-                chat_id=admin_id,
-                document=receipt_file_id,
-                caption=f"Новый платеж!\n\n"
-                        f"Мероприятие: {event['name']}\n"
-                        f"Покупатель: {user['full_name']} (@{message.from_user.username})\n"
-                        f"Сумма: {event['price']} руб.",
-                reply_markup=builder.as_markup()
+            return await message.bot.send_photo(
+                chat_id=admin_id, photo=receipt_file_id, caption=caption, reply_markup=builder.as_markup()
             )
+        # Отправка файла
+        return await message.bot.send_document(
+            chat_id=admin_id, document=receipt_file_id, caption=caption, reply_markup=builder.as_markup()
+        )
 
-        add_admin_notification(admin_id, sent_message.message_id, message.from_user.id)
+    # Квитанция уходит всем администраторам одновременно, ID сообщений сохраняются одной записью
+    sent_messages = await notify_admins(send_receipt)
+    await add_admin_notifications([
+        (admin_id, sent_message.message_id, message.from_user.id)
+        for admin_id, sent_message in sent_messages.items()
+    ])
 
     await state.set_state(PaymentStates.waiting_for_admin_confirmation)
 
+async def remove_admin_notifications(bot, user_id: int):
+    """
+    Удаляет у всех администраторов уведомления о платеже пользователя.
+    """
+    async def remove(admin_id):
+        message_ids = await get_admin_notifications(admin_id)
+        for message_id in message_ids:
+            if user_id == message_id['user_id']:
+                try:
+                    await bot.delete_message(admin_id, message_id['message_id'])
+                except Exception as e:
+                    print(f"Не удалось удалить сообщение у администратора {admin_id}: {e}")
+        await delete_admin_notifications(admin_id, user_id)
+
+    await notify_admins(remove)
+
 # Обработка подтверждения оплаты админом
 @router.callback_query(F.data.startswith("confirm_payment_"))
 async def confirm_payment(callback: types.CallbackQuery, state: FSMContext):
@@ -289,27 +312,19 @@ async def confirm_payment(callback: types.CallbackQuery, state: FSMContext):
     event_id = int(event_id)
 
     # Удаляем уведомления у администраторов
-    for admin_id in ADMINS:
-        message_ids = get_admin_notifications(admin_id)
-        for message_id in message_ids:
-            if user_id == message_id['user_id']:
-                try:
-                    await callback.bot.delete_message(admin_id, message_id['message_id'])
-                except Exception as e:
-                    print(f"Не удалось удалить сообщение у администратора {admin_id}: {e}")
-                delete_admin_notifications(admin_id, user_id)
+    await remove_admin_notifications(callback.bot, user_id)
 
     # Уведомляем админа, который подтвердил оплату
     await callback.message.answer("Вы успешно подтвердили оплату.")
 
-    add_user_event(user_id=user_id, event_id=event_id)
+    await add_user_event(user_id=user_id, event_id=event_id)
     # Уведомляем пользователя
     await callback.bot.send_message(
         chat_id=user_id,
         text="Ваш платеж подтвержден! Билет успешно куплен."
     )
 
-    time.sleep(1.5)
+    await asyncio.sleep(1.5)
 
     await generate_and_send_ticket(
         user_id=user_id,
@@ -331,15 +346,7 @@ async def disable_payment(callback: types.CallbackQuery, state: FSMContext):
     event_id = int(event_id)
 
     # Удаляем уведомления у администраторов
-    for admin_id in ADMINS:
-        message_ids = get_admin_notifications(admin_id)
-        for message_id in message_ids:
-            if user_id == message_id['user_id']:
-                try:
-                    await callback.bot.delete_message(admin_id, message_id['message_id'])
-                except Exception as e:
-                    print(f"Не удалось удалить сообщение у администратора {admin_id}: {e}")
-                delete_admin_notifications(admin_id, user_id)
+    await remove_admin_notifications(callback.bot, user_id)
 
     # Уведомляем админа, который подтвердил оплату
     await callback.message.answer("Вы успешно отклонили оплату.")
@@ -0,0 +1,109 @@
+from aiogram import Router, types, F
+from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+from async_database import get_events
+from config import ADMINS
+from keyboards.main_menu import get_main_menu
+from ticket_tokens import parse_ticket_payload
+from rate_limiter import send_priority, PRIORITY_HIGH
+import check_in
+
+router = Router()
+
+STOP_BUTTON = "⏹ Завершить режим входа"
+
+SCAN_REPLIES = {
+    check_in.CHECKED_IN: "✅ Вход: {holder}",
+    check_in.ALREADY_USED: "❌ Билет уже использован: {holder}",
+    check_in.WRONG_EVENT: "❌ Билет на другое мероприятие",
+    check_in.NOT_FOUND: "❌ Билет не найден или недействителен."
+}
+
+
+def get_check_in_keyboard():
+    return ReplyKeyboardMarkup(keyboard=[[KeyboardButton(text=STOP_BUTTON)]], resize_keyboard=True)
+
+
+def format_counts(session: check_in.CheckInSession) -> str:
+    return f"Прошли: {session.checked_in} из {session.sold}"
+
+
+async def answer_scan(message: types.Message, session: check_in.CheckInSession, payload: str):
+    """
+    Отвечает на скан в режиме входа одним сообщением: результат проверки и счётчики.
+    """
+    # Сессия могла остаться у пользователя, которого уже нет среди администраторов
+    if message.from_user.id not in ADMINS:
+        return
+
+    ticket = parse_ticket_payload(payload)
+    if ticket is None:
+        status, holder = check_in.NOT_FOUND, None
+    elif ticket[1] is not None and ticket[1] != session.event_id:
+        # Подписанный токен содержит мероприятие: чужой билет отсекается без базы
+        status, holder = check_in.WRONG_EVENT, None
+    else:
+        status, holder = await session.check_in(ticket[0])
+
+    # Ответы на входе не должны стоять в очереди за рассылками
+    with send_priority(PRIORITY_HIGH):
+        await message.answer(f"{SCAN_REPLIES[status].format(holder=holder)}\n{format_counts(session)}")
+
+
+@router.message(F.text == "🚪 Режим входа")
+async def check_in_mode(message: types.Message):
+    if message.from_user.id not in ADMINS:
+        return
+
+    events = await get_events()
+    if not events:
+        await message.answer("Нет доступных мероприятий.")
+        return
+
+    builder = InlineKeyboardBuilder()
+    for event in events:
+        builder.button(text=event["name"], callback_data=f"checkin_event_{event['id']}")
+    builder.adjust(1)  # По одной кнопке в строке
+
+    await message.answer("Выберите мероприятие, на входе которого вы проверяете билеты:",
+                         reply_markup=builder.as_markup())
+
+
+@router.callback_query(F.data.startswith("checkin_event_"))
+async def check_in_event(callback: types.CallbackQuery):
+    if callback.from_user.id not in ADMINS:
+        await callback.answer()
+        return
+
+    event_id = int(callback.data.split("_")[-1])
+    await callback.message.delete()
+
+    session = await check_in.start_admin_session(callback.from_user.id, event_id)
+    if session is None:
+        await callback.message.answer("Мероприятие не найдено.")
+        await callback.answer()
+        return
+
+    await callback.message.answer(
+        f"🚪 Режим входа на «{session.event_name}» включён.\n"
+        f"Сканируйте QR-коды билетов: каждый билет отмечается при первом скане.\n"
+        f"{format_counts(session)}",
+        reply_markup=get_check_in_keyboard()
+    )
+    await callback.answer()
+
+
+@router.message(F.text == STOP_BUTTON)
+async def stop_check_in(message: types.Message):
+    if message.from_user.id not in ADMINS:
+        return
+
+    session = await check_in.stop_admin_session(message.from_user.id)
+    if session is None:
+        await message.answer("Режим входа не был включён.", reply_markup=get_main_menu(message.from_user.id))
+        return
+
+    await message.answer(
+        f"Режим входа на «{session.event_name}» завершён.\n{format_counts(session)}",
+        reply_markup=get_main_menu(message.from_user.id)
+    )
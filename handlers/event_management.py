@@ -2,12 +2,14 @@ from aiogram import Router, types, F
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-from database import get_events, add_event, update_event, delete_event, update_payment_link, add_payment_link
+from async_database import get_events, get_active_events, get_event_by_id, add_event, update_event, delete_event, update_payment_link, add_payment_link, run_db
+from database import get_event_attendees
 from keyboards.main_menu import get_main_menu
+from ticket_renderer import invalidate_template
+from event_cleanup import schedule_event_cleanup, schedule_orphan_sweep, ORPHAN_SWEEP_CONFIRM
+from config import ADMINS
+import broadcast
 from datetime import datetime
-from io import BytesIO
-import pandas as pd
-import sqlite3
 from aiogram.types import FSInputFile
 
 
@@ -50,27 +52,16 @@ class EventManagementStates(StatesGroup):
 
 
 def export_event_attendees_to_excel(event_id: int, output_file: str = "Список гостей.xlsx"):
-    # Подключаемся к базе данных
-    conn = sqlite3.connect("rout_bot.db")
-    cursor = conn.cursor()
-
-    # Запрос для получения данных о пользователях, купивших билеты на мероприятие
-    query = """
-        SELECT u.full_name, u.university, u.phone_number
-        FROM users u
-        JOIN tickets t ON u.id = t.user_id
-        WHERE t.event_id = ?
-    """
-    cursor.execute(query, (event_id,))
-    attendees = cursor.fetchall()
-
-    # Закрываем соединение с базой данных
-    conn.close()
+    # Получаем данные о пользователях, купивших билеты на мероприятие
+    attendees = get_event_attendees(event_id)
 
     # Если данные найдены, создаём DataFrame и сохраняем в Excel
     if attendees:
+        # pandas нужен только для выгрузки, поэтому импортируется при первом вызове
+        import pandas as pd
+
         # Создаём DataFrame из данных
-        df = pd.DataFrame(attendees, columns=["ФИО", "Университет", "Номер телефона"])
+        df = pd.DataFrame(attendees, columns=["ID", "ФИО", "Университет", "Номер телефона"])
 
         # Сохраняем DataFrame в Excel-файл
         df.to_excel(output_file, index=False)
@@ -81,7 +72,7 @@ def export_event_attendees_to_excel(event_id: int, output_file: str = "Спис
 
 @router.message(F.text == "📄 Получить список гостей")
 async def get_guests(message: types.Message, state: FSMContext):
-    events = get_events()
+    events = await get_events()
     if not events:
         await message.answer("Нет доступных мероприятий.")
         return
@@ -101,7 +92,8 @@ async def get_guests_event(callback: types.CallbackQuery, state: FSMContext):
     event_id = int(callback.data.split("_")[-1])
     await callback.message.delete()
 
-    export_event_attendees_to_excel(event_id)
+    # Выгрузка и запись xlsx выполняются вне цикла событий
+    await run_db(export_event_attendees_to_excel, event_id)
 
     await callback.message.answer_document(
         document=FSInputFile("Список гостей.xlsx")
@@ -119,7 +111,7 @@ async def manage_payment_link(message: types.Message, state: FSMContext):
 
 @router.message(EventManagementStates.waiting_payment_link)
 async def update_payment_link_f(message: types.Message, state: FSMContext):
-    update_payment_link(message.text)
+    await update_payment_link(message.text)
     await message.answer("Ссылка успешно обновлена!")
     await state.clear()
 
@@ -201,6 +193,7 @@ async def process_event_qr_template(message: types.Message, state: FSMContext):
     qr_template_path = f"qr_templates/template_{message.from_user.id}.png"
     with open(qr_template_path, "wb") as f:
         f.write(file_bytes.getvalue())
+    invalidate_template(qr_template_path)
 
     await state.update_data(qr_template=qr_template_path)
     await message.answer("Введите ссылку на фотоальбом (или слово 'Нет'):")
@@ -214,7 +207,7 @@ async def process_event_photo_album_link(message: types.Message, state: FSMConte
     # Сохраняем мероприятие в базу данных
     event_data = await state.get_data()
     print(event_data)
-    add_event(**event_data)
+    await add_event(**event_data)
 
     await message.answer("Мероприятие успешно добавлено!", reply_markup=get_main_menu(message.from_user.id))
     await state.clear()
@@ -222,7 +215,7 @@ async def process_event_photo_album_link(message: types.Message, state: FSMConte
 # Обработка кнопки "Редактировать мероприятие"
 @router.callback_query(F.data == "edit_event")
 async def edit_event_start(callback: types.CallbackQuery, state: FSMContext):
-    events = get_events()
+    events = await get_events()
     if not events:
         await callback.message.answer("Нет доступных мероприятий для редактирования.")
         await callback.answer()
@@ -289,7 +282,7 @@ async def process_new_sale_status(message: types.Message, state: FSMContext):
         return
 
     # Обновляем статус продаж в базе данных
-    update_event(event_id, is_sale_active=new_sale_status)
+    await update_event(event_id, is_sale_active=new_sale_status)
 
     await message.answer(f"Статус продаж успешно обновлен на {'активен' if new_sale_status else 'неактивен'}!", reply_markup=get_main_menu(message.from_user.id))
     await state.clear()
@@ -321,9 +314,10 @@ async def process_new_qr(message: types.Message, state: FSMContext):
         qr_template_path = f"qr_templates/template_{event_id}.png"
         with open(qr_template_path, "wb") as f:
             f.write(file_bytes.getvalue())
+        invalidate_template(qr_template_path)
 
         # Обновляем шаблон QR-кода мероприятия в базе данных
-        update_event(event_id, qr_template=qr_template_path)
+        await update_event(event_id, qr_template=qr_template_path)
 
         await message.answer("Шаблон QR-кода успешно обновлен!", reply_markup=get_main_menu(message.from_user.id))
     except Exception as e:
@@ -351,7 +345,7 @@ async def process_new_photo(message: types.Message, state: FSMContext):
     new_photo = message.photo[-1].file_id  # Получаем file_id новой фотографии
 
     # Обновляем фото мероприятия в базе данных
-    update_event(event_id, photo=new_photo)
+    await update_event(event_id, photo=new_photo)
 
     await message.answer("Фото мероприятия успешно обновлено!", reply_markup=get_main_menu(message.from_user.id))
     await state.clear()
@@ -385,7 +379,7 @@ async def process_new_value(message: types.Message, state: FSMContext):
     new_value = message.text
 
     # Обновляем мероприятие в базе данных
-    update_event(event_id, **{parameter.replace("edit_", ""): new_value})
+    await update_event(event_id, **{parameter.replace("edit_", ""): new_value})
 
     await message.answer(f"Параметр '{choice_name[parameter.replace('edit_', '')]}' успешно обновлен!", reply_markup=get_main_menu(message.from_user.id))
     await state.clear()
@@ -393,7 +387,7 @@ async def process_new_value(message: types.Message, state: FSMContext):
 # Обработка удаления мероприятия
 @router.callback_query(F.data == "delete_event")
 async def delete_event_start(callback: types.CallbackQuery):
-    events = get_events()
+    events = await get_events()
     if not events:
         await callback.message.answer("Нет доступных мероприятий для удаления.")
         await callback.answer()
@@ -409,7 +403,115 @@ async def delete_event_start(callback: types.CallbackQuery):
 
 @router.callback_query(F.data.startswith("delete_event_"))
 async def delete_event_confirm(callback: types.CallbackQuery):
+    if callback.from_user.id not in ADMINS:
+        await callback.answer()
+        return
+
     event_id = int(callback.data.split("_")[-1])
-    delete_event(event_id)
+    if await delete_event(event_id):
+        # Билеты, покупки, отзывы и файлы билетов удаляются в фоне порциями
+        schedule_event_cleanup(event_id)
     await callback.message.answer("Мероприятие успешно удалено!", reply_markup=get_main_menu(callback.from_user.id))
-    await callback.answer()
\ No newline at end of file
+    await callback.answer()
+
+# Подтверждение очистки данных мероприятий, удалённых раньше
+@router.callback_query(F.data == ORPHAN_SWEEP_CONFIRM)
+async def orphan_sweep_confirm(callback: types.CallbackQuery):
+    if callback.from_user.id not in ADMINS:
+        await callback.answer()
+        return
+
+    schedule_orphan_sweep()
+    await callback.message.edit_text("🗑 Очистка данных удалённых мероприятий запущена.")
+    await callback.answer()
+
+# Обработка кнопки "📣 Анонс мероприятия"
+@router.message(F.text == "📣 Анонс мероприятия")
+async def announce_event_start(message: types.Message):
+    if message.from_user.id not in ADMINS:
+        return
+
+    events = await get_active_events()
+    if not events:
+        await message.answer("Нет мероприятий с открытой продажей билетов.")
+        return
+
+    builder = InlineKeyboardBuilder()
+    for event in events:
+        builder.button(text=event["name"], callback_data=f"announce_event_{event['id']}")
+    builder.adjust(1)  # По одной кнопке в строке
+
+    await message.answer("Выберите мероприятие, анонс которого получат все пользователи бота:",
+                         reply_markup=builder.as_markup())
+
+@router.callback_query(F.data.startswith("announce_event_"))
+async def announce_event_preview(callback: types.CallbackQuery):
+    if callback.from_user.id not in ADMINS:
+        await callback.answer()
+        return
+
+    event_id = int(callback.data.split("_")[-1])
+    event = await get_event_by_id(event_id)
+    if event is None:
+        await callback.message.answer("Мероприятие не найдено.")
+        await callback.answer()
+        return
+
+    # Показываем анонс в том виде, в котором его получат пользователи
+    text, markup = broadcast.get_announcement(event)
+    if event["photo"]:
+        await callback.message.answer_photo(photo=event["photo"], caption=text, reply_markup=markup)
+    else:
+        await callback.message.answer(text, reply_markup=markup)
+
+    builder = InlineKeyboardBuilder()
+    builder.button(text="Отправить всем", callback_data=f"announce_confirm_{event_id}")
+    builder.button(text="Отмена", callback_data="announce_cancel")
+    builder.adjust(1)
+    await callback.message.answer("Отправить этот анонс всем пользователям?", reply_markup=builder.as_markup())
+    await callback.answer()
+
+@router.callback_query(F.data.startswith("announce_confirm_"))
+async def announce_event_confirm(callback: types.CallbackQuery):
+    if callback.from_user.id not in ADMINS:
+        await callback.answer()
+        return
+
+    event_id = int(callback.data.split("_")[-1])
+    await callback.message.delete()
+
+    progress = await callback.message.answer("📣 Рассылка анонса запущена.")
+    started = await broadcast.start_broadcast(callback.bot, event_id, callback.from_user.id, progress)
+    if started is None:
+        # Одна незавершённая рассылка на мероприятие гарантируется уникальным индексом в базе
+        await progress.edit_text("Рассылка анонса этого мероприятия уже идёт.")
+        await callback.answer()
+        return
+    await progress.edit_text(
+        f"📣 Рассылка анонса запущена: {started.total} получателей. "
+        f"Отчёт придёт по завершении.",
+        reply_markup=broadcast.get_stop_keyboard(started.id)
+    )
+    await callback.answer()
+
+@router.callback_query(F.data == "announce_cancel")
+async def announce_event_cancel(callback: types.CallbackQuery):
+    await callback.message.delete()
+    await callback.answer("Рассылка отменена")
+
+@router.callback_query(F.data.startswith("broadcast_stop_"))
+async def broadcast_stop(callback: types.CallbackQuery):
+    if callback.from_user.id not in ADMINS:
+        await callback.answer()
+        return
+
+    broadcast_id = int(callback.data.split("_")[-1])
+    stopped = await broadcast.stop_broadcast(broadcast_id)
+    if stopped is None:
+        await callback.answer("Рассылка не найдена")
+        return
+
+    event = await get_event_by_id(stopped.event_id)
+    event_name = event["name"] if event else "удалённое мероприятие"
+    await callback.message.edit_text(f"⏹ Рассылка остановлена.\n{broadcast.format_report(stopped, event_name)}")
+    await callback.answer()
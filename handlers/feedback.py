@@ -4,8 +4,8 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from keyboards.main_menu import get_main_menu
-from database import get_user_events, add_feedback, get_event_by_id, get_user # Импортируем функцию для получения мероприятий пользователя
-from config import ADMINS
+from async_database import get_user_events, add_feedback, get_event_by_id, get_user # Импортируем функцию для получения мероприятий пользователя
+from admin_notify import notify_admins
 
 router = Router()
 
@@ -32,7 +32,7 @@ async def contact_manager(callback: types.CallbackQuery):
 @router.callback_query(F.data == "leave_feedback")
 async def leave_feedback(callback: types.CallbackQuery, state: FSMContext):
     user_id = callback.from_user.id
-    user_events = get_user_events(user_id)  # Получаем мероприятия пользователя
+    user_events = await get_user_events(user_id)  # Получаем мероприятия пользователя
 
     if not user_events:
         await callback.message.answer("Вы еще не посещали мероприятия.")
@@ -65,12 +65,13 @@ async def process_feedback(message: types.Message, state: FSMContext):
     event_id = user_data["event_id"]
 
     # Сохраняем отзыв в базу данных (функция add_feedback должна быть реализована в database.py)
-    add_feedback(message.from_user.id, event_id, feedback_text)
+    await add_feedback(message.from_user.id, event_id, feedback_text)
 
-    event = get_event_by_id(event_id)
-    user = get_user(message.from_user.id)
+    event = await get_event_by_id(event_id)
+    user = await get_user(message.from_user.id)
 
     await message.answer("Спасибо за ваш отзыв! Он был отправлен администраторам.")
-    for admin_id in ADMINS:
-        await message.bot.send_message(admin_id, f"Пользователь оставил отзыв о мероприятии: {event['name']}.\n\n👤 Имя: {user['full_name']}\n☎️ Контакт: {user['phone_number']}\n📱 Telegram: @{message.from_user.username}\nОтзыв: {feedback_text}")
+    text = f"Пользователь оставил отзыв о мероприятии: {event['name']}.\n\n👤 Имя: {user['full_name']}\n☎️ Контакт: {user['phone_number']}\n📱 Telegram: @{message.from_user.username}\nОтзыв: {feedback_text}"
+    # Отзыв уходит всем администраторам одновременно; недоступный чат не мешает остальным
+    await notify_admins(lambda admin_id: message.bot.send_message(admin_id, text))
     await state.clear()  # Очищаем состояние
\ No newline at end of file
@@ -3,9 +3,9 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.utils.keyboard import InlineKeyboardBuilder, ReplyKeyboardMarkup, KeyboardButton
 from keyboards.main_menu import get_main_menu
-from database import get_user, get_user_events, add_user, update_user, get_user_tickets
-import time
-from aiogram.types import FSInputFile
+from async_database import get_user, get_user_events, add_user, update_user, get_user_tickets
+import asyncio
+from ticket_delivery import send_tickets
 
 router = Router()
 
@@ -18,11 +18,11 @@ class RegistrationStates(StatesGroup):
 # Обработка команды "Личный кабинет"
 @router.message(F.text == "Личный кабинет")
 async def personal_account(message: types.Message, state: FSMContext):
-    user = get_user(message.from_user.id)
+    user = await get_user(message.from_user.id)
     if not user:
         # Если пользователь не зарегистрирован, начинаем процесс регистрации
         await message.answer("Вы не зарегистрированы. Давайте зарегистрируем вас!")
-        time.sleep(1)
+        await asyncio.sleep(1)
         await message.answer("Укажите ваше имя и фамилию:", reply_markup=get_cancel_keyboard())
         await state.set_state(RegistrationStates.waiting_for_name)
     else:
@@ -60,7 +60,7 @@ async def process_contact(message: types.Message, state: FSMContext):
     user_data = await state.get_data()
 
     # Сохраняем пользователя в базу данных
-    add_user(
+    await add_user(
         user_id=message.from_user.id,
         full_name=user_data["full_name"],
         university=user_data["university"],
@@ -69,9 +69,9 @@ async def process_contact(message: types.Message, state: FSMContext):
 
     await message.answer("Регистрация завершена! Спасибо.", reply_markup=get_main_menu(message.chat.id))
     await state.clear()  # Очищаем состояние
-    time.sleep(1)
+    await asyncio.sleep(1)
     # Показываем личный кабинет
-    await show_personal_account(message, get_user(message.from_user.id))
+    await show_personal_account(message, await get_user(message.from_user.id))
 
 # Обработка отмены на этапе ожидания контакта
 @router.message(RegistrationStates.waiting_for_contact)
@@ -85,13 +85,15 @@ async def show_personal_account(message: types.Message, user: dict):
     builder = InlineKeyboardBuilder()
     builder.button(text="Мои тусовки", callback_data="my_events")
     builder.button(text="Мои билеты", callback_data="my_tickets")
+    builder.button(text="Билеты на ближайшие", callback_data="my_tickets_upcoming")
     builder.button(text="Редактировать данные", callback_data="edit_data")
+    builder.adjust(2)
 
     await message.answer(
         f"Имя: {user['full_name']}\n"
         f"Номер телефона: {user['phone_number']}\n"
         f"Вуз: {user['university']}\n"
-        f"Количество посещенных тусовок: {len(get_user_events(user['id']))}",
+        f"Количество посещенных тусовок: {len(await get_user_events(user['id']))}",
         reply_markup=builder.as_markup()
     )
 
@@ -123,12 +125,12 @@ class EditDataStates(StatesGroup):
 # Обработка кнопки "Мои тусовки"
 @router.callback_query(F.data == "my_events")
 async def my_events(callback: types.CallbackQuery):
-    user = get_user(callback.from_user.id)
+    user = await get_user(callback.from_user.id)
     if not user:
         await callback.message.answer("Вы не зарегистрированы.", reply_markup=get_main_menu(callback.message.chat.id))
         return
 
-    user_events = get_user_events(user["id"])
+    user_events = await get_user_events(user["id"])
     if not user_events:
         await callback.message.answer("Вы еще не посещали мероприятия.")
         await callback.answer()
@@ -145,27 +147,34 @@ async def my_events(callback: types.CallbackQuery):
     await callback.message.answer(events_text, parse_mode="Markdown")
     await callback.answer()
 
-# Обработка кнопки "Мои билеты"
-@router.callback_query(F.data == "my_tickets")
+# Обработка кнопок "Мои билеты" и "Билеты на ближайшие"
+@router.callback_query(F.data.in_({"my_tickets", "my_tickets_upcoming"}))
 async def my_tickets(callback: types.CallbackQuery):
-    user = get_user(callback.from_user.id)
+    user = await get_user(callback.from_user.id)
     if not user:
         await callback.message.answer("Вы не зарегистрированы.", reply_markup=get_main_menu(callback.message.chat.id))
         return
 
-    # Получаем билеты пользователя
-    user_tickets = get_user_tickets(user["id"])
+    # Получаем билеты пользователя; прошедшие мероприятия отсекаются в запросе
+    upcoming_only = callback.data == "my_tickets_upcoming"
+    user_tickets = await get_user_tickets(user["id"], upcoming_only=upcoming_only)
     if not user_tickets:
-        await callback.message.answer("У вас нет купленных билетов.")
+        await callback.message.answer(
+            "У вас нет билетов на предстоящие мероприятия." if upcoming_only else "У вас нет купленных билетов."
+        )
         await callback.answer()
         return
 
-    # Отправляем билеты пользователю
-    for ticket in user_tickets:
-        photo = FSInputFile(ticket["qr_code"])
-        await callback.message.answer_photo(
-            photo=photo,
-            caption=f"Билет на мероприятие: {ticket['event_name']}"
+    # Отправляем билеты альбомами по 10: уже отправленные — по file_id, без повторной загрузки
+    _, failed = await send_tickets(
+        callback.bot, callback.message.chat.id, user_tickets,
+        caption=lambda ticket: f"Билет на мероприятие: {ticket['event_name']}"
+    )
+    if failed:
+        events = ", ".join(sorted({ticket["event_name"] for ticket in failed}))
+        await callback.message.answer(
+            f"Не удалось показать билетов: {len(failed)} ({events}). "
+            f"Обратитесь к администратору, чтобы билет выпустили заново."
         )
 
     await callback.answer()
@@ -198,7 +207,7 @@ async def process_new_university(message: types.Message, state: FSMContext):
         return
 
     user_data = await state.get_data()
-    update_user(
+    await update_user(
         user_id=message.from_user.id,
         full_name=user_data["full_name"],
         university=message.text
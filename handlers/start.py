@@ -3,8 +3,10 @@ from aiogram.filters import Command
 from pyexpat.errors import messages
 
 from keyboards.main_menu import get_main_menu
-from database import  get_ticket_by_id, get_user, get_event_by_id, get_all_used_tickets, add_used_ticket
 from config import ADMINS
+from ticket_tokens import is_ticket_payload, parse_ticket_payload
+from handlers.check_in_mode import answer_scan
+import check_in
 from aiogram.utils.keyboard import InlineKeyboardBuilder, ReplyKeyboardMarkup, KeyboardButton
 
 
@@ -12,23 +14,28 @@ router = Router()
 
 @router.message(Command("start"))
 async def start_cmd(message: types.Message):
-    if message.text.startswith("/start ticket_"):
-        # Извлекаем ticket_id из команды
-        ticket_id = message.text.split("_")[1]
-
-        # Получаем информацию о билете из базы данных
-        ticket_info = get_ticket_by_id(ticket_id)
-        user = get_user(ticket_info['user_id'])
-        event = get_event_by_id(ticket_info['event_id'])
-        used = [i[0] for i in get_all_used_tickets()]
-
-        ticket_valid = True
-        for i in used:
-            if int(ticket_id) == int(i):
-                ticket_valid = False
-
+    payload = message.text.partition(" ")[2].strip()
+    # В режиме входа любой скан сразу проверяется как билет, без карточки и кнопки «Использован»:
+    # поддельный код получает ответ «не найден», а не приветствие
+    session = check_in.get_admin_session(message.from_user.id) if payload and message.from_user.id in ADMINS else None
+    if session is not None:
+        await answer_scan(message, session, payload)
+    elif is_ticket_payload(payload):
+        # Подпись токена проверяется без базы: поддельные коды отсекаются сразу
+        ticket = parse_ticket_payload(payload)
+        ticket_info = None
+        if ticket:
+            ticket_id, event_id = ticket
+            # Получаем билет, владельца, мероприятие и отметку об использовании одним запросом;
+            # при открытом режиме входа учитываются и отметки, ещё не записанные в базу
+            ticket_info = await check_in.get_ticket_status(ticket_id)
+            # Билет из базы должен относиться к тому же мероприятию, что и подписанный токен
+            if ticket_info and event_id is not None and ticket_info["event_id"] != event_id:
+                ticket_info = None
 
         if ticket_info:
+            ticket_valid = not ticket_info["is_used"]
+
             if message.from_user.id in ADMINS:
                 builder = InlineKeyboardBuilder()
                 builder.button(text="Использован", callback_data=f"used_ticket_{ticket_id}")
@@ -36,27 +43,27 @@ async def start_cmd(message: types.Message):
                 if ticket_valid:
                     await message.answer(
                         f"🎟 *Информация о билете*\n"
-                        f"Имя: {user['full_name']}\n"
-                        f"Мероприятие: {event['name']}\n"
-                        f"Дата: {event['date']}\n"
+                        f"Имя: {ticket_info['full_name']}\n"
+                        f"Мероприятие: {ticket_info['event_name']}\n"
+                        f"Дата: {ticket_info['event_date']}\n"
                         f"Статус: ✅ Действителен",
                         parse_mode="Markdown", reply_markup=builder.as_markup()
                     )
                 else:
                     await message.answer(
                         f"🎟 *Информация о билете*\n"
-                        f"Имя: {user['full_name']}\n"
-                        f"Мероприятие: {event['name']}\n"
-                        f"Дата: {event['date']}\n"
+                        f"Имя: {ticket_info['full_name']}\n"
+                        f"Мероприятие: {ticket_info['event_name']}\n"
+                        f"Дата: {ticket_info['event_date']}\n"
                         f"Статус: ❌ Недействителен",
                         parse_mode="Markdown"
                     )
             else:
                 await message.answer(
                     f"🎟 *Информация о билете*\n"
-                    f"Имя: {user['full_name']}\n"
-                    f"Мероприятие: {event['name']}\n"
-                    f"Дата: {event['date']}\n",
+                    f"Имя: {ticket_info['full_name']}\n"
+                    f"Мероприятие: {ticket_info['event_name']}\n"
+                    f"Дата: {ticket_info['event_date']}\n",
                     parse_mode="Markdown"
                 )
         else:
@@ -70,6 +77,16 @@ async def start_cmd(message: types.Message):
 
 @router.callback_query(F.data.startswith("used_ticket_"))
 async def used_ticket(callback: types.CallbackQuery):
-    ticket_id = int(callback.data.split("_")[2])  # Извлекаем ID мероприятия
-    await callback.message.answer("Билет успешно использован!")
-    add_used_ticket(ticket_id)
\ No newline at end of file
+    if callback.from_user.id not in ADMINS:
+        await callback.answer()
+        return
+
+    ticket_id = int(callback.data.split("_")[2])  # Извлекаем ID билета
+
+    # Повторное нажатие не считается ошибкой: отметка ставится только один раз,
+    # а при открытом режиме входа — через его сессию, чтобы билет не прошёл дважды
+    if await check_in.mark_used(ticket_id):
+        await callback.message.answer("Билет успешно использован!")
+    else:
+        await callback.message.answer("❌ Билет уже был использован ранее.")
+    await callback.answer()
\ No newline at end of file
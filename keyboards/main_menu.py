@@ -15,6 +15,9 @@ def get_main_menu(user_id):
         buttons.append([KeyboardButton(text="⚙️ Управление мероприятиями")])
         buttons.append([KeyboardButton(text="💰 Обновить ссылку для оплаты")])
         buttons.append([KeyboardButton(text="📄 Получить список гостей")])
+        buttons.append([KeyboardButton(text="🎟 Выдать билеты по списку")])
+        buttons.append([KeyboardButton(text="🚪 Режим входа")])
+        buttons.append([KeyboardButton(text="📣 Анонс мероприятия")])
 
     # Создаем клавиатуру с кнопками
     keyboard = ReplyKeyboardMarkup(keyboard=buttons, resize_keyboard=True)
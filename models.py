@@ -0,0 +1,89 @@
+class Record:
+    """
+    Компактная запись строки таблицы на __slots__.
+    Поля доступны и как атрибуты (event.name), и по ключу (event['name']), как у прежних словарей.
+    """
+    __slots__ = ()
+
+    # Дополнительные имена ключей для совместимости: {ключ: поле}
+    aliases = {}
+
+    def __init__(self, *values):
+        values = values + (None,) * (len(self.__slots__) - len(values))
+        for field, value in zip(self.__slots__, values):
+            setattr(self, field, value)
+
+    @classmethod
+    def from_row(cls, cursor, row):
+        """
+        Фабрика строк для sqlite3: cursor.row_factory = Event.from_row.
+        Порядок колонок в запросе должен совпадать с порядком полей записи.
+        """
+        return cls(*row)
+
+    def _field(self, key):
+        field = self.aliases.get(key, key)
+        if field not in self.__slots__:
+            raise KeyError(key)
+        return field
+
+    def __getitem__(self, key):
+        return getattr(self, self._field(key))
+
+    def __setitem__(self, key, value):
+        setattr(self, self._field(key), value)
+
+    def __contains__(self, key):
+        return self.aliases.get(key, key) in self.__slots__
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return self.__slots__
+
+    def to_dict(self) -> dict:
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        fields = ", ".join(f"{field}={getattr(self, field)!r}" for field in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+
+class Event(Record):
+    __slots__ = (
+        "id", "name", "description", "photo", "price", "date",
+        "is_sale_active", "qr_template", "photo_album_link", "starts_at"
+    )
+
+    @classmethod
+    def from_row(cls, cursor, row):
+        event = cls(*row)
+        event.is_sale_active = bool(event.is_sale_active)
+        return event
+
+
+class User(Record):
+    __slots__ = ("id", "full_name", "university", "phone_number")
+
+
+class Ticket(Record):
+    __slots__ = ("id", "user_id", "event_id", "qr_code", "event_name", "file_id")
+
+    # get_ticket_by_id исторически возвращал ID билета под ключом ticket_id
+    aliases = {"ticket_id": "id"}
+
+
+class Broadcast(Record):
+    __slots__ = (
+        "id", "event_id", "status", "last_user_id", "total", "delivered", "blocked", "failed",
+        "created_by", "created_at", "finished_at", "sent_ahead"
+    )
@@ -0,0 +1,274 @@
+"""
+Ограничение скорости исходящих запросов к Telegram.
+
+Все запросы бота, адресованные чату (отправка, редактирование и удаление
+сообщений), проходят через общую очередь с маркерными корзинами: общей на
+бота и отдельной на каждый чат. Порядок выдачи задаётся приоритетом из
+контекста вызова: билеты и ответы на входе идут раньше обычных ответов,
+а рассылки — в последнюю очередь. На TelegramRetryAfter отправка в этот
+чат приостанавливается на указанное время и запрос повторяется; остальные
+чаты обслуживаются без задержки.
+
+Ограничитель подключается как middleware сессии бота:
+    bot.session.middleware(RateLimitMiddleware(OutboundLimiter()))
+и работает с любой сессией aiogram, в том числе с поддельной локальной.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMediaGroup
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты отправки: меньше — раньше
+PRIORITY_HIGH = 0  # Билеты и ответы в режиме входа
+PRIORITY_NORMAL = 1  # Обычные ответы пользователям
+PRIORITY_LOW = 2  # Рассылки
+
+PRIORITY_NAMES = {PRIORITY_HIGH: "high", PRIORITY_NORMAL: "normal", PRIORITY_LOW: "low"}
+
+_priority = ContextVar("send_priority", default=PRIORITY_NORMAL)
+
+
+@contextmanager
+def send_priority(priority: int):
+    """
+    Задаёт приоритет запросов к Telegram внутри блока:
+        with send_priority(PRIORITY_HIGH):
+            await bot.send_photo(...)
+    """
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class TokenBucket:
+    """
+    Маркерная корзина: rate маркеров в секунду, не больше capacity подряд.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float, weight: float = 1) -> float:
+        """
+        Сколько секунд осталось до появления weight маркеров. Запрос тяжелее корзины ждёт
+        полной корзины и уходит в долг: следующие запросы ждут, пока долг не погасится.
+        """
+        self._refill(now)
+        if now < self.paused_until:
+            return self.paused_until - now
+        need = min(weight, self.capacity)
+        return 0.0 if self.tokens >= need else (need - self.tokens) / self.rate
+
+    def take(self, now: float, weight: float = 1):
+        self._refill(now)
+        self.tokens -= weight
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+    def is_idle(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity and now >= self.paused_until
+
+
+class OutboundLimiter:
+    """
+    Очередь исходящих запросов с общей и початовыми маркерными корзинами.
+    Ограничения по умолчанию взяты с запасом от лимитов Telegram: ~30 сообщений
+    в секунду на бота, ~1 в секунду в личный чат и ~20 в минуту в группу.
+    """
+
+    # Початовые корзины, которые полны дольше этого числа записей, удаляются
+    MAX_IDLE_BUCKETS = 10000
+
+    # Запас маркеров общей корзины: за любую секунду уходит не больше global_rate + GLOBAL_BURST запросов
+    GLOBAL_BURST = 5
+
+    def __init__(self, global_rate: float = 25, chat_rate: float = 1, chat_burst: float = 3,
+                 group_rate: float = 20 / 60):
+        self.global_bucket = TokenBucket(global_rate, min(global_rate, self.GLOBAL_BURST))
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self._chat_buckets = {}
+        self._waiting = []
+        self._counter = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._dispatcher = None
+
+        self.granted = {name: 0 for name in PRIORITY_NAMES.values()}
+        self.total_wait = {name: 0.0 for name in PRIORITY_NAMES.values()}
+        self.max_wait = {name: 0.0 for name in PRIORITY_NAMES.values()}
+        self.retries = 0
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= self.MAX_IDLE_BUCKETS:
+                now = time.monotonic()
+                self._chat_buckets = {
+                    key: value for key, value in self._chat_buckets.items() if not value.is_idle(now)
+                }
+            # Отрицательные ID — группы и каналы, у них лимит жёстче
+            rate = self.group_rate if isinstance(chat_id, int) and chat_id < 0 else self.chat_rate
+            bucket = self._chat_buckets[chat_id] = TokenBucket(rate, self.chat_burst)
+        return bucket
+
+    async def acquire(self, chat_id, priority: int = PRIORITY_NORMAL, weight: int = 1):
+        """
+        Дожидается разрешения на запрос в чат.
+        :param weight: Сколько сообщений Telegram засчитает за запрос (альбом — по числу фото)
+        """
+        future = asyncio.get_running_loop().create_future()
+        enqueued = time.monotonic()
+        heapq.heappush(self._waiting, (priority, next(self._counter), chat_id, weight, future))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        self._wakeup.set()
+        await future
+
+        waited = time.monotonic() - enqueued
+        name = PRIORITY_NAMES.get(priority, str(priority))
+        self.granted[name] = self.granted.get(name, 0) + 1
+        self.total_wait[name] = self.total_wait.get(name, 0.0) + waited
+        self.max_wait[name] = max(self.max_wait.get(name, 0.0), waited)
+        if waited > 1:
+            logger.info("Запрос в чат %s ждал очереди %.1f с (приоритет %s)", chat_id, waited, name)
+
+    def pause(self, seconds: float, chat_id=None):
+        """
+        Приостанавливает отправку после RetryAfter: только в этот чат, если он известен,
+        иначе всю очередь. Flood control одной группы или одного пользователя не должен
+        задерживать билеты и ответы остальным.
+        """
+        if chat_id is None:
+            self.global_bucket.pause(seconds)
+        else:
+            self._chat_bucket(chat_id).pause(seconds)
+        self._wakeup.set()
+
+    def _next_ready(self, now: float) -> tuple:
+        # Первый по приоритету запрос, чат которого готов; запросы в занятые чаты
+        # не задерживают остальных
+        min_wait = None
+        for entry in sorted(self._waiting):
+            _, _, chat_id, weight, future = entry
+            if future.cancelled():
+                self._waiting.remove(entry)
+                continue
+            wait = self._chat_bucket(chat_id).wait_time(now, weight)
+            if wait <= 0:
+                return entry, 0.0
+            min_wait = wait if min_wait is None else min(min_wait, wait)
+        return None, min_wait
+
+    async def _sleep(self, timeout):
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _dispatch(self):
+        while True:
+            if not self._waiting:
+                await self._sleep(None)
+                continue
+
+            now = time.monotonic()
+            global_wait = self.global_bucket.wait_time(now)
+            if global_wait > 0:
+                await self._sleep(global_wait)
+                continue
+
+            entry, chat_wait = self._next_ready(now)
+            if entry is None:
+                await self._sleep(chat_wait)
+                continue
+
+            _, _, chat_id, weight, future = entry
+            global_wait = self.global_bucket.wait_time(now, weight)
+            if global_wait > 0:
+                await self._sleep(global_wait)
+                continue
+
+            self._waiting.remove(entry)
+            heapq.heapify(self._waiting)
+            self.global_bucket.take(now, weight)
+            self._chat_bucket(chat_id).take(now, weight)
+            future.set_result(None)
+
+    def stats(self) -> dict:
+        return {
+            "waiting": len(self._waiting),
+            "retries": self.retries,
+            "granted": dict(self.granted),
+            "avg_wait_ms": {
+                name: self.total_wait[name] / count * 1000 if count else 0.0
+                for name, count in self.granted.items()
+            },
+            "max_wait_ms": {name: value * 1000 for name, value in self.max_wait.items()}
+        }
+
+    async def close(self):
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+            self._dispatcher = None
+
+
+class RateLimitMiddleware(BaseRequestMiddleware):
+    """
+    Middleware сессии бота: пропускает запросы в чаты через OutboundLimiter
+    и повторяет их после TelegramRetryAfter. Запросы без chat_id (getUpdates,
+    getFile, answerCallbackQuery) идут без очереди.
+    """
+
+    def __init__(self, limiter: OutboundLimiter, max_retries: int = 3):
+        self.limiter = limiter
+        self.max_retries = max_retries
+
+    async def __call__(self, make_request, bot, method):
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None:
+            return await make_request(bot, method)
+
+        priority = _priority.get()
+        # Альбом Telegram считает как отдельные сообщения по числу фото. При OUTBOUND_CHAT_RATE=1
+        # и запасе корзины чата 3 альбом из 10 фото уходит сразу, но следующий запрос в тот же чат
+        # ждёт около 10 с: 23 билета в «Моих билетах» приходят тремя альбомами за ~20 с
+        weight = len(method.media) if isinstance(method, SendMediaGroup) else 1
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.acquire(chat_id, priority, weight)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                self.limiter.retries += 1
+                logger.warning("Flood control в чате %s: повтор %s через %s с",
+                               chat_id, type(method).__name__, e.retry_after)
+                self.limiter.pause(e.retry_after, chat_id)
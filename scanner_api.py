@@ -0,0 +1,210 @@
+"""
+Локальный HTTP-сервис проверки билетов для сканеров на входе.
+
+Работает в том же цикле событий, что и опрос Telegram, и использует те же
+сессии режима входа (check_in.py): билеты мероприятия хранятся в памяти,
+проверка скана не обращается к базе, а отметки о входе пишутся пачками.
+
+    GET  /api/tickets/verify?code=<QR>&event_id=<ID>  — проверить билет без отметки
+    POST /api/tickets/check-in  {"code": "<QR>", "event_id": <ID>}  — отметить вход
+    GET  /api/health
+
+code — содержимое QR-кода (ссылка или только параметр start). event_id
+обязателен для билетов старого формата, у подписанных токенов он берётся
+из токена. Ответ всегда JSON; повторная отметка того же билета возвращает
+already_used со временем первого входа, а повтор запроса с тем же
+заголовком Idempotency-Key — исходный ответ без изменений (тот же ключ
+с другим билетом — 409).
+
+Проверка без отметки только читает: она использует сессию, если на входе
+мероприятия уже идёт отметка, а иначе обращается к базе и сессию не открывает.
+"""
+import hmac
+import logging
+import time
+from collections import OrderedDict
+
+from aiohttp import web
+
+import check_in
+from config import SCANNER_API_HOST, SCANNER_API_PORT, SCANNER_API_TOKEN
+from ticket_tokens import payload_from_link, parse_ticket_payload
+
+logger = logging.getLogger(__name__)
+
+# Сколько ответов хранится для повторов по Idempotency-Key
+IDEMPOTENCY_CACHE_SIZE = 10000
+
+_responses = OrderedDict()
+_runner = None
+
+
+@web.middleware
+async def _auth(request: web.Request, handler):
+    if SCANNER_API_TOKEN and request.path != "/api/health":
+        header = request.headers.get("Authorization", "")
+        if not hmac.compare_digest(header.encode(), f"Bearer {SCANNER_API_TOKEN}".encode()):
+            return web.json_response({"error": "unauthorized"}, status=401)
+    return await handler(request)
+
+
+def _parse_event_id(value) -> int:
+    # JSON может прислать в event_id что угодно: списки, объекты и true/false отклоняются
+    if value is None or value == "":
+        return None
+    if isinstance(value, bool):
+        raise ValueError("event_id должен быть числом")
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError("event_id должен быть числом") from None
+
+
+async def _resolve(code: str, event_id, mark: bool) -> tuple:
+    """
+    Находит билет и сессию его мероприятия.
+    :param mark: Будет отмечен вход: сессия открывается и остаётся открытой
+    :return: (сессия или None, ID билета или None, ID мероприятия или None,
+              результат проверки, если она закончилась на этом шаге)
+    """
+    if code is not None and not isinstance(code, str):
+        raise ValueError("code должен быть строкой")
+    ticket = parse_ticket_payload(payload_from_link(code or ""))
+    if ticket is None:
+        return None, None, event_id, check_in.NOT_FOUND
+
+    ticket_id, token_event_id = ticket
+    if event_id is None:
+        event_id = token_event_id
+    if event_id is None:
+        raise ValueError("Для билета старого формата нужен event_id")
+    if token_event_id is not None and token_event_id != event_id:
+        return None, ticket_id, event_id, check_in.WRONG_EVENT
+
+    if not mark:
+        return check_in.get_session(event_id), ticket_id, event_id, None
+
+    session = await check_in.open_session(event_id, keep_open=True)
+    if session is None:
+        raise LookupError("Мероприятие не найдено")
+    return session, ticket_id, event_id, None
+
+
+async def _verify_in_db(ticket_id: int, event_id: int) -> tuple:
+    """
+    Проверяет билет по базе, когда сессия мероприятия не открыта.
+    :return: (результат проверки, ФИО владельца или None, данные билета из базы или None)
+    """
+    details = await check_in.get_ticket_status(ticket_id)
+    if details is None:
+        return check_in.NOT_FOUND, None, None
+    if details["event_id"] != event_id:
+        return check_in.WRONG_EVENT, None, details
+    return (check_in.ALREADY_USED if details["is_used"] else check_in.VALID), details["full_name"], details
+
+
+def _result(status: str, session, ticket_id, holder, details: dict = None) -> dict:
+    result = {"status": status, "ticket_id": ticket_id, "holder": holder}
+    if session is None and details is not None:
+        # Без открытой сессии мероприятие билета известно из базы
+        result.update({"event_id": details["event_id"], "event_name": details["event_name"]})
+    elif session is not None:
+        result.update({
+            "event_id": session.event_id,
+            "event_name": session.event_name,
+            "checked_in_at": session.checked_in_at.get(ticket_id),
+            "checked_in": session.checked_in,
+            "sold": session.sold
+        })
+    return result
+
+
+async def _handle(code: str, event_id, mark: bool) -> tuple:
+    """
+    Проверяет билет и при mark=True отмечает вход.
+    :return: (JSON-ответ, HTTP-статус)
+    """
+    started = time.perf_counter()
+    try:
+        session, ticket_id, event_id, status = await _resolve(code, _parse_event_id(event_id), mark)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    except LookupError as e:
+        return {"error": str(e)}, 404
+
+    holder = details = None
+    if status is None:
+        if mark:
+            status, holder = await session.check_in(ticket_id)
+        elif session is not None:
+            status, holder = await session.verify(ticket_id)
+        else:
+            status, holder, details = await _verify_in_db(ticket_id, event_id)
+
+    result = _result(status, session, ticket_id, holder, details)
+    logger.debug("Сканер: билет %s — %s за %.3f мс", ticket_id, status, (time.perf_counter() - started) * 1000)
+    return result, 200
+
+
+async def verify(request: web.Request) -> web.Response:
+    result, status = await _handle(request.query.get("code"), request.query.get("event_id"), mark=False)
+    return web.json_response(result, status=status)
+
+
+async def check_in_ticket(request: web.Request) -> web.Response:
+    try:
+        body = await request.json()
+    except ValueError:
+        return web.json_response({"error": "Тело запроса должно быть JSON"}, status=400)
+    if not isinstance(body, dict):
+        return web.json_response({"error": "Тело запроса должно быть JSON-объектом"}, status=400)
+
+    # Ответ выдаётся повторно, только если с тем же ключом пришёл тот же запрос
+    key = request.headers.get("Idempotency-Key")
+    fingerprint = (body.get("code"), str(body.get("event_id")))
+    if key and key in _responses:
+        saved_fingerprint, saved_result = _responses[key]
+        if saved_fingerprint != fingerprint:
+            return web.json_response({"error": "Idempotency-Key уже использован с другим билетом"}, status=409)
+        return web.json_response(saved_result)
+
+    result, status = await _handle(body.get("code"), body.get("event_id"), mark=True)
+    if key and status == 200:
+        _responses[key] = (fingerprint, result)
+        while len(_responses) > IDEMPOTENCY_CACHE_SIZE:
+            _responses.popitem(last=False)
+    return web.json_response(result, status=status)
+
+
+async def health(request: web.Request) -> web.Response:
+    return web.json_response({"status": "ok"})
+
+
+def create_app() -> web.Application:
+    app = web.Application(middlewares=[_auth])
+    app.router.add_get("/api/tickets/verify", verify)
+    app.router.add_post("/api/tickets/check-in", check_in_ticket)
+    app.router.add_get("/api/health", health)
+    return app
+
+
+async def start(host: str = SCANNER_API_HOST, port: int = SCANNER_API_PORT):
+    """
+    Запускает сервис в текущем цикле событий.
+    """
+    global _runner
+    if not SCANNER_API_TOKEN and host not in ("127.0.0.1", "localhost", "::1"):
+        logger.error("Сервис сканеров не запущен: для адреса %s нужен SCANNER_API_TOKEN", host)
+        return
+
+    _runner = web.AppRunner(create_app(), access_log=None)
+    await _runner.setup()
+    await web.TCPSite(_runner, host, port).start()
+    logger.info("Сервис сканеров слушает http://%s:%s", host, port)
+
+
+async def stop():
+    global _runner
+    if _runner is not None:
+        await _runner.cleanup()
+        _runner = None
@@ -0,0 +1,31 @@
+"""
+Общие настройки тестов.
+
+Модули бота читают config.py при импорте, поэтому обязательные переменные
+окружения задаются до первого импорта. Тесты запускаются из корня репозитория:
+    python -m pytest -q
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("BOT_TOKEN", "42:TEST")
+os.environ.setdefault("ADMIN_ID", "1")
+os.environ.setdefault("TICKET_SECRET", "test-secret")
+
+import pytest  # noqa: E402
+
+import database  # noqa: E402
+
+
+@pytest.fixture
+def db(tmp_path):
+    """
+    Пустая база со схемой в каталоге теста.
+    """
+    database.set_db_name(str(tmp_path / "test.db"))
+    database.init_db()
+    yield database
+    database.disable_write_queue()
+    database.close_connections()
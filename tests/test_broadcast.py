@@ -0,0 +1,94 @@
+import asyncio
+import random
+from collections import Counter
+
+import pytest
+
+import broadcast
+from database import BROADCAST_DONE
+
+ADMIN_ID = -1
+
+
+class FakeBot:
+    """
+    Бот без сети: запоминает получателей анонса и отвечает со случайной задержкой.
+    """
+
+    def __init__(self, rnd: random.Random = None):
+        self.rnd = rnd
+        self.recipients = []
+
+    async def send_message(self, chat_id, text, reply_markup=None):
+        if self.rnd is not None:
+            await asyncio.sleep(self.rnd.uniform(0, 0.002))
+        if chat_id != ADMIN_ID:
+            self.recipients.append(chat_id)
+
+    async def send_photo(self, chat_id, photo, caption=None, reply_markup=None):
+        await self.send_message(chat_id, caption, reply_markup)
+
+
+@pytest.fixture
+def event_id(db, monkeypatch):
+    # Маленькие порции, чтобы рассылка проходила несколько порций и прерывалась между ними
+    monkeypatch.setattr(broadcast, "CHUNK_SIZE", 4)
+    return db.add_event("Концерт", "Описание", "", 500, "2099-01-01 19:00", True, "template.png")
+
+
+def add_users(db, user_ids):
+    for user_id in user_ids:
+        db.add_user(user_id, f"Гость {user_id}", "МГУ", "+70000000000")
+
+
+def test_resume_skips_users_sent_before_interruption(db, event_id):
+    add_users(db, range(1, 11))
+    created = db.create_broadcast(event_id, ADMIN_ID)
+    # До прерывания анонс получили 1, 3 и 9: курсор стоит на 1, а 3 и 9 ушли вперёд курсора
+    db.save_broadcast_progress(created.id, 1, 3, 0, 0, [3, 9])
+
+    bot = FakeBot()
+    asyncio.run(broadcast.run_broadcast(bot, db.get_broadcast(created.id)))
+
+    assert sorted(bot.recipients) == [2, 4, 5, 6, 7, 8, 10]
+    finished = db.get_broadcast(created.id)
+    assert finished.status == BROADCAST_DONE
+    assert finished.delivered == 10
+    assert finished.sent_ahead is None
+
+
+def test_only_one_running_broadcast_per_event(db, event_id):
+    add_users(db, range(1, 4))
+    assert db.create_broadcast(event_id, ADMIN_ID) is not None
+    assert db.create_broadcast(event_id, ADMIN_ID) is None
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_interrupted_broadcast_reaches_everyone_once(db, event_id, seed):
+    rnd = random.Random(seed)
+    users = list(range(10, 410, 10))
+    add_users(db, users)
+    created = db.create_broadcast(event_id, ADMIN_ID)
+    bot = FakeBot(rnd)
+
+    async def run():
+        # Рассылка прерывается в случайные моменты, как при перезапуске бота, и продолжается из базы
+        for _ in range(6):
+            task = asyncio.create_task(broadcast.run_broadcast(bot, db.get_broadcast(created.id)))
+            await asyncio.sleep(rnd.uniform(0.001, 0.01))
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            # Между запусками появляются новые пользователи, в том числе с ID внутри уже пройденных порций
+            new_user = rnd.randrange(1, 400)
+            if db.get_user(new_user) is None:
+                add_users(db, [new_user])
+        await broadcast.run_broadcast(bot, db.get_broadcast(created.id))
+
+    asyncio.run(run())
+
+    counts = Counter(bot.recipients)
+    assert max(counts.values()) == 1
+    assert set(users) <= set(counts)
+    finished = db.get_broadcast(created.id)
+    assert finished.status == BROADCAST_DONE
+    assert finished.delivered == len(bot.recipients)
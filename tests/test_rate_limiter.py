@@ -0,0 +1,128 @@
+import asyncio
+import time
+
+import pytest
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+
+from benchmarks.bench_outbound import FakeSession
+from rate_limiter import (
+    OutboundLimiter, RateLimitMiddleware, TokenBucket, send_priority, PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW
+)
+
+
+def make_bot(session: FakeSession, limiter: OutboundLimiter, max_retries: int = 3) -> Bot:
+    session.middleware(RateLimitMiddleware(limiter, max_retries=max_retries))
+    return Bot(token="42:TEST", session=session)
+
+
+async def send(bot: Bot, chat_id: int, priority: int):
+    with send_priority(priority):
+        await bot.send_message(chat_id, f"{priority}:{chat_id}")
+
+
+def sent_priorities(session: FakeSession) -> list:
+    return [int(text.split(":")[0]) for _, _, text in session.calls]
+
+
+def test_requests_are_granted_by_priority():
+    async def run():
+        session = FakeSession(latency=0)
+        limiter = OutboundLimiter(global_rate=50)
+        bot = make_bot(session, limiter)
+        # Рассылка ставится в очередь первой, билеты и ответы — за ней
+        tasks = [send(bot, 1000 + index, PRIORITY_LOW) for index in range(10)]
+        tasks += [send(bot, 2000 + index, PRIORITY_NORMAL) for index in range(3)]
+        tasks += [send(bot, 3000 + index, PRIORITY_HIGH) for index in range(3)]
+        await asyncio.gather(*tasks)
+        await limiter.close()
+        return session, limiter
+
+    session, limiter = asyncio.run(run())
+    assert sent_priorities(session) == [PRIORITY_HIGH] * 3 + [PRIORITY_NORMAL] * 3 + [PRIORITY_LOW] * 10
+    assert limiter.stats()["granted"] == {"high": 3, "normal": 3, "low": 10}
+
+
+def test_busy_chat_does_not_block_other_chats():
+    async def run():
+        session = FakeSession(latency=0)
+        limiter = OutboundLimiter(global_rate=50, chat_rate=2, chat_burst=1)
+        bot = make_bot(session, limiter)
+        # Второй запрос в чат 1 ждёт полсекунды, запрос в чат 2 уходит сразу
+        await asyncio.gather(send(bot, 1, PRIORITY_HIGH), send(bot, 1, PRIORITY_HIGH), send(bot, 2, PRIORITY_LOW))
+        await limiter.close()
+        return session
+
+    session = asyncio.run(run())
+    assert [chat_id for _, chat_id, _ in session.calls] == [1, 2, 1]
+    assert session.calls[2][0] - session.calls[0][0] >= 0.45
+
+
+def test_retry_after_is_retried_after_pause():
+    async def run():
+        session = FakeSession(latency=0, retry_after_every=2, retry_after=1)
+        limiter = OutboundLimiter(global_rate=50, chat_rate=20)
+        bot = make_bot(session, limiter)
+        await asyncio.gather(*(send(bot, 1000 + index, PRIORITY_NORMAL) for index in range(2)))
+        await limiter.close()
+        return session, limiter
+
+    session, limiter = asyncio.run(run())
+    # Второй запрос отклонён flood control и повторён; до повтора в тот же чат прошла пауза
+    assert session.flood_errors == 1
+    assert limiter.retries == 1
+    assert len(session.calls) == 3
+    (failed_at, chat_id, _), (retried_at, retried_chat, _) = session.calls[1:]
+    assert retried_chat == chat_id
+    assert retried_at - failed_at >= 0.95
+
+
+def test_retry_after_raised_when_retries_exhausted():
+    async def run():
+        session = FakeSession(latency=0, retry_after_every=1, retry_after=0)
+        limiter = OutboundLimiter(global_rate=50, chat_rate=20)
+        bot = make_bot(session, limiter, max_retries=2)
+        try:
+            await send(bot, 1, PRIORITY_NORMAL)
+        finally:
+            await limiter.close()
+        return session
+
+    with pytest.raises(TelegramRetryAfter):
+        asyncio.run(run())
+
+
+def test_retry_after_pauses_only_that_chat():
+    class FloodedChatSession(FakeSession):
+        async def make_request(self, bot, method, timeout=None):
+            self.calls.append((time.monotonic(), method.chat_id, method.text))
+            if method.chat_id == 5 and not self.flood_errors:
+                self.flood_errors += 1
+                raise TelegramRetryAfter(method=method, message="Too Many Requests", retry_after=1)
+            return None
+
+    async def run():
+        session = FloodedChatSession(latency=0)
+        limiter = OutboundLimiter(global_rate=50, chat_rate=20)
+        bot = make_bot(session, limiter)
+        started = time.monotonic()
+        flooded = asyncio.create_task(send(bot, 5, PRIORITY_LOW))
+        await asyncio.sleep(0.05)
+        await send(bot, 7, PRIORITY_HIGH)
+        other_chat_done = time.monotonic() - started
+        await flooded
+        await limiter.close()
+        return other_chat_done, time.monotonic() - started
+
+    other_chat_done, flooded_done = asyncio.run(run())
+    assert other_chat_done < 0.5
+    assert 0.95 <= flooded_done < 1.5
+
+
+def test_heavy_request_waits_for_full_bucket_and_goes_into_debt():
+    bucket = TokenBucket(rate=1, capacity=3)
+    now = bucket.updated
+    assert bucket.wait_time(now, weight=10) == 0
+    bucket.take(now, weight=10)
+    # Долг в 7 маркеров гасится раньше, чем следующий запрос наберёт свой 1 маркер
+    assert bucket.wait_time(now, weight=1) == pytest.approx(8)
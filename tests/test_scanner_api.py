@@ -0,0 +1,108 @@
+import asyncio
+from collections import OrderedDict
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+import check_in
+import scanner_api
+from ticket_tokens import make_ticket_token
+
+
+@pytest.fixture
+def tickets(db, monkeypatch):
+    monkeypatch.setattr(scanner_api, "_responses", OrderedDict())
+    event_id = db.add_event("Концерт", "Описание", "", 500, "2099-01-01 19:00", True, "template.png")
+    other_event_id = db.add_event("Лекция", "Описание", "", 0, "2099-02-01 19:00", True, "template.png")
+    db.add_user(5, "Иван Петров", "МГУ", "+70000000000")
+    return {
+        "event_id": event_id,
+        "ticket": db.add_ticket(5, event_id),
+        "other_event_ticket": db.add_ticket(5, other_event_id)
+    }
+
+
+def call(requests):
+    """
+    Выполняет запросы к сервису по очереди и возвращает [(HTTP-статус, JSON)].
+    """
+    async def run():
+        client = TestClient(TestServer(scanner_api.create_app()))
+        await client.start_server()
+        results = []
+        try:
+            for method, path, kwargs in requests:
+                response = await client.request(method, path, **kwargs)
+                results.append((response.status, await response.json()))
+        finally:
+            await client.close()
+            await check_in.close_all()
+        return results
+
+    return asyncio.run(run())
+
+
+def test_verify_without_session_reads_database_and_opens_nothing(tickets, monkeypatch):
+    opened = []
+    monkeypatch.setattr(check_in, "open_session", lambda *args, **kwargs: opened.append(args))
+    code = f"https://t.me/bot?start={make_ticket_token(tickets['ticket'], tickets['event_id'])}"
+
+    [(status, result)] = call([("GET", "/api/tickets/verify", {"params": {"code": code}})])
+
+    assert status == 200
+    assert result == {
+        "status": check_in.VALID, "ticket_id": tickets["ticket"], "holder": "Иван Петров",
+        "event_id": tickets["event_id"], "event_name": "Концерт"
+    }
+    assert opened == []
+
+
+def test_check_in_then_repeat_is_already_used(tickets):
+    body = {"code": make_ticket_token(tickets["ticket"], tickets["event_id"])}
+    (first_status, first), (_, second) = call([
+        ("POST", "/api/tickets/check-in", {"json": body}),
+        ("POST", "/api/tickets/check-in", {"json": body})
+    ])
+
+    assert first_status == 200
+    assert first["status"] == check_in.CHECKED_IN
+    assert first["checked_in"] == 1 and first["sold"] == 1
+    assert second["status"] == check_in.ALREADY_USED
+    assert second["checked_in_at"] == first["checked_in_at"]
+
+
+def test_ticket_for_other_event_is_rejected(tickets):
+    code = make_ticket_token(tickets["other_event_ticket"], tickets["event_id"] + 1)
+    [(status, result)] = call([
+        ("POST", "/api/tickets/check-in", {"json": {"code": code, "event_id": tickets["event_id"]}})
+    ])
+    assert status == 200
+    assert result["status"] == check_in.WRONG_EVENT
+
+
+@pytest.mark.parametrize("body", [
+    {"code": "x", "event_id": [1]},
+    {"code": "x", "event_id": {"id": 1}},
+    {"code": "x", "event_id": True},
+    {"code": 123},
+    [1, 2]
+])
+def test_malformed_check_in_is_bad_request(tickets, body):
+    [(status, result)] = call([("POST", "/api/tickets/check-in", {"json": body})])
+    assert status == 400
+    assert "error" in result
+
+
+def test_idempotency_key_replays_same_request_and_rejects_other_ticket(tickets):
+    headers = {"Idempotency-Key": "scan-1"}
+    body = {"code": make_ticket_token(tickets["ticket"], tickets["event_id"])}
+    other = {"code": make_ticket_token(tickets["other_event_ticket"], tickets["event_id"] + 1)}
+    (_, first), (replay_status, replay), (conflict_status, _) = call([
+        ("POST", "/api/tickets/check-in", {"json": body, "headers": headers}),
+        ("POST", "/api/tickets/check-in", {"json": body, "headers": headers}),
+        ("POST", "/api/tickets/check-in", {"json": other, "headers": headers})
+    ])
+
+    assert first["status"] == check_in.CHECKED_IN
+    assert (replay_status, replay) == (200, first)
+    assert conflict_status == 409
@@ -0,0 +1,67 @@
+import pytest
+
+import ticket_tokens
+from ticket_tokens import (
+    make_ticket_token, verify_ticket_token, parse_ticket_payload, is_ticket_payload, payload_from_link
+)
+
+
+@pytest.mark.parametrize("ticket_id, event_id", [(1, 1), (123, 7), (16383, 200), (10 ** 9, 10 ** 6)])
+def test_token_round_trip(ticket_id, event_id):
+    token = make_ticket_token(ticket_id, event_id)
+    assert verify_ticket_token(token) == (ticket_id, event_id)
+    assert verify_ticket_token(token, expected_event_id=event_id) == (ticket_id, event_id)
+
+
+def test_short_token_fits_old_link_length():
+    # Для билетов до 16 тысяч токен не длиннее прежнего ticket_<id>
+    assert len(make_ticket_token(16383, 100)) <= len("ticket_16383")
+
+
+def test_wrong_event_is_rejected():
+    token = make_ticket_token(123, 7)
+    assert verify_ticket_token(token, expected_event_id=8) is None
+    assert parse_ticket_payload(token, expected_event_id=8) is None
+
+
+def test_tampered_token_is_rejected():
+    # 9 байт кодируются ровно 12 символами: каждый символ токена значим
+    token = make_ticket_token(300, 7)
+    assert len(token) == 12
+    for position in range(len(token)):
+        replacement = "A" if token[position] != "A" else "B"
+        forged = token[:position] + replacement + token[position + 1:]
+        assert verify_ticket_token(forged) is None, forged
+
+
+def test_token_signed_with_other_secret_is_rejected(monkeypatch):
+    token = make_ticket_token(123, 7)
+    monkeypatch.setattr(ticket_tokens, "TICKET_SECRET", "other-secret")
+    assert verify_ticket_token(token) is None
+
+
+@pytest.mark.parametrize("payload", ["", "promo", "ref_12345678", "a" * 40, "!!!!!!!!!!"])
+def test_other_payloads_are_not_tickets(payload):
+    assert verify_ticket_token(payload) is None
+    assert not is_ticket_payload(payload)
+
+
+def test_legacy_links_accepted_up_to_cutoff(monkeypatch):
+    monkeypatch.setattr(ticket_tokens, "TICKET_ACCEPT_LEGACY_LINKS", True)
+    monkeypatch.setattr(ticket_tokens, "_legacy_max_id", lambda: 10)
+    assert parse_ticket_payload("ticket_10") == (10, None)
+    assert parse_ticket_payload("ticket_11") is None
+    assert parse_ticket_payload("ticket_0") is None
+    assert parse_ticket_payload("ticket_x1") is None
+
+
+def test_legacy_links_rejected_when_disabled(monkeypatch):
+    monkeypatch.setattr(ticket_tokens, "TICKET_ACCEPT_LEGACY_LINKS", False)
+    monkeypatch.setattr(ticket_tokens, "_legacy_max_id", lambda: 10)
+    assert parse_ticket_payload("ticket_5") is None
+
+
+def test_payload_from_scanned_link():
+    token = make_ticket_token(5, 2)
+    assert payload_from_link(f" https://t.me/bot?start={token} ") == token
+    assert payload_from_link(token) == token
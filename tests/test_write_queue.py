@@ -0,0 +1,78 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+import async_database
+from write_queue import WriteQueue
+
+INSERT = "INSERT INTO items (name) VALUES (?)"
+
+
+@pytest.fixture
+def write_queue(tmp_path):
+    path = str(tmp_path / "queue.db")
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT UNIQUE)")
+    # Пачка собирается 0,2 с, чтобы все вставки теста попали в одну транзакцию
+    queue = WriteQueue(lambda: sqlite3.connect(path, check_same_thread=False), flush_interval=0.2)
+    yield queue, path
+    queue.stop()
+
+
+def read_names(path: str) -> list:
+    with sqlite3.connect(path) as conn:
+        return [name for name, in conn.execute("SELECT name FROM items ORDER BY id")]
+
+
+def test_failed_write_does_not_cancel_the_rest_of_the_batch(write_queue):
+    queue, path = write_queue
+    first = queue.submit(INSERT, ("a",))
+    duplicate = queue.submit(INSERT, ("a",))
+    last = queue.submit(INSERT, ("b",))
+    queue.flush()
+
+    assert queue.batches == 1
+    assert first.result() == 1
+    with pytest.raises(sqlite3.IntegrityError):
+        duplicate.result()
+    assert last.result() == 2
+    assert read_names(path) == ["a", "b"]
+
+
+def test_ignored_insert_resolves_to_none(write_queue):
+    queue, path = write_queue
+    inserted = queue.submit("INSERT OR IGNORE INTO items (name) VALUES (?)", ("a",))
+    ignored = queue.submit("INSERT OR IGNORE INTO items (name) VALUES (?)", ("a",))
+    queue.flush()
+
+    assert inserted.result() == 1
+    assert ignored.result() is None
+    assert read_names(path) == ["a"]
+
+
+def test_stop_writes_pending_items(tmp_path):
+    path = str(tmp_path / "queue.db")
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT UNIQUE)")
+    queue = WriteQueue(lambda: sqlite3.connect(path, check_same_thread=False), flush_interval=10)
+    futures = [queue.submit(INSERT, (name,)) for name in "xyz"]
+    queue.stop()
+
+    assert [future.result(timeout=1) for future in futures] == [1, 2, 3]
+    assert read_names(path) == ["x", "y", "z"]
+
+
+def test_unknown_synchronous_mode_is_rejected():
+    with pytest.raises(ValueError):
+        WriteQueue(lambda: None, synchronous="SOMETIMES")
+
+
+def test_check_in_through_the_queue_counts_each_ticket_once(db):
+    db.enable_write_queue()
+
+    async def run():
+        return await asyncio.gather(*(async_database.check_in_ticket(ticket_id) for ticket_id in (1, 2, 1, 2)))
+
+    assert asyncio.run(run()) == [True, True, False, False]
+    assert db.check_in_ticket(1) is False
@@ -0,0 +1,193 @@
+"""
+Отправка билетов пользователям.
+
+После первой отправки Telegram выдаёт file_id фото, который сохраняется
+вместе с билетом: повторные показы билета («Мои билеты») идут по file_id
+без загрузки файла. Если Telegram отклонит file_id, билет загружается
+заново — с диска или после повторной отрисовки. Несколько билетов
+отправляются альбомами до 10 фото: один запрос на альбом вместо запроса
+на каждый билет. Лимит сообщений в чат при этом не растёт: очередь исходящих
+запросов считает альбом по числу фото, и при OUTBOUND_CHAT_RATE=1 следующий
+альбом в тот же чат уходит примерно через секунду на каждое фото предыдущего. Билет, изображение которого не удалось получить, пропускается,
+а остальные отправляются как обычно.
+"""
+import asyncio
+import logging
+import os
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import BufferedInputFile, InputMediaPhoto
+
+from async_database import get_event_by_id, set_ticket_file_id
+from ticket_renderer import render_ticket_image
+from ticket_tokens import make_ticket_token
+from rate_limiter import send_priority, PRIORITY_HIGH
+
+logger = logging.getLogger(__name__)
+
+BOT_USERNAME = "test_bigd_club_bot"
+
+# Наибольшее число фото в одном альбоме Telegram
+MEDIA_GROUP_SIZE = 10
+
+
+class TicketImageError(Exception):
+    """
+    Изображение билета не удалось получить: нет копии на диске, а отрисовать заново не вышло.
+    """
+
+
+def get_ticket_link(ticket_id: int, event_id: int) -> str:
+    """
+    Ссылка, которая кодируется в QR-код билета: подписанный токен с ID билета и мероприятия.
+    """
+    return f"https://t.me/{BOT_USERNAME}?start={make_ticket_token(ticket_id, event_id)}"
+
+
+def get_ticket_path(ticket_id: int, event_id: int) -> str:
+    """
+    Путь к копии билета на диске. Имя содержит ID билета: у гостя может быть несколько
+    билетов на одно мероприятие. Под шаблон очистки ticket_*_<ID мероприятия>.png подходит.
+    """
+    return f"qr_code/ticket_t{ticket_id}_{event_id}.png"
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+async def load_ticket_image(ticket) -> bytes:
+    """
+    Получает изображение билета: копию с диска или новую отрисовку из токена самого билета.
+    Прежние копии qr_code/ticket_<пользователь>_<мероприятие>.png общие для всех билетов
+    гостя на мероприятие, поэтому не используются.
+    :param ticket: Билет (id, event_id)
+    :return: PNG-байты билета
+    :raises TicketImageError: Нет копии на диске, а шаблон мероприятия удалён или повреждён
+    """
+    path = get_ticket_path(ticket["id"], ticket["event_id"])
+    try:
+        if os.path.exists(path):
+            return await asyncio.to_thread(_read_file, path)
+
+        event = await get_event_by_id(ticket["event_id"])
+        if not event or not event.get("qr_template"):
+            raise FileNotFoundError(f"Не найден шаблон билета для мероприятия {ticket['event_id']}")
+        return await render_ticket_image(get_ticket_link(ticket["id"], ticket["event_id"]), event["qr_template"])
+    except Exception as e:
+        raise TicketImageError(f"Не удалось получить изображение билета {ticket['id']}: {e}") from e
+
+
+async def send_ticket(bot: Bot, chat_id: int, ticket, caption: str, image: bytes = None):
+    """
+    Отправляет билет, по возможности без повторной загрузки изображения.
+    :param ticket: Билет (id, event_id, file_id)
+    :param image: Уже готовые PNG-байты билета (при первой отправке)
+    :return: Отправленное сообщение
+    """
+    # Билеты отправляются раньше обычных ответов и рассылок
+    with send_priority(PRIORITY_HIGH):
+        if image is None and ticket.get("file_id"):
+            try:
+                return await bot.send_photo(chat_id=chat_id, photo=ticket["file_id"], caption=caption)
+            except TelegramBadRequest as e:
+                logger.info("file_id билета %s отклонён, загружаем заново: %s", ticket["id"], e)
+
+        if image is None:
+            image = await load_ticket_image(ticket)
+
+        message = await bot.send_photo(
+            chat_id=chat_id,
+            photo=BufferedInputFile(image, filename=f"ticket_{ticket['id']}.png"),
+            caption=caption
+        )
+    file_id = message.photo[-1].file_id
+    await set_ticket_file_id(ticket["id"], file_id)
+    ticket["file_id"] = file_id
+    return message
+
+
+async def _ticket_photo(ticket, reupload: bool):
+    # Билеты без file_id (или все при reupload) загружаются в составе альбома и получают file_id из ответа
+    if ticket.get("file_id") and not reupload:
+        return ticket["file_id"]
+    try:
+        return BufferedInputFile(await load_ticket_image(ticket), filename=f"ticket_{ticket['id']}.png")
+    except TicketImageError:
+        # Заново загрузить не удалось, но прежний file_id может оказаться рабочим
+        if ticket.get("file_id"):
+            return ticket["file_id"]
+        raise
+
+
+async def _album_media(tickets: list, caption, reupload: bool, failed: list) -> tuple:
+    # Фото альбома; билеты без изображения исключаются из альбома и попадают в failed
+    included, media = [], []
+    for ticket in tickets:
+        try:
+            photo = await _ticket_photo(ticket, reupload)
+        except TicketImageError as e:
+            logger.warning("Билет %s не отправлен: %s", ticket["id"], e)
+            failed.append(ticket)
+            continue
+        included.append(ticket)
+        media.append(InputMediaPhoto(media=photo, caption=caption(ticket)))
+    return included, media
+
+
+async def _send_album(bot: Bot, chat_id: int, tickets: list, media: list) -> list:
+    messages = await bot.send_media_group(chat_id=chat_id, media=media)
+    for ticket, message in zip(tickets, messages):
+        file_id = message.photo[-1].file_id
+        if file_id != ticket.get("file_id"):
+            await set_ticket_file_id(ticket["id"], file_id)
+            ticket["file_id"] = file_id
+    return messages
+
+
+async def send_tickets(bot: Bot, chat_id: int, tickets: list, caption) -> tuple:
+    """
+    Отправляет билеты альбомами до MEDIA_GROUP_SIZE фото. Билет, изображение которого
+    не удалось получить, пропускается и не мешает отправке остальных.
+    :param tickets: Билеты (id, event_id, file_id)
+    :param caption: Функция, возвращающая подпись для билета
+    :return: (число запросов к Telegram на отправку, включая отклонённые; список пропущенных билетов)
+    """
+    requests = 0
+    failed = []
+    with send_priority(PRIORITY_HIGH):
+        for start in range(0, len(tickets), MEDIA_GROUP_SIZE):
+            batch = tickets[start:start + MEDIA_GROUP_SIZE]
+            if len(batch) > 1:
+                # Один устаревший file_id отклоняет весь альбом: сначала альбом повторяется
+                # с заново загруженными изображениями, и только потом билеты идут по одному
+                sent = False
+                for reupload in (False, True):
+                    if reupload and not any(ticket.get("file_id") for ticket in batch):
+                        break
+                    batch, media = await _album_media(batch, caption, reupload, failed)
+                    if len(batch) < 2:
+                        break
+                    requests += 1
+                    try:
+                        await _send_album(bot, chat_id, batch, media)
+                        sent = True
+                        break
+                    except TelegramBadRequest as e:
+                        logger.info("Альбом билетов отклонён (повторная загрузка: %s): %s", reupload, e)
+                if sent:
+                    continue
+
+            # Альбом не может состоять из одного фото
+            for ticket in batch:
+                try:
+                    await send_ticket(bot, chat_id, ticket, caption=caption(ticket))
+                    requests += 1
+                except TicketImageError as e:
+                    logger.warning("Билет %s не отправлен: %s", ticket["id"], e)
+                    failed.append(ticket)
+                    # Отклонённая отправка по file_id тоже была запросом
+                    requests += bool(ticket.get("file_id"))
+    return requests, failed
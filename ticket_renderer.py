@@ -0,0 +1,287 @@
+"""
+Отрисовка билетов в отдельных процессах.
+
+Кодирование QR-кода и работа с изображением занимают процессор, поэтому
+выполняются в пуле процессов, а хендлеры только дожидаются результата,
+не блокируя цикл событий для остальных пользователей. Билет целиком
+собирается в памяти и возвращается как PNG-байты.
+
+Декодированные шаблоны кэшируются в процессах пула вместе с геометрией
+выреза, поэтому на каждый билет остаются только кодирование QR-кода,
+одна вставка и сжатие PNG.
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+logger = logging.getLogger(__name__)
+
+# Цвета QR-кода на билете
+QR_DARK = "#FFFFFF"  # Белый цвет для QR-кода
+QR_LIGHT = "#0007BA"  # Фон QR-кода
+
+QR_SCALE = 5  # Размер модуля QR-кода в пикселях до масштабирования под вырез
+
+# Координаты выреза под QR-код в шаблоне по умолчанию. Для другого шаблона
+# их можно задать в файле метаданных рядом с ним: template_3.png -> template_3.json
+# с содержимым {"cutout_box": [259, 559, 479, 779]}
+CUTOUT_BOX = (259, 559, 479, 779)
+
+# Кэш шаблонов в процессе пула: {путь: (версия, RGBA-изображение, вырез)}
+_templates = {}
+
+# Версии шаблонов в основном процессе; увеличиваются при замене файла шаблона
+_template_versions = {}
+
+
+def _init_worker():
+    # Библиотеки загружаются один раз при старте процесса, а не на каждый билет
+    import segno  # noqa: F401
+    from PIL import Image  # noqa: F401
+
+
+def load_template_metadata(template_path: str) -> dict:
+    """
+    Читает метаданные шаблона из JSON-файла рядом с ним.
+    :param template_path: Путь к шаблону билета
+    :return: Словарь с ключом cutout_box
+    """
+    metadata_path = os.path.splitext(template_path)[0] + ".json"
+    metadata = {}
+    if os.path.exists(metadata_path):
+        with open(metadata_path, encoding="utf-8") as f:
+            metadata = json.load(f)
+    return {"cutout_box": tuple(metadata.get("cutout_box", CUTOUT_BOX))}
+
+
+def _get_template(template_path: str, version: int) -> tuple:
+    cached = _templates.get(template_path)
+    if cached is not None and cached[0] == version:
+        return cached[1], cached[2]
+
+    from PIL import Image
+
+    with Image.open(template_path) as image:
+        base = image.convert("RGBA")
+    cutout_box = load_template_metadata(template_path)["cutout_box"]
+    _templates[template_path] = (version, base, cutout_box)
+    return base, cutout_box
+
+
+def render_ticket(data: str, template_path: str, template_version: int = 0,
+                  compress_level: int = 6) -> tuple:
+    """
+    Рисует билет: QR-код с данными вставляется в вырез шаблона.
+    Выполняется в процессе пула, все промежуточные изображения остаются в памяти.
+    :param data: Содержимое QR-кода
+    :param template_path: Путь к шаблону билета
+    :param template_version: Версия шаблона; при её смене шаблон перечитывается с диска
+    :param compress_level: Уровень сжатия PNG (0–9)
+    :return: (PNG-байты билета, время отрисовки в секундах)
+    """
+    started = time.perf_counter()
+    base, cutout_box = _get_template(template_path, template_version)
+    qr_matrix = encode_qr(data)
+    ticket = compose_ticket(base, cutout_box, rasterize_qr(qr_matrix))
+    return encode_png(ticket, compress_level), time.perf_counter() - started
+
+
+# Этапы отрисовки вынесены в отдельные функции, чтобы бенчмарк мог замерить каждый из них
+
+def encode_qr(data: str):
+    """
+    Кодирует данные в QR-код (segno).
+    """
+    import segno
+
+    return segno.make_qr(data, error='L')
+
+
+def rasterize_qr(qrcode):
+    """
+    Превращает матрицу QR-кода в RGB-изображение с палитрой из двух цветов,
+    без промежуточного кодирования в PNG.
+    """
+    from PIL import Image
+
+    width, height = qrcode.symbol_size(scale=1, border=0)
+    modules = bytes(bit for row in qrcode.matrix for bit in row)
+    qr_image = Image.frombytes("P", (width, height), modules)
+    qr_image.putpalette(_palette())
+    return qr_image.convert("RGB").resize((width * QR_SCALE, height * QR_SCALE), Image.NEAREST)
+
+
+def compose_ticket(base, cutout_box: tuple, qr_image):
+    """
+    Вставляет QR-код в вырез копии шаблона.
+    """
+    target_size = (cutout_box[2] - cutout_box[0], cutout_box[3] - cutout_box[1])
+    # Оба цвета QR-кода непрозрачны, поэтому вставка идёт без маски
+    ticket = base.copy()
+    ticket.paste(qr_image.resize(target_size), cutout_box[:2])
+    return ticket
+
+
+def encode_png(image, compress_level: int = 6) -> bytes:
+    output = BytesIO()
+    image.save(output, format="PNG", compress_level=compress_level)
+    return output.getvalue()
+
+
+def _palette() -> list:
+    light = [int(QR_LIGHT[i:i + 2], 16) for i in (1, 3, 5)]
+    dark = [int(QR_DARK[i:i + 2], 16) for i in (1, 3, 5)]
+    return light + dark
+
+
+def invalidate_template(template_path: str):
+    """
+    Сбрасывает кэш шаблона после замены файла: следующая отрисовка перечитает его с диска.
+    """
+    _template_versions[template_path] = _template_versions.get(template_path, 0) + 1
+
+
+class RenderPool:
+    """
+    Пул процессов для отрисовки билетов с ограниченной очередью.
+    Не более workers + max_queue отрисовок передаются в пул одновременно,
+    остальные ждут своей очереди в цикле событий.
+    """
+
+    def __init__(self, workers: int, max_queue: int):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.rendered = 0
+        self.failed = 0
+        self.waiting = 0
+        self.pending = 0
+        self.total_render_time = 0.0
+        self.total_wait_time = 0.0
+
+        self._executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+        self._slots = asyncio.Semaphore(workers + max_queue)
+
+    def warm_up(self):
+        """
+        Запускает процессы пула заранее, до появления потоков в основном процессе.
+        """
+        self._executor.submit(time.perf_counter).result()
+
+    async def submit(self, func, *args):
+        """
+        Выполняет функцию отрисовки в пуле.
+        :param func: Функция, возвращающая (результат, время отрисовки в секундах)
+        :return: Результат функции
+        """
+        started = time.perf_counter()
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            result, render_time = await loop.run_in_executor(self._executor, func, *args)
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.pending -= 1
+            self._slots.release()
+
+        elapsed = time.perf_counter() - started
+        self.rendered += 1
+        self.total_render_time += render_time
+        self.total_wait_time += elapsed - render_time
+        logger.info(
+            "Билет отрисован за %.0f мс (ожидание %.0f мс), в пуле %s, в очереди %s",
+            render_time * 1000, (elapsed - render_time) * 1000, self.pending, self.waiting
+        )
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "pending": self.pending,
+            "waiting": self.waiting,
+            "rendered": self.rendered,
+            "failed": self.failed,
+            "avg_render_ms": self.total_render_time / self.rendered * 1000 if self.rendered else 0.0,
+            "avg_wait_ms": self.total_wait_time / self.rendered * 1000 if self.rendered else 0.0
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+_pool = None
+
+
+def start_render_pool(workers: int = None, max_queue: int = 32) -> RenderPool:
+    """
+    Создаёт пул отрисовки билетов.
+    :param workers: Число процессов (по умолчанию — число ядер)
+    :param max_queue: Сколько отрисовок может ждать свободный процесс внутри пула
+    """
+    global _pool
+    if _pool is not None:
+        _pool.shutdown()
+    _pool = RenderPool(workers or os.cpu_count() or 1, max_queue)
+    return _pool
+
+
+def get_render_pool() -> RenderPool:
+    if _pool is None:
+        start_render_pool()
+    return _pool
+
+
+def shutdown_render_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown()
+        _pool = None
+
+
+async def render_ticket_image(data: str, template_path: str) -> bytes:
+    """
+    Рисует билет в пуле процессов.
+    :return: PNG-байты билета
+    """
+    version = _template_versions.get(template_path, 0)
+    return await get_render_pool().submit(render_ticket, data, template_path, version)
+
+
+def _write_file(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    # Запись через временный файл, чтобы читатель не увидел недописанный билет
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+# Ссылки на фоновые задачи сохранения, чтобы их не собрал сборщик мусора
+_background_tasks = set()
+
+
+def save_ticket_in_background(path: str, data: bytes):
+    """
+    Сохраняет билет на диск в фоне, не задерживая отправку пользователю.
+    """
+    task = asyncio.create_task(asyncio.to_thread(_write_file, path, data))
+    _background_tasks.add(task)
+    task.add_done_callback(_on_saved)
+
+
+def _on_saved(task: asyncio.Task):
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Не удалось сохранить билет на диск: %s", task.exception())
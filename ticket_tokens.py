@@ -0,0 +1,155 @@
+"""
+Подписанные токены билетов для QR-кода.
+
+В ссылку билета вместо последовательного ID кладётся короткий токен:
+ID билета и ID мероприятия в формате varint и усечённая HMAC-SHA256
+подпись, всё в base64url без выравнивания. Поддельный токен или билет на
+другое мероприятие отсекаются без обращения к базе, а база нужна только
+для проверки, использован ли билет.
+
+Для билетов до 16 тысяч токен занимает 12 символов — не длиннее прежнего
+ticket_<id>, поэтому версия QR-кода не растёт.
+"""
+import base64
+import binascii
+import functools
+import hashlib
+import hmac
+import logging
+import re
+from urllib.parse import urlsplit, parse_qs
+
+import database
+from config import TICKET_SECRET, TICKET_ACCEPT_LEGACY_LINKS
+
+logger = logging.getLogger(__name__)
+
+# Длина подписи в байтах: 48 бит достаточно, так как подбор возможен только через сообщения боту
+SIGNATURE_SIZE = 6
+
+# Параметр /start в Telegram может содержать только эти символы
+_TOKEN_RE = re.compile(r"^[A-Za-z0-9_-]{8,32}$")
+_LEGACY_PREFIX = "ticket_"
+
+
+def _secret() -> bytes:
+    if not TICKET_SECRET:
+        raise RuntimeError("Не задан TICKET_SECRET для подписи билетов")
+    return TICKET_SECRET.encode()
+
+
+def _pack_varint(value: int) -> bytes:
+    if value < 0:
+        raise ValueError("ID не может быть отрицательным")
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _unpack_varint(data: bytes, pos: int) -> tuple:
+    value = 0
+    shift = 0
+    while pos < len(data):
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+    raise ValueError("Оборванное число в токене")
+
+
+def _sign(payload: bytes) -> bytes:
+    return hmac.new(_secret(), payload, hashlib.sha256).digest()[:SIGNATURE_SIZE]
+
+
+def make_ticket_token(ticket_id: int, event_id: int) -> str:
+    """
+    Создаёт подписанный токен билета.
+    :param ticket_id: ID билета
+    :param event_id: ID мероприятия
+    :return: Токен для параметра /start
+    """
+    payload = _pack_varint(ticket_id) + _pack_varint(event_id)
+    return base64.urlsafe_b64encode(payload + _sign(payload)).rstrip(b"=").decode()
+
+
+def verify_ticket_token(token: str, expected_event_id: int = None) -> tuple:
+    """
+    Проверяет подпись токена без обращения к базе.
+    :param token: Токен из QR-кода
+    :param expected_event_id: Если задан, билет на другое мероприятие считается недействительным
+    :return: (ID билета, ID мероприятия) или None, если токен поддельный или не подходит
+    """
+    if not _TOKEN_RE.match(token):
+        return None
+    try:
+        data = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+    except (binascii.Error, ValueError):
+        return None
+
+    payload, signature = data[:-SIGNATURE_SIZE], data[-SIGNATURE_SIZE:]
+    if len(payload) < 2 or not hmac.compare_digest(signature, _sign(payload)):
+        return None
+
+    try:
+        ticket_id, pos = _unpack_varint(payload, 0)
+        event_id, pos = _unpack_varint(payload, pos)
+    except ValueError:
+        return None
+    if pos != len(payload):
+        return None
+
+    if expected_event_id is not None and event_id != expected_event_id:
+        return None
+    return ticket_id, event_id
+
+
+def is_ticket_payload(payload: str) -> bool:
+    """
+    Является ли параметр /start билетом: токен с верной подписью или ссылка старого формата.
+    Другие параметры deep link не принимаются за билеты.
+    """
+    return payload.startswith(_LEGACY_PREFIX) or verify_ticket_token(payload) is not None
+
+
+@functools.lru_cache(maxsize=1)
+def _legacy_max_id() -> int:
+    # Граница записывается миграцией один раз и дальше не меняется
+    return database.get_legacy_ticket_max_id()
+
+
+def payload_from_link(code: str) -> str:
+    """
+    Достаёт параметр start из отсканированной ссылки билета; остальное возвращает как есть.
+    """
+    code = code.strip()
+    if "start=" in code:
+        return parse_qs(urlsplit(code).query).get("start", [""])[0]
+    return code
+
+
+def parse_ticket_payload(payload: str, expected_event_id: int = None) -> tuple:
+    """
+    Разбирает параметр /start из QR-кода билета.
+    Ссылки старого формата ticket_<id> принимаются, пока включён TICKET_ACCEPT_LEGACY_LINKS,
+    и только для билетов, выданных до перехода на токены; мероприятие у них известно
+    только из базы, поэтому вместо него возвращается None.
+    :return: (ID билета, ID мероприятия или None) или None, если билет недействителен
+    """
+    if payload.startswith(_LEGACY_PREFIX):
+        ticket_id = payload[len(_LEGACY_PREFIX):]
+        if TICKET_ACCEPT_LEGACY_LINKS and ticket_id.isdigit() and 0 < int(ticket_id) <= _legacy_max_id():
+            return int(ticket_id), None
+        return None
+
+    ticket = verify_ticket_token(payload, expected_event_id)
+    if ticket is None:
+        logger.info("Отклонён недействительный токен билета: %s", payload)
+    return ticket
@@ -0,0 +1,137 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+# Допустимые режимы PRAGMA synchronous для соединения очереди
+SYNCHRONOUS_MODES = ("OFF", "NORMAL", "FULL", "EXTRA")
+
+_STOP = object()
+
+
+class WriteQueue:
+    """
+    Очередь отложенной записи: вставки из разных потоков собираются в пачки
+    и фиксируются одной транзакцией (групповой коммит), когда накопилось
+    max_batch записей или прошло flush_interval секунд с первой из них.
+    """
+
+    def __init__(self, connect, flush_interval: float = 0.01, max_batch: int = 200,
+                 synchronous: str = "NORMAL"):
+        """
+        :param connect: Функция, возвращающая соединение потока записи
+        :param flush_interval: Максимальное ожидание пачки в секундах
+        :param max_batch: Максимальное число записей в одной транзакции
+        :param synchronous: Режим fsync при коммите: FULL — каждая пачка переживает
+            отключение питания, NORMAL — только падение процесса, OFF — без гарантий
+        """
+        synchronous = synchronous.upper()
+        if synchronous not in SYNCHRONOUS_MODES:
+            raise ValueError(f"Неизвестный режим synchronous: {synchronous}")
+
+        self.connect = connect
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.synchronous = synchronous
+        self.batches = 0
+        self.writes = 0
+
+        self._queue = queue.Queue()
+        self._conn = None
+        self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, query: str, params: tuple = ()) -> Future:
+        """
+        Ставит запрос в очередь.
+        :return: Future с ID вставленной строки (None, если строка не вставлена, например из-за OR IGNORE)
+        """
+        future = Future()
+        self._queue.put((query, params, future))
+        return future
+
+    def flush(self):
+        """
+        Дожидается записи всего, что было поставлено в очередь до вызова.
+        """
+        self.submit(None).result()
+
+    def stop(self):
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def _get_connection(self):
+        conn = self.connect()
+        if conn is not self._conn:
+            conn.execute(f"PRAGMA synchronous = {self.synchronous}")
+            self._conn = conn
+        return conn
+
+    def _collect(self, first) -> list:
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            batch.append(item)
+            if item is _STOP:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect(self._queue.get())
+            stop = batch[-1] is _STOP
+            if stop:
+                batch.pop()
+            if batch:
+                self._write(batch)
+            if stop:
+                return
+
+    def _write(self, batch: list):
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        results = []
+        try:
+            cursor.execute("BEGIN")
+            for query, params, future in batch:
+                if query is None:
+                    # Метка flush(): завершается вместе с пачкой
+                    results.append((future, None, None))
+                    continue
+                # Ошибка в одной записи не должна отменять остальные записи пачки
+                cursor.execute("SAVEPOINT write_item")
+                try:
+                    cursor.execute(query, params)
+                except Exception as e:
+                    cursor.execute("ROLLBACK TO write_item")
+                    results.append((future, None, e))
+                else:
+                    results.append((future, cursor.lastrowid if cursor.rowcount > 0 else None, None))
+                cursor.execute("RELEASE write_item")
+            conn.commit()
+        except Exception as e:
+            logger.exception("Не удалось зафиксировать пачку записей")
+            conn.rollback()
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+        finally:
+            cursor.close()
+
+        self.batches += 1
+        self.writes += len(batch)
+        for future, result, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)